@@ -0,0 +1,3 @@
+-- PDF page each chunk starts on, so answers can cite page numbers.
+-- Filled at ingest (parsing.chunk_pages); NULL for non-PDF artifacts and chunks ingested before this.
+ALTER TABLE artifact_chunks ADD COLUMN IF NOT EXISTS page integer;
@@ -0,0 +1,15 @@
+-- CSV exports (server/csv_stream.py) page through project rows by keyset:
+--   WHERE org_id = ? AND project_id = ? AND (created_at, id) > (?, ?)
+--   ORDER BY created_at ASC NULLS FIRST, id ASC LIMIT n
+-- so each page is an index range scan instead of a sort of the whole project.
+CREATE INDEX IF NOT EXISTS actions_export_keyset
+  ON actions (org_id, project_id, created_at ASC NULLS FIRST, id);
+
+CREATE INDEX IF NOT EXISTS risks_export_keyset
+  ON risks (org_id, project_id, created_at ASC NULLS FIRST, id);
+
+CREATE INDEX IF NOT EXISTS decisions_export_keyset
+  ON decisions (org_id, project_id, created_at ASC NULLS FIRST, id);
+
+CREATE INDEX IF NOT EXISTS artifacts_export_keyset
+  ON artifacts (org_id, project_id, created_at ASC NULLS FIRST, id);
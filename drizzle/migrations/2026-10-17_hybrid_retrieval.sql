@@ -0,0 +1,71 @@
+-- Hybrid retrieval: ANN index on artifact_chunks.embedding + full-text index on content.
+-- pgvector can't index vector(3072) directly (2000-dim limit), so the HNSW index is an
+-- expression index on halfvec(3072) (pgvector >= 0.7). Queries must use the same cast.
+CREATE EXTENSION IF NOT EXISTS vector;
+
+DROP INDEX IF EXISTS idx_artifact_chunks_embedding;
+
+CREATE INDEX IF NOT EXISTS artifact_chunks_embedding_hnsw
+  ON artifact_chunks USING hnsw ((embedding::halfvec(3072)) halfvec_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
+
+CREATE INDEX IF NOT EXISTS artifact_chunks_content_fts
+  ON artifact_chunks USING gin (to_tsvector('english', content));
+
+CREATE INDEX IF NOT EXISTS artifact_chunks_org_project
+  ON artifact_chunks (org_id, project_id);
+
+-- Vector + full-text candidates fused with reciprocal-rank fusion: score = sum(1 / (rrf_k + rank)).
+-- q may be NULL for text-only search; q_text may be empty for vector-only search.
+CREATE OR REPLACE FUNCTION hybrid_search_chunks(
+  p_org uuid,
+  p_project uuid,
+  q vector(3072),
+  q_text text,
+  k integer DEFAULT 8,
+  candidates integer DEFAULT 50,
+  rrf_k integer DEFAULT 60
+)
+RETURNS TABLE (
+  id uuid,
+  content text,
+  title text,
+  artifact_id uuid,
+  chunk_index integer,
+  score double precision,
+  vector_rank bigint,
+  text_rank bigint
+)
+LANGUAGE sql STABLE
+SECURITY DEFINER
+AS $$
+  WITH vec AS (
+    SELECT ac.id, row_number() OVER (ORDER BY ac.embedding::halfvec(3072) <=> q::halfvec(3072)) AS rnk
+    FROM artifact_chunks ac
+    WHERE q IS NOT NULL AND ac.org_id = p_org AND ac.project_id = p_project
+    ORDER BY ac.embedding::halfvec(3072) <=> q::halfvec(3072)
+    LIMIT candidates
+  ),
+  fts AS (
+    SELECT ac.id, row_number() OVER (ORDER BY ts_rank_cd(to_tsvector('english', ac.content), tq) DESC) AS rnk
+    FROM artifact_chunks ac, websearch_to_tsquery('english', coalesce(q_text, '')) tq
+    WHERE ac.org_id = p_org AND ac.project_id = p_project
+      AND to_tsvector('english', ac.content) @@ tq
+    ORDER BY ts_rank_cd(to_tsvector('english', ac.content), tq) DESC
+    LIMIT candidates
+  ),
+  fused AS (
+    SELECT coalesce(vec.id, fts.id) AS id,
+           coalesce(1.0 / (rrf_k + vec.rnk), 0) + coalesce(1.0 / (rrf_k + fts.rnk), 0) AS score,
+           vec.rnk AS vector_rank,
+           fts.rnk AS text_rank
+    FROM vec FULL OUTER JOIN fts ON fts.id = vec.id
+  )
+  SELECT ac.id, ac.content, a.title, ac.artifact_id, ac.chunk_index,
+         f.score::double precision, f.vector_rank, f.text_rank
+  FROM fused f
+  JOIN artifact_chunks ac ON ac.id = f.id
+  JOIN artifacts a ON a.id = ac.artifact_id
+  ORDER BY f.score DESC
+  LIMIT k;
+$$;
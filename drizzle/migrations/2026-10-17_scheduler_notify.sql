@@ -0,0 +1,21 @@
+-- Wake the background scheduler (server/sched_core.py) when queue rows land instead of
+-- waiting for the next poll. The channel is named after the table and the payload is
+-- empty (the worker re-reads the queue), so Postgres folds a transaction's notifications
+-- into one. reindex_queue also notifies when a job is set back to pending (retry), but
+-- not on the worker's own running/done updates.
+CREATE OR REPLACE FUNCTION notify_queue_channel() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_notify(TG_TABLE_NAME, '');
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS reindex_queue_notify ON reindex_queue;
+CREATE TRIGGER reindex_queue_notify
+  AFTER INSERT OR UPDATE OF status, scheduled_at ON reindex_queue
+  FOR EACH ROW WHEN (NEW.status = 'pending') EXECUTE FUNCTION notify_queue_channel();
+
+DROP TRIGGER IF EXISTS comms_queue_notify ON comms_queue;
+CREATE TRIGGER comms_queue_notify
+  AFTER INSERT ON comms_queue
+  FOR EACH ROW EXECUTE FUNCTION notify_queue_channel();
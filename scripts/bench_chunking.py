@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Throughput/memory benchmark for server/chunking.py.
+
+Compares the previous in-memory chunk_text (copied below as legacy_chunk_text)
+with the streaming iter_chunks on a synthetic meeting transcript, checks that
+both produce identical (text, index) tuples, and reports wall time and peak
+traced memory for each.
+
+Usage:
+  python scripts/bench_chunking.py --mb 50
+  python scripts/bench_chunking.py --mb 5 --fuzz 500     # also diff random small inputs
+"""
+import io
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from server.chunking import chunk_text, iter_chunks, get_overlap_text
+
+def legacy_chunk_text(text, chunk_size=1000, overlap=200):
+    """chunk_text as it was before the streaming rewrite"""
+    if not text.strip():
+        return []
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'[^\x20-\x7E\n\r\t]', '', text).strip()
+    sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if s.strip()]
+    chunks = []
+    current_chunk = ""
+    current_size = 0
+    chunk_index = 0
+    for sentence in sentences:
+        if current_size + len(sentence) > chunk_size and current_chunk:
+            chunks.append((current_chunk.strip(), chunk_index))
+            chunk_index += 1
+            current_chunk = get_overlap_text(current_chunk, overlap) + " " + sentence
+        else:
+            current_chunk = current_chunk + " " + sentence if current_chunk else sentence
+        current_size = len(current_chunk)
+    if current_chunk.strip():
+        chunks.append((current_chunk.strip(), chunk_index))
+    return chunks
+
+SPEAKERS = ["Alex", "Priya", "Jordan", "Sam", "Chen"]
+ENDS = ['.', '?', '!', '', '...']
+GAPS = [' ', '\n', '\n\n', '  \t']
+WORDS = ("payroll retro rules integration cutover tenant build config data conversion "
+         "security roles testing defect owner decision action risk timeline sign-off").split()
+
+def transcript(rng, target_bytes):
+    parts, size = [], 0
+    while size < target_bytes:
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 30)))
+        line = f"{rng.choice(SPEAKERS)}: {words}{rng.choice(ENDS)}{rng.choice(GAPS)}"
+        parts.append(line)
+        size += len(line)
+    return "".join(parts)
+
+def noisy(rng, n):
+    alphabet = "ab .!?\n\t\r é’\x0c"
+    return "".join(rng.choice(alphabet) for _ in range(n))
+
+def measure(fn):
+    # Timed without tracemalloc (it slows allocation-heavy code several-fold), then traced once for peak memory
+    s = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - s
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=float, default=20)
+    ap.add_argument("--chunk-size", type=int, default=1200)
+    ap.add_argument("--overlap", type=int, default=200)
+    ap.add_argument("--fuzz", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    rng = random.Random(args.seed)
+
+    for i in range(args.fuzz):
+        sample = noisy(rng, rng.randint(0, 400))
+        read_size = rng.randint(1, 16)
+        want = legacy_chunk_text(sample, 60, 20)
+        got = list(iter_chunks(io.StringIO(sample), 60, 20, read_size=read_size))
+        if want != got or chunk_text(sample, 60, 20) != want:
+            print(f"MISMATCH on fuzz case {i} (read_size={read_size}): {sample!r}")
+            sys.exit(1)
+    print(f"fuzz: {args.fuzz} random inputs identical")
+
+    text = transcript(rng, int(args.mb * 1024 * 1024))
+    print(f"corpus: {len(text) / 1024 / 1024:.1f} MB")
+
+    legacy, t_legacy, m_legacy = measure(lambda: legacy_chunk_text(text, args.chunk_size, args.overlap))
+
+    # Streaming path reads the transcript from a file and consumes chunks one at a time, as ingestion would
+    path = os.path.join(tempfile.gettempdir(), "bench_chunking.txt")
+    with open(path, "w") as f:
+        f.write(text)
+    def stream():
+        n = 0
+        with open(path) as f:
+            for chunk in iter_chunks(f, args.chunk_size, args.overlap):
+                n += 1
+        return n
+    n_stream, t_stream, m_stream = measure(stream)
+    same = list(iter_chunks(text, args.chunk_size, args.overlap)) == legacy
+
+    print(f"{'impl':<10} {'chunks':>8} {'seconds':>9} {'MB/s':>8} {'peak MB':>9}")
+    for name, n, t, m in [("legacy", len(legacy), t_legacy, m_legacy), ("streaming", n_stream, t_stream, m_stream)]:
+        print(f"{name:<10} {n:>8} {t:>9.2f} {args.mb / t:>8.1f} {m / 1024 / 1024:>9.1f}")
+    os.remove(path)
+    print(f"identical output: {same}")
+    if not same:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
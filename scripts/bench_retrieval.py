@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Recall/latency benchmark for server/retrieval.py on a synthetic corpus.
+
+Builds a throwaway schema (bench_retrieval) with artifacts/artifact_chunks
+shaped like production plus the same HNSW + GIN indexes, then compares:
+  - exact vector search (sequential scan)          -> ground truth
+  - ANN vector-only via hybrid_search(q_text="")   -> recall@k vs exact
+  - full-text only via hybrid_search(q_emb=None)
+  - hybrid RRF via hybrid_search(q_text, q_emb)
+Topic precision@k (chunk topic == query topic) is reported for each mode.
+
+Usage:
+  DATABASE_URL=postgres://... python scripts/bench_retrieval.py --chunks 2000 --queries 50
+The schema is dropped at the end unless --keep is given.
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import argparse
+import statistics
+
+SCHEMA = "bench_retrieval"
+DIMS = 3072
+
+# Every connection opened by server.db (and this script) resolves tables in the bench schema
+os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA},public"
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+import psycopg2.extras
+from server.db import get_conn
+from server.retrieval import hybrid_search
+
+FILLER = ("the project team will review status update meeting notes with follow up on open items "
+          "and confirm next steps for the implementation plan including schedule scope owners").split()
+
+def _unit(v):
+    return v / np.linalg.norm(v)
+
+def _lit(v):
+    return "[" + ",".join(f"{x:.6f}" for x in v) + "]"
+
+def build_corpus(rng, n_chunks, n_topics):
+    centroids = [_unit(rng.standard_normal(DIMS)) for _ in range(n_topics)]
+    keywords = [[f"kw{t}x{j}" for j in range(8)] for t in range(n_topics)]
+    chunks = []
+    for i in range(n_chunks):
+        t = int(rng.integers(n_topics))
+        emb = _unit(centroids[t] + 0.9 * _unit(rng.standard_normal(DIMS)))
+        words = list(rng.choice(FILLER, 60)) + list(rng.choice(keywords[t], 3))
+        rng.shuffle(words)
+        chunks.append((t, i, " ".join(words), emb))
+    return centroids, keywords, chunks
+
+def setup(org, project, chunks, n_artifacts=50):
+    artifact_ids = [str(uuid.uuid4()) for _ in range(n_artifacts)]
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute("""
+            CREATE TABLE artifacts (id uuid PRIMARY KEY, title text);
+            CREATE TABLE artifact_chunks (
+              id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+              org_id uuid NOT NULL, project_id uuid NOT NULL, artifact_id uuid NOT NULL,
+              chunk_index integer NOT NULL, content text NOT NULL,
+              embedding vector(3072), topic integer NOT NULL
+            );
+        """)
+        psycopg2.extras.execute_values(cur, "INSERT INTO artifacts (id, title) VALUES %s",
+                                       [(a, f"Synthetic doc {i}") for i, a in enumerate(artifact_ids)])
+        rows = [(org, project, artifact_ids[i % n_artifacts], i, text, _lit(emb), t)
+                for t, i, text, emb in chunks]
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO artifact_chunks (org_id, project_id, artifact_id, chunk_index, content, embedding, topic)
+            VALUES %s""", rows, template="(%s, %s, %s, %s, %s, %s::vector, %s)", page_size=200)
+        t0 = time.perf_counter()
+        cur.execute("""CREATE INDEX ON artifact_chunks USING hnsw ((embedding::halfvec(3072)) halfvec_cosine_ops)
+                       WITH (m = 16, ef_construction = 64)""")
+        cur.execute("CREATE INDEX ON artifact_chunks USING gin (to_tsvector('english', content))")
+        cur.execute("CREATE INDEX ON artifact_chunks (org_id, project_id)")
+        cur.execute("ANALYZE artifact_chunks")
+        print(f"index build: {(time.perf_counter() - t0):.1f}s")
+
+def exact_top_k(org, project, q_emb, k):
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SET LOCAL enable_indexscan = off")
+        cur.execute("""SELECT id FROM artifact_chunks WHERE org_id = %s AND project_id = %s
+                       ORDER BY embedding <=> %s::vector LIMIT %s""", (org, project, _lit(q_emb), k))
+        return [str(r[0]) for r in cur.fetchall()]
+
+def topics_of(ids):
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id, topic FROM artifact_chunks WHERE id = ANY(%s::uuid[])", (ids,))
+        return dict((str(i), t) for i, t in cur.fetchall())
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=2000)
+    ap.add_argument("--topics", type=int, default=40)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("-k", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--keep", action="store_true")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    org, project = str(uuid.uuid4()), str(uuid.uuid4())
+    centroids, keywords, chunks = build_corpus(rng, args.chunks, args.topics)
+    setup(org, project, chunks)
+
+    modes = {"vector_ann": [], "text_only": [], "hybrid_rrf": []}
+    latency = {m: [] for m in modes}
+    latency["exact_scan"] = []
+    recall = []
+    try:
+        for _ in range(args.queries):
+            t = int(rng.integers(args.topics))
+            q_emb = _unit(centroids[t] + 0.9 * _unit(rng.standard_normal(DIMS))).tolist()
+            q_text = " ".join(rng.choice(keywords[t], 2))
+
+            s = time.perf_counter()
+            truth = exact_top_k(org, project, q_emb, args.k)
+            latency["exact_scan"].append((time.perf_counter() - s) * 1000)
+
+            runs = {
+                "vector_ann": lambda: hybrid_search(org, project, "", q_emb, args.k),
+                "text_only": lambda: hybrid_search(org, project, q_text, None, args.k),
+                "hybrid_rrf": lambda: hybrid_search(org, project, q_text, q_emb, args.k),
+            }
+            for mode, fn in runs.items():
+                s = time.perf_counter()
+                hits = [h["id"] for h in fn()]
+                latency[mode].append((time.perf_counter() - s) * 1000)
+                if mode == "vector_ann":
+                    recall.append(len(set(hits) & set(truth)) / max(1, len(truth)))
+                tmap = topics_of(hits)
+                modes[mode].append(sum(1 for h in hits if tmap.get(h) == t) / args.k)
+    finally:
+        if not args.keep:
+            with get_conn() as conn, conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+    print(f"\ncorpus: {args.chunks} chunks, {args.topics} topics, {args.queries} queries, k={args.k}")
+    print(f"ANN recall@{args.k} vs exact: {statistics.mean(recall):.3f}")
+    print(f"{'mode':<12} {'precision@k':>12} {'p50 ms':>9} {'p95 ms':>9}")
+    for mode in ["exact_scan", "vector_ann", "text_only", "hybrid_rrf"]:
+        prec = f"{statistics.mean(modes[mode]):.3f}" if mode in modes else "-"
+        print(f"{mode:<12} {prec:>12} {pct(latency[mode], 50):>9.1f} {pct(latency[mode], 95):>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Body, HTTPException
 from .supabase_client import get_supabase_client
 from .db import get_conn
+from .ask_cache import invalidate_project as invalidate_ask_cache
 import time
 import logging
 
@@ -40,6 +41,7 @@ def archive_project(
                     """, (project_id,))
                     
                     logging.info(f"Purged vector data for project {project_id}")
+                invalidate_ask_cache(org_id, project_id)
                     
             except Exception as e:
                 logging.warning(f"Failed to purge vectors for project {project_id}: {e}")
@@ -0,0 +1,122 @@
+# /server/ask_cache.py
+"""
+Tiered cache for /ask.
+
+Tier 1 keeps question embeddings in an in-process LRU; tier 2 keeps full
+answers keyed by (org, project, normalized question, k, index version).
+The index version is the project's newest chunk plus a per-process generation
+that invalidate_project() bumps, so new chunks (from any worker) and writes
+or deletes made by this process miss the old entries. A delete made by
+another process alone is picked up when the entry's TTL runs out. Both tiers
+expire by TTL.
+"""
+import os
+import re
+import time
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Hashable, Optional
+
+ASK_CACHE_ENABLED = os.getenv("ASK_CACHE_ENABLED", "1") == "1"
+ASK_QEMB_TTL_SEC = float(os.getenv("ASK_QEMB_TTL_SEC", "86400"))
+ASK_QEMB_MAX_ITEMS = int(os.getenv("ASK_QEMB_MAX_ITEMS", "5000"))
+ASK_ANSWER_TTL_SEC = float(os.getenv("ASK_ANSWER_TTL_SEC", "900"))
+ASK_ANSWER_MAX_ITEMS = int(os.getenv("ASK_ANSWER_MAX_ITEMS", "2000"))
+
+class TTLCache:
+    """Thread-safe LRU with a per-entry time-to-live"""
+
+    def __init__(self, max_items: int, ttl_sec: float):
+        self.max_items = max_items
+        self.ttl_sec = ttl_sec
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_sec, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def drop(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+_question_embeddings = TTLCache(ASK_QEMB_MAX_ITEMS, ASK_QEMB_TTL_SEC)
+_answers = TTLCache(ASK_ANSWER_MAX_ITEMS, ASK_ANSWER_TTL_SEC)
+_stats: Dict[tuple, Dict[str, int]] = defaultdict(lambda: {
+    "answer_hits": 0, "answer_misses": 0, "embedding_hits": 0, "embedding_misses": 0, "invalidations": 0})
+_stats_lock = threading.Lock()
+_generations: Dict[tuple, int] = defaultdict(int)
+
+def normalize_question(question: str) -> str:
+    q = " ".join(question.lower().split())
+    return re.sub(r"[\s?!.]+$", "", q)
+
+def _count(org_id: str, project_id: str, field: str):
+    with _stats_lock:
+        _stats[(org_id, project_id)][field] += 1
+
+def get_question_embedding(model: str, question: str, org_id: str, project_id: str):
+    if not ASK_CACHE_ENABLED:
+        return None
+    emb = _question_embeddings.get((model, normalize_question(question)))
+    _count(org_id, project_id, "embedding_hits" if emb is not None else "embedding_misses")
+    return emb
+
+def put_question_embedding(model: str, question: str, emb):
+    if ASK_CACHE_ENABLED:
+        _question_embeddings.set((model, normalize_question(question)), emb)
+
+def _answer_key(org_id, project_id, question, k, index_version):
+    return (org_id, project_id, normalize_question(question), k, index_version)
+
+def get_answer(org_id: str, project_id: str, question: str, k: int, index_version: str):
+    """Return a cached (answer, chunks) tuple or None"""
+    if not ASK_CACHE_ENABLED or index_version is None:
+        return None
+    hit = _answers.get(_answer_key(org_id, project_id, question, k, index_version))
+    _count(org_id, project_id, "answer_hits" if hit is not None else "answer_misses")
+    return hit
+
+def put_answer(org_id: str, project_id: str, question: str, k: int, index_version: str, answer: str, chunks):
+    if ASK_CACHE_ENABLED and index_version is not None:
+        _answers.set(_answer_key(org_id, project_id, question, k, index_version), (answer, chunks))
+
+def invalidate_project(org_id: str, project_id: str):
+    """Drop cached answers for a project (e.g. right after this worker wrote chunks)"""
+    _answers.drop(lambda key: key[0] == org_id and key[1] == project_id)
+    with _stats_lock:
+        _generations[(org_id, project_id)] += 1
+    _count(org_id, project_id, "invalidations")
+
+def generation(org_id: str, project_id: str) -> int:
+    """Times this process has invalidated the project; part of rag's index version"""
+    with _stats_lock:
+        return _generations.get((org_id, project_id), 0)
+
+def cache_stats(org_id: Optional[str] = None, project_id: Optional[str] = None) -> Dict[str, Any]:
+    with _stats_lock:
+        if org_id and project_id:
+            projects = {f"{org_id}/{project_id}": dict(_stats.get((org_id, project_id), {}))}
+        else:
+            projects = {f"{o}/{p}": dict(v) for (o, p), v in _stats.items()}
+    return {"enabled": ASK_CACHE_ENABLED, "answers_cached": len(_answers),
+            "question_embeddings_cached": len(_question_embeddings), "projects": projects}
@@ -0,0 +1,134 @@
+# /server/authz_cache.py
+"""
+Authorization lookup cache.
+
+Membership, role and visibility lookups (tenant.require_project_member and
+friends, guards.member_ctx / require_area_admin, visibility_guard) go
+through cached(). Results are memoized:
+  - per request (AuthzScopeMiddleware), so a guard and a handler asking the
+    same question share one query
+  - across requests in a small TTL cache keyed by (kind, org, project, user)
+
+Writers to project_members, project_member_access and area_admins call
+invalidate() so this worker sees the change immediately; other workers
+pick it up when AUTHZ_CACHE_TTL_SEC runs out (0 disables the TTL cache and
+keeps only the per-request memo). Failed lookups are never cached.
+"""
+import os
+import time
+import threading
+import contextvars
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+AUTHZ_CACHE_TTL_SEC = float(os.getenv("AUTHZ_CACHE_TTL_SEC", "30"))
+AUTHZ_CACHE_MAX_ITEMS = int(os.getenv("AUTHZ_CACHE_MAX_ITEMS", "10000"))
+
+Key = Tuple[str, str, str, str, str]  # kind, org, project, user, extra
+
+_request_memo: contextvars.ContextVar[Optional[Dict[Key, Any]]] = contextvars.ContextVar("authz_request_memo", default=None)
+
+class AuthzScopeMiddleware:
+    """Gives each HTTP request its own memo (ASGI middleware; also visible to sync deps in the threadpool)"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = _request_memo.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_memo.reset(token)
+
+class AuthzCache:
+    def __init__(self, ttl: float = AUTHZ_CACHE_TTL_SEC, max_items: int = AUTHZ_CACHE_MAX_ITEMS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._items: "OrderedDict[Key, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"request_hits": 0, "hits": 0, "misses": 0, "invalidated": 0, "expired": 0}
+        self._by_kind: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, stat: str):
+        self._stats[stat] += 1
+        k = self._by_kind.setdefault(kind, {"request_hits": 0, "hits": 0, "misses": 0})
+        k[stat] += 1
+
+    def cached(self, kind: str, org_id: str, project_id: str, user_id: str,
+               loader: Callable[[], Any], extra: str = "") -> Any:
+        """loader()'s result for this key, from the request memo, the TTL cache, or a fresh call"""
+        key = (kind, str(org_id), str(project_id), str(user_id), extra)
+        memo = _request_memo.get()
+        if memo is not None and key in memo:
+            with self._lock:
+                self._count(kind, "request_hits")
+            return memo[key]
+        if self.ttl > 0:
+            now = time.monotonic()
+            with self._lock:
+                hit = self._items.get(key)
+                if hit and hit[0] > now:
+                    self._items.move_to_end(key)
+                    self._count(kind, "hits")
+                    if memo is not None:
+                        memo[key] = hit[1]
+                    return hit[1]
+                if hit:
+                    del self._items[key]
+                    self._stats["expired"] += 1
+        with self._lock:
+            self._count(kind, "misses")
+        value = loader()  # exceptions propagate and nothing is cached
+        if memo is not None:
+            memo[key] = value
+        if self.ttl > 0:
+            with self._lock:
+                self._items[key] = (time.monotonic() + self.ttl, value)
+                self._items.move_to_end(key)
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+        return value
+
+    def invalidate(self, org_id: str, project_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Drop entries for an org, optionally narrowed to a project and user (also from this request's memo)"""
+        def match(key: Key) -> bool:
+            return key[1] == str(org_id) and (project_id is None or key[2] == str(project_id)) \
+                and (user_id is None or key[3] == str(user_id))
+        with self._lock:
+            stale = [k for k in self._items if match(k)]
+            for k in stale:
+                del self._items[k]
+            self._stats["invalidated"] += len(stale)
+        memo = _request_memo.get()
+        if memo:
+            for k in [k for k in memo if match(k)]:
+                del memo[k]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            by_kind = {k: dict(v) for k, v in self._by_kind.items()}
+            size = len(self._items)
+        lookups = s["request_hits"] + s["hits"] + s["misses"]
+        s["hit_rate"] = round((s["request_hits"] + s["hits"]) / lookups, 3) if lookups else None
+        for v in by_kind.values():
+            n = v["request_hits"] + v["hits"] + v["misses"]
+            v["hit_rate"] = round((v["request_hits"] + v["hits"]) / n, 3) if n else None
+        return {**s, "size": size, "ttl_sec": self.ttl, "by_kind": by_kind}
+
+_cache = AuthzCache()
+
+def get_authz_cache() -> AuthzCache:
+    return _cache
+
+def cached(kind: str, org_id: str, project_id: str, user_id: str, loader: Callable[[], Any], extra: str = "") -> Any:
+    return _cache.cached(kind, org_id, project_id, user_id, loader, extra)
+
+def invalidate(org_id: str, project_id: Optional[str] = None, user_id: Optional[str] = None):
+    _cache.invalidate(org_id, project_id, user_id)
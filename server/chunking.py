@@ -1,5 +1,19 @@
-from typing import List, Tuple
+from typing import Iterator, List, Optional, TextIO, Tuple, Union
 import re
+import zlib
+
+# Optional exact tokenizer; falls back to a ~4 chars/token estimate
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+def count_tokens(text: str) -> int:
+    """Count model tokens in text (tiktoken when available, estimate otherwise)"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
 
 def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Tuple[str, int]]:
     """
@@ -8,44 +22,124 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[Tu
     """
     if not text.strip():
         return []
-    
-    # Clean text
-    text = clean_text(text)
-    
-    # Split by sentences first for better chunk boundaries
-    sentences = split_into_sentences(text)
-    
-    chunks = []
-    current_chunk = ""
-    current_size = 0
-    chunk_index = 0
-    
-    for sentence in sentences:
-        sentence_size = len(sentence)
-        
-        # If adding this sentence would exceed chunk size
-        if current_size + sentence_size > chunk_size and current_chunk:
-            # Save current chunk
-            chunks.append((current_chunk.strip(), chunk_index))
-            chunk_index += 1
-            
-            # Start new chunk with overlap
-            overlap_text = get_overlap_text(current_chunk, overlap)
-            current_chunk = overlap_text + " " + sentence
-            current_size = len(current_chunk)
-        else:
-            # Add sentence to current chunk
-            if current_chunk:
-                current_chunk += " " + sentence
+    return list(iter_chunks(text, chunk_size, overlap))
+
+READ_SIZE = 1 << 16
+
+_WS = re.compile(r'\s+')
+_NON_PRINTABLE = re.compile(r'[^\x20-\x7E\n\r\t]')
+# Cleaned text only has ' ' for whitespace, so this is split_into_sentences' separator
+_BOUNDARY = re.compile(r'(?<=[.!?]) +')
+
+def _blocks(source: Union[str, TextIO], read_size: int) -> Iterator[str]:
+    if isinstance(source, str):
+        for i in range(0, len(source), read_size):
+            yield source[i:i + read_size]
+        return
+    while True:
+        block = source.read(read_size)
+        if not block:
+            return
+        yield block
+
+def iter_sentences(source: Union[str, TextIO], read_size: int = READ_SIZE) -> Iterator[str]:
+    """
+    Single pass over a string or text stream: clean_text + split_into_sentences,
+    one block at a time. Yields the same sentences as the two-step version.
+    """
+    pending: List[str] = []  # cleaned text of the sentence in progress
+    last = ""                # last cleaned char seen, for the lookbehind across blocks
+    raw_ws_tail = False      # previous raw block ended in whitespace
+    for block in _blocks(source, read_size):
+        cleaned = _NON_PRINTABLE.sub('', _WS.sub(' ', block))
+        if raw_ws_tail and block[0].isspace():
+            cleaned = cleaned[1:]  # same whitespace run as the previous block's tail
+        raw_ws_tail = block[-1].isspace()
+        if not cleaned:
+            continue
+        pieces = _BOUNDARY.split(last + cleaned)
+        pieces[0] = pieces[0][len(last):]
+        if len(pieces) > 1:
+            pending.append(pieces[0])
+            pieces[0] = "".join(pending)
+            for sentence in pieces[:-1]:
+                sentence = sentence.strip()
+                if sentence:
+                    yield sentence
+            pending = []
+        pending.append(pieces[-1])
+        last = cleaned[-1]
+    sentence = "".join(pending).strip()
+    if sentence:
+        yield sentence
+
+def _split_long(sentence: str, max_tokens: int) -> List[str]:
+    """Hard-split a sentence that alone exceeds max_tokens (cleaned text is ASCII, so token slices decode cleanly)"""
+    if _ENCODING is not None:
+        ids = _ENCODING.encode(sentence, disallowed_special=())
+        pieces = [_ENCODING.decode(ids[i:i + max_tokens]) for i in range(0, len(ids), max_tokens)]
+    else:
+        step = max_tokens * 4
+        pieces = [sentence[i:i + step] for i in range(0, len(sentence), step)]
+    return [p.strip() for p in pieces if p.strip()]
+
+def _is_anchor(sentence: str, every: int) -> bool:
+    return zlib.crc32(sentence.encode("utf-8")) % every == 0
+
+def iter_chunks(source: Union[str, TextIO], chunk_size: int = 1000, overlap: int = 200,
+                max_tokens: Optional[int] = None, read_size: int = READ_SIZE,
+                anchor_every: int = 0) -> Iterator[Tuple[str, int]]:
+    """
+    Streaming chunk_text: yields (chunk_text, chunk_index) from a string or text stream
+    without holding the document or the chunk list in memory.
+
+    With max_tokens set, a chunk is also closed before it would exceed that many tokens
+    (and single sentences longer than that are split). Without it the output matches
+    chunk_text exactly.
+
+    With anchor_every set, a chunk past half of chunk_size is also closed after any
+    sentence whose hash picks it (about 1 in anchor_every). Those boundaries depend
+    only on the sentence, so after an edit the chunking re-aligns and the later
+    chunks come out identical (see ingest_pipeline's incremental mode).
+    """
+    parts: List[str] = []
+    size = 0     # len(" ".join(parts))
+    tokens = 0
+    index = 0
+    fresh = False  # parts holds more than the previous chunk's overlap
+    for sentence in iter_sentences(source, read_size):
+        pieces = [sentence]
+        if max_tokens and count_tokens(sentence) > max_tokens:
+            pieces = _split_long(sentence, max_tokens)
+        for piece in pieces:
+            n = len(piece)
+            t = count_tokens(piece) if max_tokens else 0
+            if parts and (size + n > chunk_size or (max_tokens and tokens + t > max_tokens)):
+                current = " ".join(parts)
+                yield current.strip(), index
+                index += 1
+                overlap_text = get_overlap_text(current, overlap)
+                parts = [overlap_text, piece]
+                size = len(overlap_text) + 1 + n
+                tokens = (count_tokens(overlap_text) + t) if max_tokens else 0
             else:
-                current_chunk = sentence
-            current_size = len(current_chunk)
-    
-    # Add final chunk if there's content
-    if current_chunk.strip():
-        chunks.append((current_chunk.strip(), chunk_index))
-    
-    return chunks
+                size += n + (1 if parts else 0)
+                tokens += t
+                parts.append(piece)
+            fresh = True
+            if anchor_every and size >= chunk_size // 2 and _is_anchor(piece, anchor_every):
+                current = " ".join(parts)
+                yield current.strip(), index
+                index += 1
+                overlap_text = get_overlap_text(current, overlap)
+                parts = [overlap_text]
+                size = len(overlap_text)
+                tokens = count_tokens(overlap_text) if max_tokens else 0
+                fresh = False
+    if parts and fresh:
+        current = " ".join(parts).strip()
+        if current:
+            yield current, index
 
 def clean_text(text: str) -> str:
     """Clean and normalize text"""
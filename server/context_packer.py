@@ -0,0 +1,98 @@
+# /server/context_packer.py
+"""
+Token-aware context packing for RAG prompts.
+
+Retrieved chunks are merged into passages when they are neighbours in the
+same artifact (dropping the overlap chunking.chunk_text repeats between
+them), de-duplicated, ordered by score and added whole until the token
+budget is spent.
+"""
+import os
+from typing import Any, Dict, List
+from .chunking import count_tokens
+
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "5000"))
+MAX_OVERLAP_CHARS = 1000
+_PROBE = 24
+
+def merge_overlap(a: str, b: str) -> str:
+    """Join two consecutive chunks, dropping the longest suffix of a that b starts with"""
+    start = max(0, len(a) - min(len(b), MAX_OVERLAP_CHARS))
+    probe = b[:_PROBE]
+    while probe:
+        i = a.find(probe, start)
+        if i < 0:
+            break
+        tail = a[i:]
+        if b.startswith(tail):
+            return a + b[len(tail):]
+        start = i + 1
+    return a + " " + b
+
+def _passage(r: Dict[str, Any], pos: int) -> Dict[str, Any]:
+    score = r.get("score")
+    return {
+        "title": r.get("title") or "Unknown Document",
+        "artifact_id": r.get("artifact_id"),
+        "chunk_index": r.get("chunk_index"),
+        "last_index": r.get("chunk_index"),
+        "content": r.get("content") or "",
+        # Keep retrieval order when the source gives no score
+        "score": float(score) if score is not None else 1.0 / (1 + pos),
+    }
+
+def merge_adjacent(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge runs of consecutive chunk_index from the same artifact into single passages"""
+    passages = [_passage(r, pos) for pos, r in enumerate(results)]
+    mergeable = sorted((p for p in passages if p["artifact_id"] and p["chunk_index"] is not None),
+                       key=lambda p: (p["artifact_id"], p["chunk_index"]))
+    out = [p for p in passages if not (p["artifact_id"] and p["chunk_index"] is not None)]
+    for p in mergeable:
+        prev = out[-1] if out else None
+        if (prev is not None and prev["artifact_id"] == p["artifact_id"]
+                and prev["last_index"] is not None and p["chunk_index"] == prev["last_index"] + 1):
+            prev["content"] = merge_overlap(prev["content"], p["content"])
+            prev["last_index"] = p["chunk_index"]
+            prev["score"] = max(prev["score"], p["score"])
+        elif prev is not None and prev["artifact_id"] == p["artifact_id"] and p["chunk_index"] == prev["last_index"]:
+            continue  # same chunk returned twice
+        else:
+            out.append(p)
+    return out
+
+def _fit(text: str, budget: int) -> str:
+    """Trim text to the budget at a sentence (or word) boundary"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    end = max(cut.rfind(". "), cut.rfind("? "), cut.rfind("! "))
+    if end > len(cut) // 2:
+        return cut[:end + 1]
+    space = cut.rfind(" ")
+    return cut[:space] if space > 0 else cut
+
+def pack_context(results: List[Dict[str, Any]], budget_tokens: int = RAG_CONTEXT_TOKENS) -> str:
+    """Build the prompt context: merged, de-duplicated passages by score, within budget_tokens"""
+    seen = set()
+    blocks = []
+    used = 0
+    for p in sorted(merge_adjacent(results), key=lambda p: p["score"], reverse=True):
+        norm = " ".join(p["content"].split())
+        if not norm or norm in seen:
+            continue
+        seen.add(norm)
+        block = f"[Artifact: {p['title']}] \n{p['content']}"
+        cost = count_tokens(block) + 2  # separator
+        if used + cost <= budget_tokens:
+            blocks.append(block)
+            used += cost
+        elif not blocks:
+            # A single passage larger than the whole budget: keep its leading sentences
+            blocks.append(_fit(block, budget_tokens))
+            break
+    return "\n\n".join(blocks)
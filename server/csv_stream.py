@@ -0,0 +1,159 @@
+# /server/csv_stream.py
+"""
+Streaming CSV export engine.
+
+Rows are read a page at a time by keyset on (created_at, id) and written to
+the response as they arrive, so an export holds one page in memory however
+large the project is:
+
+    fetch = postgrest_pages(lambda: sb.table("actions").select(cols).eq(...))
+    return csv_response(keyset_rows(fetch), headers, "actions.csv")
+
+- postgrest_pages() / sql_pages() build a fetch_page(after, limit) for a
+  PostgREST query or a direct SQL query. Order is created_at ASC NULLS FIRST,
+  id ASC; see drizzle/migrations/2026-10-17_export_keyset_indexes.sql.
+- keyset_rows() fetches the first page right away (so auth/connection errors
+  surface, and the dev fallbacks still work, before the response starts) and
+  the rest lazily while the response is consumed. An optional transform maps
+  each raw page to output rows (visibility filtering, joins).
+- sql_stream() covers queries that have no keyset (aggregates): a
+  server-side cursor FETCHed CSV_PAGE_SIZE rows at a time.
+- iter_csv() sanitizes every cell against formula injection and flushes in
+  CSV_FLUSH_BYTES chunks.
+"""
+import io
+import os
+import csv
+from uuid import uuid4
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi.responses import StreamingResponse
+
+CSV_PAGE_SIZE = int(os.getenv("CSV_PAGE_SIZE", "1000"))
+CSV_FLUSH_BYTES = int(os.getenv("CSV_FLUSH_BYTES", str(64 * 1024)))
+
+Cursor = Tuple[Any, Any]  # (created_at, id) of the last row of the previous page
+FetchPage = Callable[[Optional[Cursor], int], List[Dict[str, Any]]]
+
+def sanitize_cell(cell):
+    """Prevent CSV injection by neutralizing formula-starting characters"""
+    if isinstance(cell, str) and cell and cell[0] in ['=', '+', '-', '@']:
+        return ' ' + cell  # Prefix with space to neutralize
+    return cell
+
+def iter_csv(rows: Iterable[Any], headers: Sequence[str], flush_bytes: int = CSV_FLUSH_BYTES) -> Iterator[str]:
+    """CSV text in chunks of about flush_bytes; rows are dicts (picked by headers) or sequences"""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(headers)
+    for r in rows:
+        values = [r.get(h, "") for h in headers] if isinstance(r, dict) else r
+        w.writerow([sanitize_cell(v) for v in values])
+        if buf.tell() >= flush_bytes:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+def csv_response(rows: Iterable[Any], headers: Sequence[str], filename: str) -> StreamingResponse:
+    return StreamingResponse(iter_csv(rows, headers), media_type="text/csv",
+      headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def keyset_rows(fetch_page: FetchPage, transform: Optional[Callable[[List[Dict[str, Any]]], Iterable[Any]]] = None,
+                page_size: int = CSV_PAGE_SIZE) -> Iterator[Any]:
+    """All rows, page by page; the first page is fetched before this returns"""
+    first = fetch_page(None, page_size)
+
+    def gen(page):
+        while True:
+            yield from (transform(page) if transform else page)
+            if len(page) < page_size:
+                return
+            last = page[-1]
+            page = fetch_page((last.get("created_at"), last["id"]), page_size)
+
+    return gen(first)
+
+def _quote(value: Any) -> str:
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def postgrest_pages(build_query: Callable[[], Any]) -> FetchPage:
+    """fetch_page over a PostgREST select; build_query() returns a fresh filtered query each call"""
+    def fetch(after: Optional[Cursor], limit: int) -> List[Dict[str, Any]]:
+        q = build_query()
+        if after is not None:
+            created_at, last_id = after
+            if created_at is None:
+                q = q.or_(f"and(created_at.is.null,id.gt.{_quote(last_id)}),created_at.not.is.null")
+            else:
+                ts = _quote(created_at)
+                q = q.or_(f"created_at.gt.{ts},and(created_at.eq.{ts},id.gt.{_quote(last_id)})")
+        q = q.order("created_at", desc=False, nullsfirst=True).order("id", desc=False).limit(limit)
+        return q.execute().data or []
+    return fetch
+
+def sql_pages(table: str, columns: Sequence[str], where: str, params: Sequence[Any]) -> FetchPage:
+    """fetch_page over a direct query (dev fallback); datetimes come back as ISO strings like PostgREST's"""
+    from .db import get_conn
+    column_sql = ', '.join(columns)
+
+    def fetch(after: Optional[Cursor], limit: int) -> List[Dict[str, Any]]:
+        sql = f"SELECT {column_sql} FROM {table} WHERE {where}"
+        args = list(params)
+        if after is not None:
+            created_at, last_id = after
+            if created_at is None:
+                sql += " AND ((created_at IS NULL AND id > %s) OR created_at IS NOT NULL)"
+                args.append(last_id)
+            else:
+                sql += " AND (created_at, id) > (%s, %s)"
+                args += [created_at, last_id]
+        sql += " ORDER BY created_at ASC NULLS FIRST, id ASC LIMIT %s"
+        args.append(limit)
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(sql, args)
+            rows = []
+            for row in cur.fetchall():
+                rows.append({col: (value.isoformat() if hasattr(value, 'isoformat') else value)
+                             for col, value in zip(columns, row)})
+            return rows
+    return fetch
+
+def sql_stream(query: str, params: Sequence[Any], batch: int = CSV_PAGE_SIZE) -> Iterator[tuple]:
+    """Rows of query through a server-side cursor; the first batch is fetched before this returns.
+    Holds one pooled connection (in a read-only transaction) until the iterator is exhausted or closed."""
+    from .db import get_conn
+    name = f"csv_{uuid4().hex}"
+    conn = get_conn()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN READ ONLY")
+        cur.execute(f"DECLARE {name} NO SCROLL CURSOR FOR {query}", params)
+        cur.execute(f"FETCH {int(batch)} FROM {name}")
+        first = cur.fetchall()
+    except Exception:
+        _release(conn, cur)
+        raise
+
+    def gen(rows):
+        try:
+            while rows:
+                yield from rows
+                if len(rows) < batch:
+                    return
+                cur.execute(f"FETCH {int(batch)} FROM {name}")
+                rows = cur.fetchall()
+        finally:
+            _release(conn, cur)
+
+    return gen(first)
+
+def _release(conn, cur):
+    try:
+        cur.execute("ROLLBACK")
+        cur.close()
+    except Exception:
+        pass  # the pool rolls back or discards connections left mid-transaction
+    finally:
+        conn.close()
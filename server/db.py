@@ -1,14 +1,29 @@
 # /server/db.py
 import os
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
 import psycopg2
 import psycopg2.extras
 
-def get_conn():
+# Process-wide connection pool settings
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT_SEC = float(os.getenv("DB_POOL_TIMEOUT_SEC", "10"))
+POOL_IDLE_SEC = float(os.getenv("DB_POOL_IDLE_SEC", "300"))
+POOL_CHECK_AFTER_SEC = float(os.getenv("DB_POOL_CHECK_AFTER_SEC", "30"))
+
+def _dsn():
     # Try local PostgreSQL first, fall back to Supabase
     dsn = os.environ.get("DATABASE_URL") or os.environ.get("SUPABASE_DB_URL")
     if not dsn:
         raise RuntimeError("DATABASE_URL or SUPABASE_DB_URL not set")
-    conn = psycopg2.connect(dsn)
+    return dsn
+
+def _connect():
+    conn = psycopg2.connect(_dsn())
     conn.autocommit = True
     # Register JSON adapter for list types
     try:
@@ -19,6 +34,236 @@ def get_conn():
         pass
     return conn
 
+class PooledConnection:
+    """Checked-out pool connection; close() / leaving a `with` block returns it to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    _own = ("_pool", "_raw")
+
+    def _live(self):
+        raw = self.__dict__.get("_raw")
+        if raw is None:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        return raw
+
+    def __getattr__(self, name):
+        return getattr(self._live(), name)
+
+    def __setattr__(self, name, value):
+        # Everything but the proxy's own slots (autocommit, isolation_level, ...) belongs to the connection
+        if name in self._own:
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._live(), name, value)
+
+    def __enter__(self):
+        self._raw.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self._raw.__exit__(exc_type, exc, tb)
+        finally:
+            self.close()
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is not None:
+            self._pool.putconn(raw)
+
+    def __del__(self):
+        # Safety net for callers that never close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    """Thread-safe psycopg2 pool with health check on checkout and idle eviction"""
+
+    def __init__(self, connect, minconn=POOL_MIN, maxconn=POOL_MAX, timeout=POOL_TIMEOUT_SEC,
+                 max_idle=POOL_IDLE_SEC, check_after=POOL_CHECK_AFTER_SEC):
+        self._connect = connect
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self._idle = deque()  # (conn, returned_at), most recently used on the right
+        self._size = 0        # open connections, idle + checked out
+        self._cond = threading.Condition()
+        self._stats = {"checkouts": 0, "waits": 0, "wait_time_ms": 0.0, "timeouts": 0,
+                       "opened": 0, "closed": 0, "failed_checks": 0}
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        waited = None
+        while True:
+            with self._cond:
+                self._evict_idle_locked()
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                elif self._size < self.maxconn:
+                    self._size += 1
+                    conn, returned_at = None, None
+                else:
+                    if waited is None:
+                        waited = time.monotonic()
+                        self._stats["waits"] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        self._stats["wait_time_ms"] += (time.monotonic() - waited) * 1000
+                        raise RuntimeError(f"DB pool exhausted ({self.maxconn} connections busy)")
+                    self._cond.wait(remaining)
+                    continue
+
+            # Connect / health-check outside the lock
+            if conn is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(conn, returned_at):
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                self._stats["checkouts"] += 1
+                if waited is not None:
+                    self._stats["wait_time_ms"] += (time.monotonic() - waited) * 1000
+            return conn
+
+    def putconn(self, conn):
+        if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Broken, or left mid-transaction by the caller: don't hand it to the next one
+            try:
+                if not conn.closed:
+                    conn.rollback()
+            except Exception:
+                pass
+            if conn.closed or conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                self._discard(conn)
+                return
+        if not conn.autocommit:
+            conn.autocommit = True
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {**self._stats, "size": self._size, "idle": len(self._idle),
+                    "in_use": self._size - len(self._idle), "min": self.minconn, "max": self.maxconn}
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._stats["opened"] += 1
+        return conn
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("select 1")
+            return True
+        except Exception as e:
+            logging.warning(f"DB pool: dropping dead connection ({type(e).__name__})")
+            with self._cond:
+                self._stats["failed_checks"] += 1
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["closed"] += 1
+            self._cond.notify()
+
+    def _evict_idle_locked(self):
+        # Oldest idle connections sit on the left; keep at least minconn open
+        now = time.monotonic()
+        while self._idle and self._size > self.minconn and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._size -= 1
+            self._stats["closed"] += 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(_connect)
+    return _pool
+
+def get_conn():
+    """Check out a pooled connection; use as `with get_conn() as conn` or call conn.close()"""
+    pool = get_pool()
+    return PooledConnection(pool, pool.getconn())
+
+_async_pool = None
+_async_pool_lock = None
+
+async def get_async_pool():
+    """Process-wide psycopg 3 AsyncConnectionPool for the async request paths"""
+    global _async_pool, _async_pool_lock
+    if _async_pool is None:
+        import asyncio
+        from psycopg_pool import AsyncConnectionPool
+        if _async_pool_lock is None:
+            _async_pool_lock = asyncio.Lock()
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool = AsyncConnectionPool(
+                    _dsn(), min_size=POOL_MIN, max_size=POOL_MAX, timeout=POOL_TIMEOUT_SEC,
+                    max_idle=POOL_IDLE_SEC, kwargs={"autocommit": True}, open=False,
+                    check=AsyncConnectionPool.check_connection,
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
+
+@asynccontextmanager
+async def aget_conn(timeout=None):
+    """Async counterpart of get_conn(): `async with aget_conn() as conn`
+    timeout: seconds to wait for a free connection (default DB_POOL_TIMEOUT_SEC)"""
+    pool = await get_async_pool()
+    async with pool.connection(timeout=timeout) as conn:
+        yield conn
+
+def pool_stats():
+    """Pool metrics: checkouts, waits, wait time, opened/closed connections"""
+    stats = get_pool().stats() if _pool is not None else {}
+    if _async_pool is not None:
+        stats["async"] = _async_pool.get_stats()
+    return stats
+
 def insert_artifact(conn, org_id, project_id, path, mime_type, title, source, meeting_date=None):
     """Insert artifact and return the ID"""
     with conn.cursor() as cur:
@@ -36,13 +281,13 @@ def update_artifact_chunk_count(conn, artifact_id, n):
 
 def insert_chunks(conn, org_id, project_id, artifact_id, rows):
     """Insert chunks in batch via psycopg2"""
-    # rows: list of dicts with content, embedding, chunk_index
+    # rows: list of dicts with content, embedding, chunk_index and optionally page
     with conn.cursor() as cur:
         cur.executemany("""
-            insert into artifact_chunks (org_id, project_id, artifact_id, chunk_index, content, embedding)
-            values (%s,%s,%s,%s,%s,%s)
+            insert into artifact_chunks (org_id, project_id, artifact_id, chunk_index, content, embedding, page)
+            values (%s,%s,%s,%s,%s,%s,%s)
         """, [
-            (org_id, project_id, artifact_id, r["chunk_index"], r["content"], r["embedding"])
+            (org_id, project_id, artifact_id, r["chunk_index"], r["content"], r["embedding"], r.get("page"))
             for r in rows
         ])
 
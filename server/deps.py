@@ -12,6 +12,7 @@ def get_service_supabase():
     
     This bypasses Row Level Security (RLS) and allows for administrative operations.
     Used by background tasks, schedulers, and admin operations that need elevated access.
+    The client is shared process-wide (see supabase_client), so calling this in a loop is cheap.
     
     Returns:
         supabase.Client: Configured Supabase client with service role access
@@ -4,8 +4,11 @@ from .db import get_conn, insert_artifact, insert_chunks, update_artifact_chunk_
 from .parsing import extract_text_from_file
 from .chunking import chunk_text
 from .rag import embed_texts
-from .mem_agent import extract_memories_from_text
+from .extraction import extract_document, memory_view
+from .uploads import SpooledUpload, spool_upload, spool_iter, upload_spooled, UploadTooLarge, UPLOAD_CHUNK_BYTES
 from uuid import uuid4
+from pathlib import Path
+import asyncio
 import re
 
 router = APIRouter()
@@ -155,24 +158,34 @@ async def email_mailgun(req: Request):
     for url in storage_urls:
         try:
             print(f"[Mailgun] Fetching stored attachment: {url}")
-            r = requests.get(url, timeout=20)  # Mailgun signed URL
-            if r.status_code != 200:
-                print(f"[Mailgun] Failed to fetch {url}: {r.status_code}")
-                continue
-                
             filename = sanitize(url.split("/")[-1])
-            content_type = r.headers.get("Content-Type", "application/octet-stream")
-            data = r.content
-            
-            # Validate attachment safety
-            is_safe, error_msg = validate_attachment(filename, content_type, data)
-            if not is_safe:
-                print(f"[Mailgun] Unsafe stored attachment rejected: {error_msg}")
-                results.append({"error": error_msg, "url": url, "filename": filename})
-                continue
+            # Mailgun signed URL; streamed straight into a spool file
+            with requests.get(url, timeout=20, stream=True) as r:
+                if r.status_code != 200:
+                    print(f"[Mailgun] Failed to fetch {url}: {r.status_code}")
+                    continue
+                content_type = r.headers.get("Content-Type", "application/octet-stream")
+                try:
+                    spooled = await asyncio.to_thread(
+                        spool_iter, r.iter_content(UPLOAD_CHUNK_BYTES), Path(filename).suffix, MAX_FILE_SIZE)
+                except UploadTooLarge as e:
+                    error_msg = str(e)
+                    print(f"[Mailgun] Unsafe stored attachment rejected: {error_msg}")
+                    results.append({"error": error_msg, "url": url, "filename": filename})
+                    continue
             
-            out = await _ingest_one(org_id, project_id, filename, content_type, data)
-            results.append(out)
+            try:
+                # Validate attachment safety
+                is_safe, error_msg = validate_attachment(filename, content_type, spooled.size)
+                if not is_safe:
+                    print(f"[Mailgun] Unsafe stored attachment rejected: {error_msg}")
+                    results.append({"error": error_msg, "url": url, "filename": filename})
+                    continue
+                
+                out = await _ingest_one(org_id, project_id, filename, content_type, spooled)
+                results.append(out)
+            finally:
+                spooled.remove()
         except Exception as e:
             print(f"[Mailgun] Error processing stored URL {url}: {e}")
             results.append({"error": str(e), "url": url})
@@ -181,17 +194,26 @@ async def email_mailgun(req: Request):
     for up in attached_files:
         try:
             print(f"[Mailgun] Processing direct attachment: {up.filename}")
-            data = await up.read()
-            
-            # Validate attachment safety
-            is_safe, error_msg = validate_attachment(sanitize(up.filename), up.content_type, data)
-            if not is_safe:
+            try:
+                spooled = await spool_upload(up, Path(up.filename).suffix, MAX_FILE_SIZE)
+            except UploadTooLarge as e:
+                error_msg = str(e)
                 print(f"[Mailgun] Unsafe attachment rejected: {error_msg}")
                 results.append({"error": error_msg, "filename": up.filename})
                 continue
             
-            out = await _ingest_one(org_id, project_id, sanitize(up.filename), up.content_type, data)
-            results.append(out)
+            try:
+                # Validate attachment safety
+                is_safe, error_msg = validate_attachment(sanitize(up.filename), up.content_type, spooled.size)
+                if not is_safe:
+                    print(f"[Mailgun] Unsafe attachment rejected: {error_msg}")
+                    results.append({"error": error_msg, "filename": up.filename})
+                    continue
+                
+                out = await _ingest_one(org_id, project_id, sanitize(up.filename), up.content_type, spooled)
+                results.append(out)
+            finally:
+                spooled.remove()
         except Exception as e:
             print(f"[Mailgun] Error processing attachment {up.filename}: {e}")
             results.append({"error": str(e), "filename": up.filename})
@@ -199,13 +221,11 @@ async def email_mailgun(req: Request):
     print(f"[Mailgun] Processed {len(results)} attachments for {proj_code}")
     return {"ok": True, "project": proj_code, "count": len(results), "results": results}
 
-def validate_attachment(filename: str, content_type: str, data: bytes) -> tuple[bool, str]:
+def validate_attachment(filename: str, content_type: str, size: int) -> tuple[bool, str]:
     """Validate attachment safety and type restrictions"""
-    from pathlib import Path
-    
     # Check file size
-    if len(data) > MAX_FILE_SIZE:
-        return False, f"File too large: {len(data)} bytes (max {MAX_FILE_SIZE})"
+    if size > MAX_FILE_SIZE:
+        return False, f"File too large: {size} bytes (max {MAX_FILE_SIZE})"
     
     # Check extension
     ext = Path(filename).suffix.lower()
@@ -218,9 +238,10 @@ def validate_attachment(filename: str, content_type: str, data: bytes) -> tuple[
     
     return True, "OK"
 
-async def _ingest_one(org_id: str, project_id: str, filename: str, content_type: str, data: bytes):
+async def _ingest_one(org_id: str, project_id: str, filename: str, content_type: str, spooled: SpooledUpload):
     """
     Ingest a single attachment: store in Supabase, parse text, create embeddings, extract memories
+    The attachment is already spooled to disk; it is streamed to storage and parsed in place.
     """
     from .supabase_client import get_supabase_storage_client
     
@@ -233,36 +254,24 @@ async def _ingest_one(org_id: str, project_id: str, filename: str, content_type:
         print(f"[Mailgun] Uploading to storage: {key}")
         try:
             storage = get_supabase_storage_client()
-            storage.upload(key, data)
+            await asyncio.to_thread(upload_spooled, storage, key, spooled, content_type)
         except Exception as storage_error:
             print(f"[Mailgun] Storage upload failed: {storage_error}")
             # Fallback: use Supabase REST API
             from .supabase_client import get_supabase_client
             sb = get_supabase_client()
-            import base64
-            data_b64 = base64.b64encode(data).decode()
-            sb.storage.from_(BUCKET).upload(
-                key, 
-                base64.b64decode(data_b64),
-                file_options={"content-type": content_type}
-            )
+            await asyncio.to_thread(upload_spooled, sb.storage.from_(BUCKET), key, spooled, content_type)
         
         # Always extract text first (needed for both psycopg and REST fallback)
-        import tempfile
-        with tempfile.NamedTemporaryFile(suffix=f"_{filename}", delete=False) as tmp:
-            tmp.write(data)
-            tmp_path = tmp.name
-        
-        text, _ = extract_text_from_file(tmp_path, content_type)
-        os.unlink(tmp_path)  # Clean up temp file
+        text, _ = extract_text_from_file(spooled.path, content_type, detected_type=spooled.mime)
         
         # Create chunks and embeddings (needed for both paths)
-        chunks = chunk_text(text, 1200, 200) if text else []
+        chunks = [c for c, _ in chunk_text(text, 1200, 200)] if text else []
         embs = embed_texts(chunks) if chunks else []
         
         # Extract memories (decisions, risks, actions, etc.)
         if text:
-            mem_result = await extract_memories_from_text(text, filename)
+            mem_result = memory_view(await extract_document(text, filename))
             mem = mem_result.__dict__ if hasattr(mem_result, '__dict__') else {}
         else:
             mem = {}
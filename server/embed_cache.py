@@ -0,0 +1,171 @@
+# /server/embed_cache.py
+"""
+Content-addressed embedding cache.
+
+Entries are keyed by sha256(model + normalized text) and live in the
+embedding_cache table, fronted by a small in-process LRU. The table is kept
+under EMBED_CACHE_MAX_ROWS by evicting the least recently used rows.
+Failures are logged and treated as misses so ingestion never depends on it.
+"""
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "1") == "1"
+EMBED_CACHE_MAX_ROWS = int(os.getenv("EMBED_CACHE_MAX_ROWS", "200000"))
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", "2048"))
+EMBED_CACHE_EVICT_EVERY = int(os.getenv("EMBED_CACHE_EVICT_EVERY", "1000"))
+
+log = logging.getLogger("embed_cache")
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so reflowed copies of the same chunk share a key"""
+    return " ".join(text.split())
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+def _vector_literal(emb: List[float]) -> str:
+    return f"[{','.join(map(str, emb))}]"
+
+class EmbeddingCache:
+    def __init__(self, max_rows: int = EMBED_CACHE_MAX_ROWS, memory_items: int = EMBED_CACHE_MEMORY_ITEMS):
+        self.max_rows = max_rows
+        self.memory_items = memory_items
+        self._mem: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserted_since_evict = 0
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stored": 0, "evicted": 0, "errors": 0}
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Return cached embeddings for whichever keys are present"""
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for k in keys:
+                if k in self._mem:
+                    self._mem.move_to_end(k)
+                    found[k] = self._mem[k]
+            self._stats["memory_hits"] += len(found)
+
+        remaining = [k for k in keys if k not in found]
+        if remaining:
+            try:
+                from .db import get_conn
+                with get_conn() as conn, conn.cursor() as cur:
+                    # One round trip: fetch and bump recency for LRU eviction
+                    cur.execute("""
+                        UPDATE embedding_cache SET last_used_at = now(), hits = hits + 1
+                        WHERE key = ANY(%s)
+                        RETURNING key, embedding::text
+                    """, (remaining,))
+                    rows = cur.fetchall()
+                db_found = {k: json.loads(e) for k, e in rows}
+                found.update(db_found)
+                self._remember(db_found)
+                with self._lock:
+                    self._stats["db_hits"] += len(db_found)
+            except Exception as e:
+                log.warning(f"embedding cache lookup failed: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+
+        with self._lock:
+            self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, List[float]]]):
+        if not items:
+            return
+        self._remember(dict(items))
+        try:
+            from .db import get_conn
+            import psycopg2.extras
+            with get_conn() as conn, conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, """
+                    INSERT INTO embedding_cache (key, model, embedding)
+                    VALUES %s
+                    ON CONFLICT (key) DO UPDATE SET last_used_at = now()
+                """, [(k, model, _vector_literal(e)) for k, e in items], template="(%s, %s, %s::vector)")
+                with self._lock:
+                    self._stats["stored"] += len(items)
+                    self._inserted_since_evict += len(items)
+                    evict = self._inserted_since_evict >= EMBED_CACHE_EVICT_EVERY
+                    if evict:
+                        self._inserted_since_evict = 0
+                if evict:
+                    self._evict(cur)
+        except Exception as e:
+            log.warning(f"embedding cache store failed: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            s = dict(self._stats)
+            s["memory_items"] = len(self._mem)
+        lookups = s["memory_hits"] + s["db_hits"] + s["misses"]
+        s["hit_rate"] = round((s["memory_hits"] + s["db_hits"]) / lookups, 4) if lookups else 0.0
+        return s
+
+    def _remember(self, entries: Dict[str, List[float]]):
+        with self._lock:
+            for k, e in entries.items():
+                self._mem[k] = e
+                self._mem.move_to_end(k)
+            while len(self._mem) > self.memory_items:
+                self._mem.popitem(last=False)
+
+    def _evict(self, cur):
+        cur.execute("""
+            DELETE FROM embedding_cache WHERE key IN (
+                SELECT key FROM embedding_cache ORDER BY last_used_at DESC OFFSET %s
+            )
+        """, (self.max_rows,))
+        with self._lock:
+            self._stats["evicted"] += max(cur.rowcount, 0)
+
+_cache = EmbeddingCache()
+
+def get_embedding_cache() -> EmbeddingCache:
+    return _cache
+
+def cached_embed(model: str, texts: List[str], embed_fn) -> List[List[float]]:
+    """Embed texts, sending only cache misses (deduplicated) to embed_fn"""
+    if not EMBED_CACHE_ENABLED or not texts:
+        return embed_fn(texts)
+    keys = [cache_key(model, t) for t in texts]
+    found = _cache.get_many(list(dict.fromkeys(keys)))
+
+    missing: Dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in missing:
+            missing[k] = t
+    if missing:
+        embs = embed_fn(list(missing.values()))
+        fresh = list(zip(missing.keys(), embs))
+        found.update(fresh)
+        _cache.put_many(model, fresh)
+    return [found[k] for k in keys]
+
+async def acached_embed(model: str, texts: List[str], aembed_fn) -> List[List[float]]:
+    """Async cached_embed: cache I/O runs in a thread, misses go to the async aembed_fn"""
+    if not EMBED_CACHE_ENABLED or not texts:
+        return await aembed_fn(texts)
+    keys = [cache_key(model, t) for t in texts]
+    found = await asyncio.to_thread(_cache.get_many, list(dict.fromkeys(keys)))
+
+    missing: Dict[str, str] = {}
+    for k, t in zip(keys, texts):
+        if k not in found and k not in missing:
+            missing[k] = t
+    if missing:
+        embs = await aembed_fn(list(missing.values()))
+        fresh = list(zip(missing.keys(), embs))
+        found.update(fresh)
+        await asyncio.to_thread(_cache.put_many, model, fresh)
+    return [found[k] for k in keys]
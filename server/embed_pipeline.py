@@ -0,0 +1,145 @@
+# /server/embed_pipeline.py
+"""
+Batched embedding stage for ingestion.
+
+Packs texts into token-bounded batches, embeds a bounded number of batches
+concurrently (retrying rate limits with backoff) and bulk-inserts each batch
+into artifact_chunks / mem_chunks with one PostgREST call.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+from typing import List, Tuple, Dict, Any, Callable, Optional
+from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+from .chunking import count_tokens
+from .rag import aembed_texts
+from .supabase_client import get_supabase_client
+from . import ask_cache
+
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "50000"))
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "128"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_BASE_SEC = float(os.getenv("EMBED_BACKOFF_BASE_SEC", "1.0"))
+
+RETRYABLE = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+log = logging.getLogger("embed_pipeline")
+
+def new_stats() -> Dict[str, Any]:
+    return {"texts": 0, "batches": 0, "retries": 0, "tokens": 0,
+            "embed_ms": 0.0, "insert_ms": 0.0, "total_ms": 0.0}
+
+def pack_batches(texts: List[str], max_tokens: int = EMBED_BATCH_TOKENS,
+                 max_items: int = EMBED_BATCH_MAX_ITEMS) -> List[List[int]]:
+    """Group text indices into batches bounded by token count and item count"""
+    batches, current, current_tokens = [], [], 0
+    for i, t in enumerate(texts):
+        n = count_tokens(t)
+        if current and (current_tokens + n > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += n
+    if current:
+        batches.append(current)
+    return batches
+
+async def _embed_with_retry(batch: List[str], stats: Dict[str, Any]) -> List[List[float]]:
+    attempt = 0
+    while True:
+        try:
+            return await aembed_texts(batch)
+        except RETRYABLE as e:
+            attempt += 1
+            if attempt > EMBED_MAX_RETRIES:
+                raise
+            stats["retries"] += 1
+            delay = EMBED_BACKOFF_BASE_SEC * (2 ** (attempt - 1)) * (1 + random.random())
+            log.warning(f"embedding batch of {len(batch)} hit {type(e).__name__}, retry {attempt} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def _run_batches(texts: List[str], on_batch: Optional[Callable[[List[int], List[List[float]]], None]],
+                       stats: Dict[str, Any]) -> List[List[float]]:
+    t0 = time.perf_counter()
+    out: List[Optional[List[float]]] = [None] * len(texts)
+    batches = pack_batches(texts)
+    sem = asyncio.Semaphore(max(1, EMBED_CONCURRENCY))
+    stats["texts"] += len(texts)
+    stats["batches"] += len(batches)
+
+    async def run(idx: List[int]):
+        async with sem:
+            batch = [texts[i] for i in idx]
+            t = time.perf_counter()
+            embs = await _embed_with_retry(batch, stats)
+            stats["embed_ms"] += (time.perf_counter() - t) * 1000
+            stats["tokens"] += sum(count_tokens(b) for b in batch)
+            for i, e in zip(idx, embs):
+                out[i] = e
+            if on_batch:
+                t = time.perf_counter()
+                await asyncio.to_thread(on_batch, idx, embs)
+                stats["insert_ms"] += (time.perf_counter() - t) * 1000
+
+    await asyncio.gather(*(run(idx) for idx in batches))
+    stats["total_ms"] += (time.perf_counter() - t0) * 1000
+    return out
+
+async def embed_all(texts: List[str], stats: Optional[Dict[str, Any]] = None) -> List[List[float]]:
+    """Embed texts in concurrent token-bounded batches; results keep input order"""
+    if not texts:
+        return []
+    return await _run_batches(texts, None, stats if stats is not None else new_stats())
+
+async def embed_and_store_chunks(org_id: str, project_id: str, artifact_id: str,
+                                 chunks: List[Tuple[str, int]],
+                                 pages: Optional[List[Optional[int]]] = None) -> Dict[str, Any]:
+    """Embed (content, chunk_index) tuples and bulk-insert them into artifact_chunks, one call per batch.
+    pages: the PDF page each chunk starts on (parsing.chunk_pages), if known"""
+    stats = new_stats()
+    if not chunks:
+        return stats
+    sb = get_supabase_client()
+
+    def insert(idx, embs):
+        sb.table("artifact_chunks").insert([{
+            "org_id": org_id,
+            "project_id": project_id,
+            "artifact_id": artifact_id,
+            "content": chunks[i][0],
+            "chunk_index": chunks[i][1],
+            "embedding": e,
+            "page": pages[i] if pages else None
+        } for i, e in zip(idx, embs)]).execute()
+
+    await _run_batches([c[0] for c in chunks], insert, stats)
+    ask_cache.invalidate_project(org_id, project_id)
+    log.info(f"artifact {artifact_id}: embedded {stats['texts']} chunks in {stats['batches']} batches "
+             f"(embed {stats['embed_ms']:.0f}ms, insert {stats['insert_ms']:.0f}ms, total {stats['total_ms']:.0f}ms, "
+             f"retries {stats['retries']})")
+    return stats
+
+async def embed_and_store_mem_chunks(org_id: str, project_id: str,
+                                     entries: List[Tuple[str, str]]) -> Dict[str, Any]:
+    """Embed (mem_entry_id, content) pairs and bulk-insert them into mem_chunks, one call per batch"""
+    stats = new_stats()
+    if not entries:
+        return stats
+    sb = get_supabase_client()
+
+    def insert(idx, embs):
+        sb.table("mem_chunks").insert([{
+            "org_id": org_id,
+            "project_id": project_id,
+            "mem_entry_id": entries[i][0],
+            "content": entries[i][1],
+            "embedding": e
+        } for i, e in zip(idx, embs)]).execute()
+
+    await _run_batches([e[1] for e in entries], insert, stats)
+    log.info(f"mem_chunks: embedded {stats['texts']} memories in {stats['batches']} batches "
+             f"(embed {stats['embed_ms']:.0f}ms, insert {stats['insert_ms']:.0f}ms, total {stats['total_ms']:.0f}ms)")
+    return stats
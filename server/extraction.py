@@ -0,0 +1,432 @@
+# /server/extraction.py
+"""
+Combined document extraction.
+
+One prompt and one schema cover what used to take three model calls per
+document: the summary with risks/decisions/actions (mem_agent), the five
+memory types (mem_agent) and the PMO classification (classifier). Long
+documents are map-reduced: split into windows at paragraph boundaries,
+windows extracted concurrently (at most EXTRACT_CONCURRENCY calls in flight
+per worker), and the partial results merged and deduplicated.
+
+Window results are cached by sha256(model + prompt + window text) in the
+extraction_cache table (fronted by an in-process LRU). Window boundaries are
+content-defined, so after an edit only the windows around the change get new
+keys and re-ingesting the document re-extracts just those.
+
+The views at the bottom reshape a result for each consumer: the summaries
+row and actions, mem_entries, and updater.apply_updates.
+"""
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import openai
+
+from .models import MemoryExtraction
+
+# Same model mem_agent used for summaries and memories
+EXTRACT_MODEL = os.getenv("EXTRACT_MODEL", "gpt-5")
+EXTRACT_WINDOW_CHARS = int(os.getenv("EXTRACT_WINDOW_CHARS", "16000"))
+EXTRACT_MIN_WINDOW_CHARS = int(os.getenv("EXTRACT_MIN_WINDOW_CHARS", "6000"))
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "4"))
+EXTRACT_CACHE_ENABLED = os.getenv("EXTRACT_CACHE_ENABLED", "1") == "1"
+EXTRACT_CACHE_MEMORY_ITEMS = int(os.getenv("EXTRACT_CACHE_MEMORY_ITEMS", "512"))
+EXTRACT_CACHE_MAX_ROWS = int(os.getenv("EXTRACT_CACHE_MAX_ROWS", "50000"))
+
+log = logging.getLogger("extraction")
+
+MEMORY_TYPES = ("episodic", "semantic", "procedural", "decision", "affect")
+LIST_FIELDS = ("workstreams", "actions", "risks", "decisions", "integrations", "reporting_requests", "metrics")
+
+SYSTEM = """You are an expert Workday implementation consultant and PMO analyst.
+Return ONLY valid JSON that matches the provided schema. Use empty lists when nothing applies.
+confidence values are 0.0-1.0: how sure you are the item is stated in the text."""
+
+SCHEMA = """Schema:
+{
+ "doc_type": "sow|meeting_notes|status_report|design|requirements|email|other",
+ "summary": "concise summary of the text",
+ "workstreams":[{"name":"", "confidence":0.0, "action":"add|keep|drop", "description":""}],
+ "actions":[{"title":"what needs to be done", "owner":"who", "owner_email":"", "verb":"action verb", "due_date":"YYYY-MM-DD", "priority":"low|medium|high", "confidence":0.0}],
+ "risks":[{"text":"", "severity":"High|Medium|Low", "category":"technical|timeline|resource|other", "mitigation":"", "confidence":0.0}],
+ "decisions":[{"text":"", "status":"pending|made", "impact":"", "stakeholders":[""], "decided_on":"YYYY-MM-DD", "confidence":0.0}],
+ "integrations":[{"name":"", "transport":"SFTP|API|File|Other", "frequency":"daily|weekly|ad-hoc|other", "confidence":0.0}],
+ "reporting_requests":[{"text":"", "confidence":0.0}],
+ "logistics":{"cadence":"", "links":[""], "confidence":0.0},
+ "metrics":[{"name":"", "value":"", "confidence":0.0}],
+ "memories":{
+   "episodic":[{"event":"", "date":"", "participants":[""], "context":""}],
+   "semantic":[{"concept":"", "definition":"", "category":"workday_module|process|requirement|other"}],
+   "procedural":[{"process":"", "steps":[""], "triggers":[""], "outcomes":[""]}],
+   "decision":[{"decision":"", "rationale":"", "decider":"", "date":"", "impact":""}],
+   "affect":[{"sentiment":"positive|negative|neutral", "emotion":"", "source":"", "intensity":"low|medium|high"}]
+ }
+}"""
+
+# The client's connection pool and the semaphore belong to the event loop they are first used
+# on, so each loop gets its own; sync callers (classifier.classify_text) run on loops of their own
+_per_loop: Dict[Tuple[str, asyncio.AbstractEventLoop], Any] = {}
+_per_loop_lock = threading.Lock()
+
+def _for_loop(name: str, make):
+    loop = asyncio.get_running_loop()
+    with _per_loop_lock:
+        value = _per_loop.get((name, loop))
+        if value is None:
+            for key in [k for k in _per_loop if k[1].is_closed()]:
+                del _per_loop[key]
+            value = _per_loop[(name, loop)] = make()
+        return value
+
+def _get_client():
+    return _for_loop("client", openai.AsyncOpenAI)
+
+def empty_result(error: Optional[str] = None) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"doc_type": "other", "summary": "", "logistics": {},
+                           "memories": {t: [] for t in MEMORY_TYPES}}
+    for f in LIST_FIELDS:
+        out[f] = []
+    if error:
+        out["error"] = error
+    return out
+
+def _normalize(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Coerce a model response onto the schema (missing or mistyped fields become empty)"""
+    out = empty_result()
+    out["doc_type"] = str(raw.get("doc_type") or "other")
+    out["summary"] = str(raw.get("summary") or "")
+    for f in LIST_FIELDS:
+        v = raw.get(f)
+        out[f] = [x for x in v if isinstance(x, dict)] if isinstance(v, list) else []
+    if isinstance(raw.get("logistics"), dict):
+        out["logistics"] = raw["logistics"]
+    mems = raw.get("memories") if isinstance(raw.get("memories"), dict) else {}
+    for t in MEMORY_TYPES:
+        v = mems.get(t)
+        out["memories"][t] = [x for x in v if isinstance(x, dict)] if isinstance(v, list) else []
+    return out
+
+def _cut_after(para: str) -> bool:
+    """Content-defined boundary: depends only on the paragraph, so cuts re-align after an edit"""
+    return hashlib.sha1(para.encode("utf-8")).digest()[0] % 4 == 0
+
+def split_windows(text: str, max_chars: int = EXTRACT_WINDOW_CHARS,
+                  min_chars: int = EXTRACT_MIN_WINDOW_CHARS) -> List[str]:
+    """
+    Split at paragraph breaks into windows of at most max_chars (a longer paragraph is hard-split).
+    Past min_chars a window ends after any paragraph picked by _cut_after, so an edit
+    changes the windows around it rather than shifting every later boundary.
+    """
+    if len(text) <= max_chars:
+        return [text]
+    windows: List[str] = []
+    cur = ""
+    for para in re.split(r'\n\s*\n', text):
+        while len(para) > max_chars:
+            if cur:
+                windows.append(cur)
+                cur = ""
+            windows.append(para[:max_chars])
+            para = para[max_chars:]
+        if cur and len(cur) + 2 + len(para) > max_chars:
+            windows.append(cur)
+            cur = ""
+        cur = f"{cur}\n\n{para}" if cur else para
+        if len(cur) >= min_chars and _cut_after(para):
+            windows.append(cur)
+            cur = ""
+    if cur.strip():
+        windows.append(cur)
+    return [w for w in windows if w.strip()]
+
+_PROMPT_DIGEST = hashlib.sha256(f"{SYSTEM}\n{SCHEMA}".encode("utf-8")).hexdigest()[:16]
+
+def window_key(project_code: str, text: str) -> str:
+    return hashlib.sha256(f"{EXTRACT_MODEL}\n{_PROMPT_DIGEST}\n{project_code}\n{' '.join(text.split())}".encode("utf-8")).hexdigest()
+
+async def _extract_window(text: str, project_code: str) -> Dict[str, Any]:
+    # Only the project code and the window go into the prompt, so the result is cacheable by window_key
+    prompt = f"""Project: {project_code}
+
+{SCHEMA}
+
+Text:
+{text}"""
+    response = await _get_client().chat.completions.create(
+        model=EXTRACT_MODEL,
+        messages=[{"role": "system", "content": SYSTEM}, {"role": "user", "content": prompt}],
+        response_format={"type": "json_object"}
+    )
+    return _normalize(json.loads(response.choices[0].message.content))
+
+class ExtractionCache:
+    """Window results by window_key: in-process LRU in front of the extraction_cache table"""
+
+    def __init__(self, max_rows: int = EXTRACT_CACHE_MAX_ROWS, memory_items: int = EXTRACT_CACHE_MEMORY_ITEMS):
+        self.max_rows = max_rows
+        self.memory_items = memory_items
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stored": 0, "evicted": 0, "errors": 0}
+
+    def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for k in keys:
+                if k in self._mem:
+                    self._mem.move_to_end(k)
+                    found[k] = self._mem[k]
+            self._stats["memory_hits"] += len(found)
+
+        remaining = [k for k in keys if k not in found]
+        if remaining:
+            try:
+                from .db import get_conn
+                with get_conn() as conn, conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE extraction_cache SET last_used_at = now(), hits = hits + 1
+                        WHERE key = ANY(%s)
+                        RETURNING key, result::text
+                    """, (remaining,))
+                    rows = cur.fetchall()
+                db_found = {k: _normalize(json.loads(r)) for k, r in rows}
+                found.update(db_found)
+                self._remember(db_found)
+                with self._lock:
+                    self._stats["db_hits"] += len(db_found)
+            except Exception as e:
+                log.warning(f"extraction cache lookup failed: {e}")
+                with self._lock:
+                    self._stats["errors"] += 1
+
+        with self._lock:
+            self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: List[Tuple[str, Dict[str, Any]]]):
+        if not items:
+            return
+        self._remember(dict(items))
+        try:
+            from .db import get_conn
+            import psycopg2.extras
+            with get_conn() as conn, conn.cursor() as cur:
+                psycopg2.extras.execute_values(cur, """
+                    INSERT INTO extraction_cache (key, model, result)
+                    VALUES %s
+                    ON CONFLICT (key) DO UPDATE SET result = EXCLUDED.result, last_used_at = now()
+                """, [(k, EXTRACT_MODEL, json.dumps(r)) for k, r in items], template="(%s, %s, %s::jsonb)")
+                cur.execute("""
+                    DELETE FROM extraction_cache WHERE key IN (
+                        SELECT key FROM extraction_cache ORDER BY last_used_at DESC OFFSET %s
+                    )
+                """, (self.max_rows,))
+                with self._lock:
+                    self._stats["stored"] += len(items)
+                    self._stats["evicted"] += max(cur.rowcount, 0)
+        except Exception as e:
+            log.warning(f"extraction cache store failed: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            s = dict(self._stats)
+            s["memory_items"] = len(self._mem)
+        lookups = s["memory_hits"] + s["db_hits"] + s["misses"]
+        s["hit_rate"] = round((s["memory_hits"] + s["db_hits"]) / lookups, 4) if lookups else 0.0
+        return s
+
+    def _remember(self, entries: Dict[str, Dict[str, Any]]):
+        with self._lock:
+            for k, r in entries.items():
+                self._mem[k] = r
+                self._mem.move_to_end(k)
+            while len(self._mem) > self.memory_items:
+                self._mem.popitem(last=False)
+
+_cache = ExtractionCache()
+
+def get_extraction_cache() -> ExtractionCache:
+    return _cache
+
+def _get_semaphore() -> asyncio.Semaphore:
+    # Shared by all documents on this event loop, so concurrent ingests don't multiply the fan-out
+    return _for_loop("semaphore", lambda: asyncio.Semaphore(EXTRACT_CONCURRENCY))
+
+async def _map_windows(windows: List[str], project_code: str) -> Tuple[List[Dict[str, Any]], int]:
+    """Per-window results in order (cached ones reused, the rest extracted concurrently); returns (parts, extracted)"""
+    keys = [window_key(project_code, w) for w in windows]
+    found = await asyncio.to_thread(_cache.get_many, list(dict.fromkeys(keys))) if EXTRACT_CACHE_ENABLED else {}
+
+    missing: Dict[str, str] = {}
+    for k, w in zip(keys, windows):
+        if k not in found and k not in missing:
+            missing[k] = w
+
+    async def run(w: str) -> Dict[str, Any]:
+        async with _get_semaphore():
+            return await _extract_window(w, project_code)
+
+    if missing:
+        # Any failed window fails the document rather than silently dropping part of it
+        results = await asyncio.gather(*(run(w) for w in missing.values()))
+        fresh = list(zip(missing.keys(), results))
+        found.update(fresh)
+        if EXTRACT_CACHE_ENABLED:
+            await asyncio.to_thread(_cache.put_many, fresh)
+    return [found[k] for k in keys], len(missing)
+
+async def _condense_summaries(summaries: List[str], title: str) -> str:
+    """Reduce step for the summary: one short call over the partial summaries (joined if it fails)"""
+    joined = "\n".join(f"- {s}" for s in summaries if s)
+    try:
+        response = await _get_client().chat.completions.create(
+            model=EXTRACT_MODEL,
+            messages=[
+                {"role": "system", "content": "You summarize Workday implementation project documents."},
+                {"role": "user", "content": f"Document title: {title}\n\nThese are summaries of consecutive parts of one document. "
+                                            f"Write one concise summary of the whole document.\n\n{joined}"}
+            ]
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        log.warning(f"summary reduce failed for {title}: {e}")
+        return " ".join(s for s in summaries if s)
+
+# Fields identifying the same item across windows (first non-empty one wins)
+DEDUPE_KEYS = {
+    "workstreams": ("name",),
+    "actions": ("title",),
+    "risks": ("text",),
+    "decisions": ("text",),
+    "integrations": ("name",),
+    "reporting_requests": ("text",),
+    "metrics": ("name",),
+}
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+def _norm(value: Any) -> str:
+    return _NON_WORD.sub(" ", str(value).lower()).strip()
+
+def _item_key(field: str, item: Dict[str, Any]) -> str:
+    for k in DEDUPE_KEYS.get(field, ()):
+        if item.get(k):
+            return _norm(item[k])
+    return _norm(json.dumps(item, sort_keys=True))
+
+def _dedupe(field: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Merge items with the same key: keep the most confident one and fill its empty fields from the others"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        key = _item_key(field, item)
+        if not key:
+            continue
+        prev = merged.get(key)
+        if prev is None:
+            merged[key] = dict(item)
+            continue
+        if (item.get("confidence") or 0) > (prev.get("confidence") or 0):
+            item, prev = prev, dict(item)
+            merged[key] = prev
+        for k, v in item.items():
+            if v and not prev.get(k):
+                prev[k] = v
+    return list(merged.values())
+
+def reduce_results(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge per-window results: list fields and memories are concatenated and deduplicated,
+    doc_type is the most common one, logistics are merged
+    """
+    out = empty_result()
+    if not parts:
+        return out
+    types = [p["doc_type"] for p in parts if p["doc_type"] != "other"]
+    out["doc_type"] = max(types, key=types.count) if types else "other"
+    out["summary"] = parts[0]["summary"]
+    links: List[str] = []
+    for p in parts:
+        for f in LIST_FIELDS:
+            out[f].extend(p[f])
+        for t in MEMORY_TYPES:
+            out["memories"][t].extend(p["memories"][t])
+        lg = p.get("logistics") or {}
+        if lg.get("cadence") and not out["logistics"].get("cadence"):
+            out["logistics"]["cadence"] = lg["cadence"]
+        for link in lg.get("links") or []:
+            if link and link not in links:
+                links.append(link)
+        if lg:
+            out["logistics"]["confidence"] = max(out["logistics"].get("confidence", 0), lg.get("confidence", 0) or 0)
+    if links:
+        out["logistics"]["links"] = links
+    if len(parts) > 1:
+        for f in LIST_FIELDS:
+            out[f] = _dedupe(f, out[f])
+        for t in MEMORY_TYPES:
+            out["memories"][t] = _dedupe(t, out["memories"][t])
+    return out
+
+async def extract_document(text: str, title: str = "", project_code: str = "WD-PROJ") -> Dict[str, Any]:
+    """
+    Run the combined extraction once for a document.
+    Never raises: on failure returns empty_result() with an "error" key.
+    """
+    if not text or not text.strip():
+        return empty_result()
+    try:
+        windows = split_windows(text)
+        parts, extracted = await _map_windows(windows, project_code)
+        result = reduce_results(parts)
+        if len(parts) > 1:
+            result["summary"] = await _condense_summaries([p["summary"] for p in parts], title)
+        result["windows"] = len(windows)
+        result["windows_extracted"] = extracted
+        return result
+    except Exception as e:
+        log.error(f"extraction failed for {title}: {e}")
+        return empty_result(str(e))
+
+# ---- views: one result, shaped for each consumer ----
+
+def summary_view(result: Dict[str, Any], title: str = "") -> Dict[str, Any]:
+    """Shape of mem_agent.generate_summary_with_extractions (summaries row and actions table)"""
+    if result.get("error"):
+        return {
+            "summary": f"Failed to analyze document: {result['error']}",
+            "risks": [], "decisions": [], "actions": [],
+            "provenance": {"source": title, "extraction_method": "failed", "confidence": 0.0}
+        }
+    confs = [x.get("confidence", 0) or 0 for f in ("risks", "decisions", "actions") for x in result[f]]
+    return {
+        "summary": result["summary"],
+        "risks": [{"risk": r.get("text", ""), "severity": str(r.get("severity", "")).lower(),
+                   "category": r.get("category"), "mitigation": r.get("mitigation")} for r in result["risks"]],
+        "decisions": [{"decision": d.get("text", ""), "status": d.get("status"), "impact": d.get("impact"),
+                       "stakeholders": d.get("stakeholders") or []} for d in result["decisions"]],
+        "actions": [{"action": a.get("title", ""), "owner": a.get("owner") or a.get("owner_email"), "verb": a.get("verb"),
+                     "due_date": a.get("due_date"), "priority": a.get("priority")} for a in result["actions"]],
+        "provenance": {"source": title, "extraction_method": f"openai_{EXTRACT_MODEL}",
+                       "confidence": round(sum(confs) / len(confs), 2) if confs else 0.0}
+    }
+
+def memory_view(result: Dict[str, Any]) -> MemoryExtraction:
+    """Shape of mem_agent.extract_memories_from_text (mem_entries)"""
+    return MemoryExtraction(**{t: list(result["memories"][t]) for t in MEMORY_TYPES})
+
+def updates_view(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape of classifier.classify_text (updater.apply_updates)"""
+    out = {f: list(result[f]) for f in LIST_FIELDS}
+    out["doc_type"] = result["doc_type"]
+    out["summary"] = result["summary"]
+    out["logistics"] = dict(result["logistics"])
+    return out
@@ -32,6 +32,17 @@ async def resolve_project_id(
         detail=[{"loc": ["query", "project_id"], "msg": "Field required"}]
     )
 
+def project_membership(org_id: str, project_id: str, user_id: str):
+    """{"role", "can_sign"} from project_members, or None if not a member; cached, see authz_cache"""
+    from .authz_cache import cached
+    def load():
+        from .supabase_client import get_supabase_client
+        sb = get_supabase_client()
+        # RLS ensures we only see rows if member; this extra check gives a clean 403
+        result = sb.table("project_members").select("role, can_sign").eq("org_id", org_id).eq("project_id", project_id).eq("user_id", user_id).limit(1).execute()
+        return result.data[0] if result.data else None
+    return cached("membership", org_id, project_id, user_id, load)
+
 def member_ctx(project_id: str = Depends(resolve_project_id), ctx: TenantCtx = Depends(tenant_ctx)):
     """Fetch project membership and add role/can_sign to context"""
     
@@ -58,16 +69,11 @@ def member_ctx(project_id: str = Depends(resolve_project_id), ctx: TenantCtx = D
         return ctx
     
     try:
-        from .supabase_client import get_supabase_client
-        sb = get_supabase_client()
-        
-        # RLS ensures we only see rows if member; this extra check gives a clean 403
-        result = sb.table("project_members").select("role, can_sign").eq("org_id", ctx.org_id).eq("project_id", project_id).eq("user_id", ctx.user_id).limit(1).execute()
+        member_data = project_membership(ctx.org_id, project_id, ctx.user_id)
         
-        if not result.data:
+        if not member_data:
             raise HTTPException(403, "Not a member of this project")
         
-        member_data = result.data[0]
         ctx.role = member_data["role"]
         ctx.can_sign = member_data["can_sign"]
         return ctx
@@ -192,11 +198,14 @@ async def require_area_admin(area: str, project_id: str, ctx: TenantCtx):
     # PM+/Owner always allowed
     if ctx.role in ("owner","admin","pm"): return True
     try:
-        from .supabase_client import get_supabase_client
-        sb = get_supabase_client()
-        r = sb.table("area_admins").select("user_id").eq("org_id", ctx.org_id)\
-             .eq("project_id", project_id).eq("area", area).eq("user_id", ctx.user_id).limit(1).execute().data
-        return bool(r)
+        from .authz_cache import cached
+        def load():
+            from .supabase_client import get_supabase_client
+            sb = get_supabase_client()
+            r = sb.table("area_admins").select("user_id").eq("org_id", ctx.org_id)\
+                 .eq("project_id", project_id).eq("area", area).eq("user_id", ctx.user_id).limit(1).execute().data
+            return bool(r)
+        return cached("area_admin", ctx.org_id, project_id, ctx.user_id, load, extra=area)
     except Exception:
         return False  # fail-closed
 
@@ -0,0 +1,291 @@
+# /server/ingest_pipeline.py
+"""
+Synchronous ingest pipeline for a file already on disk and in storage.
+
+Shared by /ingest-sync and the reindex executor (reindex_executor.py), so a
+reindex runs in-process instead of POSTing the file back to /ingest-sync:
+parse -> PII redaction -> chunk -> embed -> artifact/chunks/summary writes
+-> classification -> SOW workstream bootstrap.
+
+Chunks are identified by chunk_hash(content). In incremental mode they are
+also cut at content-anchored boundaries (chunking.iter_chunks anchor_every),
+so an edit only changes the chunks around it, and the document is matched to
+its previous version (a given artifact_id, else the latest artifact with the
+same title) and updated in place: unchanged chunks keep their rows and
+embeddings, removed ones are deleted, and only new ones are embedded. The
+summary is replaced, and dashboard updates are extracted from the new chunks
+only, so re-ingesting doesn't republish what the previous version already did.
+Fresh uploads keep the plain boundaries; the first incremental re-ingest of a
+document ingested that way re-embeds it once.
+"""
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import datetime as dt
+from typing import Any, Dict, List, Optional, Tuple
+
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 200
+CHUNK_ANCHOR_EVERY = int(os.getenv("CHUNK_ANCHOR_EVERY", "6"))
+
+log = logging.getLogger("ingest_pipeline")
+
+SOW_AREAS = ["HCM","Recruiting","Talent","Compensation","Benefits","Time & Absence",
+             "Payroll","Finance","Projects","Procurement","Expenses",
+             "Security","Integrations","Reporting/Prism","Change Management",
+             "Training","Cutover","Data Conversion","Testing"]
+SOW_DEFAULT_AREAS = ["HCM","Payroll","Finance","Integrations","Security","Reporting","Cutover"]
+
+class IngestError(Exception):
+    """The file can't be ingested as given (e.g. text extraction failed)"""
+
+def chunk_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def meeting_date_from_filename(filename: str) -> Optional[str]:
+    """YYYY-MM-DD or YYYY_MM_DD in the filename, as an ISO date"""
+    m = re.search(r'(20\d{2})[-_](\d{2})[-_](\d{2})', filename or "")
+    if not m:
+        return None
+    try:
+        return dt.date(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
+    except ValueError:
+        return None  # Invalid date, leave as None
+
+def load_pii_policy(project_id: str):
+    from .pii_redaction import PiiPolicy
+    from .db import get_conn
+    pii_mode = "strict"
+    allow_domains = []
+    try:
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT pii_mode, allow_email_domains FROM project_settings WHERE project_id = %s",
+                (project_id,)
+            )
+            row = cur.fetchone()
+            if row:
+                pii_mode = row[0] or "strict"
+                allow_domains = row[1] if row[1] else []
+    except Exception:
+        pass  # Use defaults if policy not found
+    return PiiPolicy(mode=pii_mode, allow_email_domains=allow_domains)
+
+async def embed_chunks(chunk_texts: List[str]) -> List[List[float]]:
+    """Embeddings for chunk_texts, sending each distinct chunk once"""
+    from .embed_pipeline import embed_all
+    distinct = list(dict.fromkeys(chunk_texts))
+    by_text = dict(zip(distinct, await embed_all(distinct))) if distinct else {}
+    return [by_text[c] for c in chunk_texts]
+
+def find_previous_version(conn, org_id: str, project_id: str, filename: str,
+                          artifact_id: Optional[str] = None) -> Optional[str]:
+    """The artifact to update: artifact_id if it belongs to the project, else the latest with this title"""
+    with conn.cursor() as cur:
+        if artifact_id:
+            cur.execute("SELECT id FROM artifacts WHERE id = %s AND org_id = %s AND project_id = %s",
+                        (artifact_id, org_id, project_id))
+        else:
+            cur.execute("""
+                SELECT id FROM artifacts WHERE org_id = %s AND project_id = %s AND title = %s
+                ORDER BY created_at DESC LIMIT 1
+            """, (org_id, project_id, filename))
+        row = cur.fetchone()
+    return str(row[0]) if row else None
+
+def diff_chunks(old: List[Tuple[str, str, int]], new_hashes: List[str]):
+    """
+    Match new chunk hashes against old (row_id, hash, chunk_index) rows.
+    Returns (keep: [(row_id, new_index)] for rows whose index changed, add: [new positions], delete: [row_ids]).
+    """
+    by_hash: Dict[str, List[Tuple[str, int]]] = {}
+    for row_id, h, idx in old:
+        by_hash.setdefault(h, []).append((row_id, idx))
+    keep, add = [], []
+    for i, h in enumerate(new_hashes):
+        rows = by_hash.get(h)
+        if rows:
+            row_id, idx = rows.pop(0)
+            if idx != i:
+                keep.append((row_id, i))
+        else:
+            add.append(i)
+    delete = [row_id for rows in by_hash.values() for row_id, _ in rows]
+    return keep, add, delete
+
+def upsert_workstreams(org_id, project_id, items):
+    from .db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        # Soft-inactivate existing
+        cur.execute("update workstreams set is_active=false where org_id=%s and project_id=%s",
+                    (org_id, project_id))
+        # Insert fresh actives (keep up to 30)
+        for i,it in enumerate(items[:30]):
+            cur.execute("""
+              insert into workstreams (org_id, project_id, name, description, sort_order, is_active)
+              values (%s,%s,%s,%s,%s,true)
+            """, (org_id, project_id, it.get("name","")[:120], it.get("description","") or "", it.get("sort_order", i)))
+
+def _sow_bootstrap(org_id: str, project_id: str, filename: str, text: str):
+    """SOW-driven workstream bootstrap (legacy)"""
+    if not (filename.lower().startswith("sow") or "statement of work" in text[:300].lower()):
+        return
+    lower = text.lower()
+    found = [{"name": c} for c in SOW_AREAS if c.split("&")[0].split("/")[0].strip().lower() in lower]
+    if not found:
+        found = [{"name": n} for n in SOW_DEFAULT_AREAS]
+    upsert_workstreams(org_id, project_id, found[:30])
+
+async def ingest_file(org_id: str, project_id: str, path: str, filename: str, content_type: Optional[str],
+                      key: str, source: str = "doc", detected_type: Optional[str] = None,
+                      incremental: bool = False, artifact_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Ingest a stored file (key in the BUCKET storage bucket) read from path.
+
+    incremental: update the previous version of the document (artifact_id, else the
+    latest artifact titled filename) in place, embedding only new chunks and keeping its
+    source; without a previous version a new artifact is created as usual.
+
+    Returns {"artifact_id", "chunks", "embedded", "kept", "deleted", "updated"};
+    raises IngestError if no text can be extracted.
+    """
+    from .parsing import extract_text_and_pages, chunk_pages
+    from .pii_redaction import redact, redact_pages
+    from .chunking import iter_chunks
+    from .db import get_conn, insert_artifact, update_artifact_chunk_count, insert_chunks, insert_summary
+    from .ask_cache import invalidate_project as invalidate_ask_cache
+    from .extraction import extract_document, updates_view
+    from .updater import apply_updates
+    from .supabase_client import get_supabase_client
+
+    content_type = content_type or "application/octet-stream"
+    text, pages, error = await asyncio.to_thread(extract_text_and_pages, path, content_type, detected_type)
+    if error:
+        raise IngestError(f"Text extraction failed: {error}")
+
+    policy = await asyncio.to_thread(load_pii_policy, project_id)
+    if pages:
+        redacted_text, pii_summary, had_pii, pages = redact_pages(text, policy, pages)
+    else:
+        redacted_text, pii_summary, had_pii = redact(text, policy)
+
+    # Use redacted text for chunking and embedding
+    anchor_every = CHUNK_ANCHOR_EVERY if incremental else 0
+    chunks = list(iter_chunks(redacted_text, CHUNK_SIZE, CHUNK_OVERLAP, anchor_every=anchor_every)) \
+        if redacted_text.strip() else []
+    # PDF page each chunk starts on, for citations
+    chunk_page = chunk_pages(redacted_text, pages, chunks) if pages else [None] * len(chunks)
+    hashes = [chunk_hash(c) for c, _ in chunks]
+    meeting_date = meeting_date_from_filename(filename)
+
+    previous = None
+    if incremental:
+        def lookup():
+            with get_conn() as conn:
+                prev = find_previous_version(conn, org_id, project_id, filename, artifact_id)
+                if not prev:
+                    return None, []
+                with conn.cursor() as cur:
+                    cur.execute("SELECT id, content, chunk_index FROM artifact_chunks WHERE artifact_id = %s", (prev,))
+                    return prev, [(str(i), chunk_hash(c), idx) for i, c, idx in cur.fetchall()]
+        previous, old_rows = await asyncio.to_thread(lookup)
+
+    if previous:
+        keep, add, delete = diff_chunks(old_rows, hashes)
+    else:
+        keep, add, delete = [], list(range(len(chunks))), []
+    embs = await embed_chunks([chunks[i][0] for i in add])
+    rows = [{"chunk_index": i, "content": chunks[i][0], "embedding": e, "page": chunk_page[i]}
+            for i, e in zip(add, embs)]
+
+    # psycopg writes (bypass PostgREST)
+    def write():
+        import psycopg2.extras
+        with get_conn() as conn:
+            if previous:
+                # One transaction so readers never see a half-updated chunk set
+                with conn.cursor() as cur:
+                    cur.execute("BEGIN")
+                    if delete:
+                        cur.execute("DELETE FROM artifact_chunks WHERE id = ANY(%s::uuid[])", (delete,))
+                    if keep:
+                        psycopg2.extras.execute_values(cur, """
+                            UPDATE artifact_chunks c SET chunk_index = v.idx, page = v.page::integer
+                            FROM (VALUES %s) AS v(id, idx, page) WHERE c.id = v.id::uuid
+                        """, [(row_id, i, chunk_page[i]) for row_id, i in keep])
+                    # source stays as first ingested (upload, email, ...): a reindex or restore
+                    # updates the content, not where the document came from
+                    cur.execute("""
+                        UPDATE artifacts SET path = %s, mime_type = %s,
+                               meeting_date = coalesce(%s, meeting_date)
+                        WHERE id = %s
+                    """, (key, content_type, meeting_date, previous))
+                if rows:
+                    insert_chunks(conn, org_id, project_id, previous, rows)
+                update_artifact_chunk_count(conn, previous, len(chunks))
+                with conn.cursor() as cur:
+                    # Replace the previous version's summary rather than adding another
+                    cur.execute("DELETE FROM summaries WHERE artifact_id = %s AND level = 'artifact'", (previous,))
+                insert_summary(conn, org_id, project_id, previous, redacted_text[:2000])
+                with conn.cursor() as cur:
+                    cur.execute("COMMIT")
+                artifact_id = previous
+            else:
+                artifact_id = insert_artifact(
+                    conn, org_id, project_id, key, content_type, filename, source, meeting_date
+                )
+                if rows:
+                    insert_chunks(conn, org_id, project_id, artifact_id, rows)
+                update_artifact_chunk_count(conn, artifact_id, len(rows))
+
+                # Create summary (use redacted text)
+                insert_summary(conn, org_id, project_id, artifact_id, redacted_text[:2000])
+
+            # Store PII audit if PII was detected
+            if had_pii:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "INSERT INTO pii_audit (project_id, doc_id, summary) VALUES (%s, %s, %s)",
+                        (project_id, artifact_id, json.dumps(pii_summary))
+                    )
+            return artifact_id
+
+    artifact_id = await asyncio.to_thread(write)
+    invalidate_ask_cache(org_id, project_id)
+
+    # Document classification and dashboard updates. An updated document was classified and
+    # published when it was first ingested: extract from its new chunks only, if any.
+    extract_text = "\n\n".join(chunks[i][0] for i in add) if previous else text
+    try:
+        if extract_text.strip():
+            project_code = f"WD-{project_id[:8]}"
+            updates = updates_view(await extract_document(extract_text, filename, project_code))
+
+            # Apply updates to project dashboard (high confidence -> direct publish, low confidence -> review queue)
+            await asyncio.to_thread(apply_updates, org_id, project_id, artifact_id, project_code, updates)
+
+            # Log classification audit (once per artifact)
+            if not previous:
+                await asyncio.to_thread(lambda: get_supabase_client().table("ingestion_audit").insert({
+                    "org_id": org_id,
+                    "project_id": project_id,
+                    "artifact_id": artifact_id,
+                    "doc_type": updates.get("doc_type", "other"),
+                    "status": "classified"
+                }).execute())
+    except Exception as e:
+        log.error(f"Classification failed for {filename}: {e}")
+
+    try:
+        await asyncio.to_thread(_sow_bootstrap, org_id, project_id, filename, text)
+    except Exception:
+        pass
+
+    kept = len(chunks) - len(add)
+    log.info(f"ingested {filename} -> artifact {artifact_id} ({'updated' if previous else 'new'}): "
+             f"{len(chunks)} chunks, {len(add)} embedded, {kept} kept, {len(delete)} deleted")
+    return {"artifact_id": artifact_id, "chunks": len(chunks), "embedded": len(add), "kept": kept,
+            "deleted": len(delete), "updated": bool(previous)}
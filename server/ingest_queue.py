@@ -0,0 +1,405 @@
+# /server/ingest_queue.py
+"""
+Durable ingestion queue.
+
+/ingest stores the upload, creates the artifact and enqueues an ingest_jobs
+row. Workers claim jobs with FOR UPDATE SKIP LOCKED and run the pipeline
+stage by stage: parse, chunk, embed, extract, apply, classify. They run inside the
+API process (INGEST_WORKERS, 0 to disable) or standalone:
+
+    python -m server.ingest_queue --workers 4
+
+The row records the last completed stage. A retry recomputes the cheap
+stages (parse, chunk) and skips the ones whose writes already landed;
+extraction re-runs from its window cache (extraction.py). A stage that
+fails partway first deletes what it wrote for the artifact (chunks,
+summary/actions/memories, audit row), so a retry doesn't duplicate rows. Failures are
+retried with exponential backoff up to INGEST_MAX_ATTEMPTS, a job whose
+worker died is reclaimed when its lease runs out (and failed once that has
+used up its attempts), and at most INGEST_TENANT_CONCURRENCY jobs per org run
+at once across all workers.
+
+The API host keeps each upload spooled for a worker on the same host to
+read; its spool sweeper deletes the file once the job has finished on any host.
+"""
+import os
+import time
+import socket
+import asyncio
+import logging
+import datetime as dt
+from typing import Any, Dict, List, Optional
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_POLL_SEC = float(os.getenv("INGEST_POLL_SEC", "2"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "5"))
+INGEST_BACKOFF_BASE_SEC = int(os.getenv("INGEST_BACKOFF_BASE_SEC", "15"))
+INGEST_BACKOFF_MAX_SEC = int(os.getenv("INGEST_BACKOFF_MAX_SEC", "900"))
+INGEST_TENANT_CONCURRENCY = int(os.getenv("INGEST_TENANT_CONCURRENCY", "2"))
+INGEST_LEASE_SEC = int(os.getenv("INGEST_LEASE_SEC", "1800"))
+INGEST_SPOOL_SWEEP_SEC = int(os.getenv("INGEST_SPOOL_SWEEP_SEC", "300"))
+
+STAGES = ("parse", "chunk", "embed", "extract", "apply", "classify")
+
+# Claims are serialized on this advisory lock so the per-tenant running count can't race
+_CLAIM_LOCK_KEY = 0x696E6773
+
+log = logging.getLogger("ingest_queue")
+
+class PermanentJobError(Exception):
+    """Failure a retry can't fix (e.g. unsupported file type): the job fails without backoff"""
+
+def _rows(cur) -> List[Dict[str, Any]]:
+    cols = [d[0] for d in cur.description]
+    return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+def enqueue_ingest(org_id: str, project_id: str, artifact_id: str, storage_path: str, filename: str,
+                   content_type: Optional[str], detected_type: Optional[str] = None,
+                   sha256: Optional[str] = None, local_path: Optional[str] = None) -> str:
+    """
+    Queue an uploaded artifact for processing and return the job id.
+    local_path (the spooled upload) is used by a worker on the same host; others download storage_path.
+    """
+    from .db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO ingest_jobs (org_id, project_id, artifact_id, storage_path, filename, content_type,
+                                     detected_type, sha256, local_path, local_host, max_attempts)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        """, (org_id, project_id, artifact_id, storage_path, filename, content_type, detected_type,
+              sha256, local_path, socket.gethostname() if local_path else None, INGEST_MAX_ATTEMPTS))
+        return str(cur.fetchone()[0])
+
+def claim_job(worker_id: str) -> Optional[Dict[str, Any]]:
+    """Claim the next runnable job (pending and due, or running with an expired lease) under the tenant cap"""
+    from .db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        # Pool connections are autocommit: one explicit transaction so the lock is held
+        # before the running counts are read (a failure leaves it open and the pool rolls back)
+        cur.execute("BEGIN")
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (_CLAIM_LOCK_KEY,))
+        # A job that keeps killing its worker never reaches _finish: fail it once its lease
+        # expires with no attempts left, instead of reclaiming it forever
+        cur.execute("""
+            UPDATE ingest_jobs
+            SET status = 'failed', locked_by = NULL, locked_at = NULL, updated_at = now(), finished_at = now(),
+                last_error = 'Lease expired after ' || attempts || ' attempts (worker died)'
+                             || coalesce(': ' || last_error, '')
+            WHERE status = 'running' AND locked_at <= now() - make_interval(secs => %(lease)s)
+              AND attempts >= coalesce(max_attempts, %(max)s)
+        """, {"lease": INGEST_LEASE_SEC, "max": INGEST_MAX_ATTEMPTS})
+        cur.execute("""
+            WITH busy AS (
+                SELECT org_id, count(*) AS n FROM ingest_jobs
+                WHERE status = 'running' AND locked_at > now() - make_interval(secs => %(lease)s)
+                GROUP BY org_id
+            ), next AS (
+                SELECT j.id FROM ingest_jobs j
+                LEFT JOIN busy b ON b.org_id = j.org_id
+                WHERE ((j.status = 'pending' AND j.run_after <= now())
+                    OR (j.status = 'running' AND j.locked_at <= now() - make_interval(secs => %(lease)s)))
+                  AND coalesce(b.n, 0) < %(cap)s
+                ORDER BY j.run_after
+                LIMIT 1
+                FOR UPDATE OF j SKIP LOCKED
+            )
+            UPDATE ingest_jobs j
+            SET status = 'running', locked_by = %(worker)s, locked_at = now(),
+                attempts = j.attempts + 1, updated_at = now()
+            FROM next WHERE j.id = next.id
+            RETURNING j.*
+        """, {"lease": INGEST_LEASE_SEC, "cap": INGEST_TENANT_CONCURRENCY, "worker": worker_id})
+        rows = _rows(cur)
+        cur.execute("COMMIT")
+    return rows[0] if rows else None
+
+def _stage_done(job_id, worker_id: str, stage: str, ms: float):
+    """Record a completed stage and renew the lease"""
+    from .db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE ingest_jobs
+            SET stage = %s, stage_ms = coalesce(stage_ms, '{}'::jsonb) || jsonb_build_object(%s::text, %s::int),
+                locked_at = now(), updated_at = now()
+            WHERE id = %s AND locked_by = %s
+        """, (stage, stage, int(ms), job_id, worker_id))
+
+def _finish(job: Dict[str, Any], error: Optional[str] = None, permanent: bool = False) -> str:
+    """Mark done, schedule a retry with backoff, or fail; returns the new status"""
+    from .db import get_conn
+    if error is None:
+        status, run_after = "done", None
+    elif permanent or job["attempts"] >= (job.get("max_attempts") or INGEST_MAX_ATTEMPTS):
+        status, run_after = "failed", None
+    else:
+        delay = min(INGEST_BACKOFF_MAX_SEC, INGEST_BACKOFF_BASE_SEC * 2 ** (job["attempts"] - 1))
+        status, run_after = "pending", dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=delay)
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE ingest_jobs
+            SET status = %s, last_error = %s, run_after = coalesce(%s, run_after),
+                locked_by = NULL, locked_at = NULL, updated_at = now(),
+                finished_at = CASE WHEN %s IN ('done', 'failed') THEN now() END
+            WHERE id = %s
+        """, (status, error, run_after, status, job["id"]))
+    return status
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    from .db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, org_id, project_id, artifact_id, filename, status, stage, attempts, max_attempts,
+                   last_error, stage_ms, run_after, created_at, updated_at, finished_at
+            FROM ingest_jobs WHERE id = %s
+        """, (job_id,))
+        rows = _rows(cur)
+    return rows[0] if rows else None
+
+def _passed(job: Dict[str, Any], stage: str) -> bool:
+    """True if an earlier attempt already completed this stage"""
+    return job.get("stage") in STAGES and STAGES.index(job["stage"]) >= STAGES.index(stage)
+
+def _clear_extract(artifact_id: str):
+    """Delete the summary, actions and memories (with their chunks) a failed extract attempt may have written"""
+    from .db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("BEGIN")
+        cur.execute("""
+            DELETE FROM mem_chunks
+            WHERE mem_entry_id IN (SELECT id FROM mem_entries WHERE artifact_id = %s)
+        """, (artifact_id,))
+        cur.execute("DELETE FROM mem_entries WHERE artifact_id = %s", (artifact_id,))
+        cur.execute("DELETE FROM actions WHERE artifact_id = %s", (artifact_id,))
+        cur.execute("DELETE FROM summaries WHERE artifact_id = %s", (artifact_id,))
+        cur.execute("COMMIT")
+
+def _open_source(job: Dict[str, Any]):
+    """(path, detected_type, downloaded): the spooled upload if it is on this host, else a download from storage"""
+    path = job.get("local_path")
+    if path and job.get("local_host") == socket.gethostname() and os.path.exists(path):
+        return path, job.get("detected_type"), False
+    from .supabase_client import get_supabase_storage_client
+    from .uploads import spool_iter
+    data = get_supabase_storage_client().download(job["storage_path"])
+    spooled = spool_iter([data], suffix=os.path.splitext(job.get("filename") or "")[1])
+    return spooled.path, spooled.mime, True
+
+async def run_job(job: Dict[str, Any], worker_id: str):
+    """Run the pipeline for a claimed job, skipping stages an earlier attempt completed"""
+    from .supabase_client import get_supabase_client
+    from .parsing import extract_text_and_pages, chunk_pages
+    from .chunking import chunk_text
+    from .embed_pipeline import embed_and_store_chunks, embed_and_store_mem_chunks
+    from .extraction import extract_document, summary_view, memory_view, updates_view
+    from .updater import apply_updates
+
+    org_id, project_id, artifact_id = str(job["org_id"]), str(job["project_id"]), str(job["artifact_id"])
+    filename = job.get("filename") or ""
+    supabase = get_supabase_client()
+
+    def done(stage, started):
+        # Never move the recorded stage backwards when a retry recomputes parse/chunk
+        if not _passed(job, stage):
+            _stage_done(job["id"], worker_id, stage, (time.perf_counter() - started) * 1000)
+
+    path, detected_type, downloaded = await asyncio.to_thread(_open_source, job)
+    try:
+        t = time.perf_counter()
+        text, pages, error = await asyncio.to_thread(extract_text_and_pages, path, job.get("content_type"), detected_type)
+        if error:
+            raise PermanentJobError(f"Text extraction error: {error}")
+        await asyncio.to_thread(done, "parse", t)
+    finally:
+        if downloaded:
+            os.unlink(path)
+
+    t = time.perf_counter()
+    chunks = chunk_text(text)
+    chunk_page = chunk_pages(text, pages, chunks) if pages else None
+    await asyncio.to_thread(done, "chunk", t)
+
+    if not _passed(job, "embed"):
+        t = time.perf_counter()
+        # Drop chunks a failed attempt may have inserted part of
+        await asyncio.to_thread(lambda: supabase.table("artifact_chunks").delete().eq("artifact_id", artifact_id).execute())
+        embed_stats = await embed_and_store_chunks(org_id, project_id, artifact_id, chunks, chunk_page)
+        await asyncio.to_thread(lambda: supabase.table("artifacts").update({
+            "chunk_count": embed_stats["texts"]
+        }).eq("id", artifact_id).execute())
+        await asyncio.to_thread(done, "embed", t)
+
+    # One combined extraction, fanned out to summaries, actions, mem_entries and apply_updates
+    t = time.perf_counter()
+    project_code = f"WD-{project_id[:8]}"
+    extraction = await extract_document(text, filename, project_code)
+    if extraction.get("error"):
+        raise RuntimeError(f"Extraction failed: {extraction['error']}")
+
+    if not _passed(job, "extract"):
+        # Drop rows a failed attempt may have written before re-inserting them
+        await asyncio.to_thread(_clear_extract, artifact_id)
+        summary_data = summary_view(extraction, filename)
+        await asyncio.to_thread(lambda: supabase.table("summaries").insert({
+            "org_id": org_id,
+            "project_id": project_id,
+            "artifact_id": artifact_id,
+            "summary": summary_data["summary"],
+            "risks": summary_data["risks"],
+            "decisions": summary_data["decisions"],
+            "actions": summary_data["actions"],
+            "provenance": summary_data["provenance"]
+        }).execute())
+
+        action_rows = [{
+            "org_id": org_id,
+            "project_id": project_id,
+            "artifact_id": artifact_id,
+            "title": a["action"],
+            "description": a.get("description", ""),
+            "owner": a.get("owner"),
+            "verb": a.get("verb"),
+            "due_date": a.get("due_date"),
+            "extracted_from": filename
+        } for a in summary_data["actions"]]
+        if action_rows:
+            await asyncio.to_thread(lambda: supabase.table("actions").insert(action_rows).execute())
+
+        # Store memory entries in one insert, then embed their chunks in batches
+        mem_rows = [{
+            "org_id": org_id,
+            "project_id": project_id,
+            "type": mem_type,
+            "content": mem_data,
+            "artifact_id": artifact_id
+        } for mem_type, mem_list in memory_view(extraction).dict().items() for mem_data in mem_list]
+        if mem_rows:
+            mem_result = await asyncio.to_thread(lambda: supabase.table("mem_entries").insert(mem_rows).execute())
+            await embed_and_store_mem_chunks(org_id, project_id, [
+                (entry["id"], str(row["content"])) for entry, row in zip(mem_result.data, mem_rows)
+            ])
+        await asyncio.to_thread(done, "extract", t)
+
+    # Classification fields from the same extraction; the summary and actions
+    # were written above, so apply_updates only publishes/queues the rest.
+    # It is recorded as its own stage so a failed audit write doesn't re-publish.
+    updates = updates_view(extraction)
+    updates["summary"] = ""
+    updates["actions"] = []
+    if not _passed(job, "apply"):
+        t = time.perf_counter()
+        await asyncio.to_thread(apply_updates, org_id, project_id, artifact_id, project_code, updates)
+        await asyncio.to_thread(done, "apply", t)
+
+    t = time.perf_counter()
+    def audit():
+        supabase.table("ingestion_audit").delete().eq("artifact_id", artifact_id).eq("status", "classified").execute()
+        supabase.table("ingestion_audit").insert({
+            "org_id": org_id,
+            "project_id": project_id,
+            "artifact_id": artifact_id,
+            "doc_type": updates.get("doc_type", "other"),
+            "status": "classified"
+        }).execute()
+    await asyncio.to_thread(audit)
+    await asyncio.to_thread(done, "classify", t)
+    log.info(f"ingest job {job['id']}: {filename} classified {updates.get('doc_type')} with "
+             f"{len(extraction['actions'])} actions, {len(extraction['risks'])} risks")
+
+async def process_job(job: Dict[str, Any], worker_id: str):
+    error, permanent = None, False
+    try:
+        await run_job(job, worker_id)
+    except PermanentJobError as e:
+        error, permanent = str(e), True
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    try:
+        status = await asyncio.to_thread(_finish, job, error, permanent)
+    except Exception as e:
+        # The lease expires and another worker picks the job up again
+        log.error(f"ingest job {job['id']}: could not record result: {e}")
+        return
+    if error:
+        log.warning(f"ingest job {job['id']} attempt {job['attempts']} -> {status}: {error}")
+    if status in ("done", "failed") and job.get("local_path") and job.get("local_host") == socket.gethostname():
+        try:
+            os.unlink(job["local_path"])
+        except OSError:
+            pass
+
+async def worker_loop(worker_id: str):
+    """Claim and run jobs one at a time until cancelled"""
+    while True:
+        try:
+            job = await asyncio.to_thread(claim_job, worker_id)
+        except Exception as e:
+            log.warning(f"ingest worker {worker_id}: claim failed: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(INGEST_POLL_SEC)
+            continue
+        await process_job(job, worker_id)
+
+def sweep_spool() -> int:
+    """Delete this host's spooled uploads whose jobs have finished, on whichever host; returns files removed"""
+    from .db import get_conn
+    removed = 0
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, local_path FROM ingest_jobs
+            WHERE local_host = %s AND local_path IS NOT NULL AND status IN ('done', 'failed')
+        """, (socket.gethostname(),))
+        rows = cur.fetchall()
+        for _, path in rows:
+            try:
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass  # already removed by a worker on this host
+            except OSError as e:
+                log.warning(f"spool sweep: could not remove {path}: {e}")
+        if rows:
+            cur.execute("UPDATE ingest_jobs SET local_path = NULL WHERE id = ANY(%s::uuid[])",
+                        ([str(job_id) for job_id, _ in rows],))
+    return removed
+
+async def spool_sweeper(interval: float = INGEST_SPOOL_SWEEP_SEC):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await asyncio.to_thread(sweep_spool)
+            if removed:
+                log.info(f"spool sweep: removed {removed} finished upload(s)")
+        except Exception as e:
+            log.warning(f"spool sweep failed: {e}")
+
+# The loop only keeps weak references to tasks
+_tasks: "set[asyncio.Task]" = set()
+
+def _keep(task: asyncio.Task) -> asyncio.Task:
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+def start_workers(n: int = INGEST_WORKERS) -> List[asyncio.Task]:
+    """Start n worker tasks on the running loop"""
+    base = f"{socket.gethostname()}:{os.getpid()}"
+    return [_keep(asyncio.create_task(worker_loop(f"{base}:{i}"))) for i in range(n)]
+
+def start_spool_sweeper() -> asyncio.Task:
+    """Run the spool sweeper on the host that spools uploads (the API process)"""
+    return _keep(asyncio.create_task(spool_sweeper()))
+
+async def _run_standalone(n: int):
+    tasks = start_workers(n)
+    log.info(f"ingest worker process started with {n} workers")
+    await asyncio.gather(*tasks)
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Run ingestion queue workers")
+    ap.add_argument("--workers", type=int, default=max(INGEST_WORKERS, 1))
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_run_standalone(args.workers))
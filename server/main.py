@@ -1,5 +1,4 @@
 import os
-import tempfile
 import asyncio
 import logging
 import json
@@ -9,10 +8,10 @@ from pathlib import Path
 from typing import List, Dict, Any
 
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Request, Query, Body, Depends
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Query, Body, Depends
 from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import aiofiles
 
 # Configure logging
@@ -26,14 +25,15 @@ from .supabase_client import get_supabase_client, get_supabase_storage_client
 from .db import get_conn
 from .tenant import TenantCtx, require_project_member, require_project_admin
 from .parsing import extract_text_from_file, validate_file_safety
+from .uploads import spool_upload, upload_spooled, UploadTooLarge
 from .chunking import chunk_text
-from .mem_agent import extract_memories_from_text, generate_summary_with_extractions, calculate_wellness_score, should_create_wellness_signal
-from .rag import answer_with_citations, embed_texts
+from .mem_agent import calculate_wellness_score, should_create_wellness_signal
+from .extraction import extract_document, summary_view, memory_view
+from .rag import aanswer_with_citations, astream_answer_with_citations, embed_texts
 from .onboarding_send import send_onboarding_email, ONBOARDING_TEMPLATES
 from .email_send import get_mailgun_status
-from .classifier import classify_text
-from .updater import apply_updates
-from .scheduler import digest_scheduler
+from .ingest_pipeline import ingest_file, IngestError, upsert_workstreams as _ws_upsert_psycopg
+from .ingest_queue import enqueue_ingest, get_job, start_workers as start_ingest_workers, start_spool_sweeper, INGEST_WORKERS
 
 app = FastAPI(title="TEAIM API", description="Workday Implementation Hub API")
 
@@ -335,9 +335,13 @@ app.include_router(audit_export_router, prefix="")
 app.include_router(share_links_pub_router, prefix="/api")
 
 # Add the new rate limiting middleware first  
-from .rate_limit import RateLimitMiddleware
+from .rate_limit import RateLimitMiddleware, check_rate_limit, limiter_stats, get_telemetry
 app.add_middleware(RateLimitMiddleware)
 
+# Per-request memo for membership/visibility lookups (authz_cache)
+from .authz_cache import AuthzScopeMiddleware
+app.add_middleware(AuthzScopeMiddleware)
+
 # CORS middleware - restrict origins for security
 app.add_middleware(
     CORSMiddleware,
@@ -347,23 +351,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Rate limiting storage (in production, use Redis)
-request_counts = {}
-
-def check_rate_limit(client_ip: str, endpoint: str, limit: int = 10) -> bool:
-    """Simple rate limiting - replace with proper solution in production"""
-    key = f"{client_ip}:{endpoint}"
-    now = datetime.now()
-    hour_key = now.strftime("%Y%m%d%H")
-    full_key = f"{key}:{hour_key}"
-    
-    count = request_counts.get(full_key, 0)
-    if count >= limit:
-        return False
-    
-    request_counts[full_key] = count + 1
-    return True
-
 async def log_audit(org_id: str = None, project_id: str = None, user_id: str = None, 
                    action: str = "", details: Dict = None, ip_address: str = "", user_agent: str = ""):
     """Log audit trail"""
@@ -388,7 +375,6 @@ async def health_check():
 
 @app.post("/ingest")
 async def ingest_document(
-    background_tasks: BackgroundTasks,
     request: Request,
     org_id: str = Form(...),
     project_id: str = Form(...),
@@ -398,7 +384,7 @@ async def ingest_document(
     
     # Rate limiting
     client_ip = request.client.host
-    if not check_rate_limit(client_ip, "ingest", limit=5):
+    if not await check_rate_limit(client_ip, "ingest", limit=5):
         raise HTTPException(status_code=429, detail="Rate limit exceeded")
     
     # Validate file
@@ -406,24 +392,24 @@ async def ingest_document(
         raise HTTPException(status_code=400, detail="No file provided")
     
     try:
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
+        # Spool to a temporary file in chunks (hashing + MIME sniffing on the way)
+        try:
+            spooled = await spool_upload(file, suffix=Path(file.filename).suffix)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        tmp_path = spooled.path
         
         # Validate file safety
-        is_safe, error_msg = validate_file_safety(tmp_path)
+        is_safe, error_msg = validate_file_safety(tmp_path, detected_type=spooled.mime)
         if not is_safe:
             os.unlink(tmp_path)
             raise HTTPException(status_code=400, detail=error_msg)
         
-        # Upload to Supabase storage
+        # Upload to Supabase storage (streamed from the spool file)
         storage = get_supabase_storage_client()
         bucket_path = f"{org_id}/{project_id}/{file.filename}"
         
-        with open(tmp_path, 'rb') as f:
-            storage.upload(bucket_path, f.read())
+        await asyncio.to_thread(upload_spooled, storage, bucket_path, spooled, file.content_type)
         
         # Parse meeting date from filename (YYYY-MM-DD or YYYY_MM_DD format)
         import re
@@ -446,29 +432,35 @@ async def ingest_document(
             "title": file.filename,
             "path": bucket_path,
             "mime_type": file.content_type,
-            "size": len(content),
+            "size": spooled.size,
             "uploaded_by": "00000000-0000-0000-0000-000000000000",  # TODO: Get from auth
             "meeting_date": meeting_date
         }).execute()
         
         artifact_id = artifact_result.data[0]["id"]
         
-        # Schedule background processing
-        background_tasks.add_task(
-            process_document_background,
-            tmp_path, artifact_id, org_id, project_id, file.filename, file.content_type
+        # Queue processing. With in-process workers the spool file is reused on this host;
+        # otherwise the (standalone) workers download the stored copy
+        local_path = tmp_path if INGEST_WORKERS > 0 else None
+        job_id = await asyncio.to_thread(
+            enqueue_ingest, org_id, project_id, artifact_id, bucket_path, file.filename,
+            file.content_type, spooled.mime, spooled.sha256, local_path
         )
+        if local_path is None:
+            spooled.remove()
         
         await log_audit(
             org_id=org_id,
             project_id=project_id,
             action="document_upload",
-            details={"filename": file.filename, "size": len(content)},
+            details={"filename": file.filename, "size": spooled.size, "sha256": spooled.sha256},
             ip_address=client_ip
         )
         
-        return {"artifact_id": artifact_id, "status": "uploaded", "processing": "background"}
+        return {"artifact_id": artifact_id, "job_id": job_id, "status": "uploaded", "processing": "queued"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         if 'tmp_path' in locals():
             os.unlink(tmp_path)
@@ -479,14 +471,23 @@ async def ingest_sync(
     org_id: str = Form(...),
     project_id: str = Form(...),
     source: str = Form("doc"),
+    incremental: bool = Form(False),
+    artifact_id: Optional[str] = Form(None),
     file: UploadFile = File(...)
 ):
-    """Ingest and process document synchronously (no background jobs)"""
+    """
+    Ingest and process document synchronously (no background jobs)
+    incremental: update the previous version (artifact_id, else the latest artifact with this
+    filename) in place, embedding only the chunks that changed
+    """
     try:
         from uuid import uuid4
         
-        # Read file data
-        data = await file.read()
+        # Spool the upload to disk; the same file is streamed to storage and parsed
+        try:
+            spooled = await spool_upload(file, suffix=Path(file.filename).suffix)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
         
         # Setup storage with unique key to prevent conflicts
         supabase = get_supabase_client()
@@ -494,198 +495,26 @@ async def ingest_sync(
         safe_filename = file.filename.replace(" ", "_").replace("/", "_")
         key = f"{project_id}/{uuid4().hex}_{safe_filename}"
         
-        # 1) Store file (v2 signature with unique key)
-        supabase.storage.from_(BUCKET).upload(
-            path=key,
-            file=data,
-            file_options={"content-type": file.content_type or "application/octet-stream"}
-        )
-        
-        # 2) Parse -> chunk -> embed first
-        # Create temporary file for text extraction (function expects file path)
-        import tempfile
-        from pathlib import Path
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-            tmp_file.write(data)
-            tmp_path = tmp_file.name
-        
         try:
-            text, error = extract_text_from_file(tmp_path, file.content_type or "application/octet-stream")
-            if error:
-                raise HTTPException(status_code=400, detail=f"Text extraction failed: {error}")
+            # 1) Store file (v2 signature with unique key)
+            await asyncio.to_thread(upload_spooled, supabase.storage.from_(BUCKET), key, spooled, file.content_type)
             
-            # Load PII policy and apply redaction
-            from .pii_redaction import redact, PiiPolicy
-            from .db import get_conn
-            pii_mode = "strict"
-            allow_domains = []
-            had_pii = False
-            pii_summary = {}
-            
-            try:
-                with get_conn() as conn:
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            "SELECT pii_mode, allow_email_domains FROM project_settings WHERE project_id = %s",
-                            (project_id,)
-                        )
-                        row = cur.fetchone()
-                        if row:
-                            pii_mode = row[0] or "strict"
-                            allow_domains = row[1] if row[1] else []
-            except:
-                pass  # Use defaults if policy not found
-            
-            policy = PiiPolicy(mode=pii_mode, allow_email_domains=allow_domains)
-            redacted_text, pii_summary, had_pii = redact(text, policy)
-            
-            # Use redacted text for chunking and embedding
-            chunks = chunk_text(redacted_text, 1200, 200)
-            # Extract text content from tuples (chunks are returned as (content, index))
-            chunk_texts = [chunk[0] for chunk in chunks] if chunks else []
-            embs = embed_texts(chunk_texts) if chunk_texts else []
+            # 2) Parse -> redact -> chunk -> embed -> DB writes -> classification (ingest_pipeline.py)
+            result = await ingest_file(
+                org_id, project_id, spooled.path, file.filename, file.content_type, key,
+                source=source, detected_type=spooled.mime,
+                incremental=incremental or bool(artifact_id), artifact_id=artifact_id
+            )
+        except IngestError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         finally:
             # Clean up temp file
-            try:
-                os.unlink(tmp_path)
-            except:
-                pass
-        
-        # 3) Parse meeting date from filename (YYYY-MM-DD or YYYY_MM_DD format)
-        import re
-        import datetime as dt
-        meeting_date = None
-        if file.filename:
-            # Look for date patterns in filename
-            m = re.search(r'(20\d{2})[-_](\d{2})[-_](\d{2})', file.filename)
-            if m:
-                try:
-                    meeting_date = dt.date(int(m.group(1)), int(m.group(2)), int(m.group(3))).isoformat()
-                except:
-                    pass  # Invalid date, leave as None
-        
-        # 4) DB writes - use psycopg to bypass PostgREST schema cache issues
-        WRITE_MODE = "psycopg"  # Force psycopg due to PostgREST schema cache issues
-        
-        if WRITE_MODE == "rest":
-            # REST writes via PostgREST with automatic fallback
-            try:
-                art = supabase.table("artifacts").insert({
-                    "org_id": org_id,
-                    "project_id": project_id,
-                    "path": key,
-                    "mime_type": file.content_type,
-                    "title": file.filename,
-                    "source": source,
-                    "size": len(data),
-                    "uploaded_by": "00000000-0000-0000-0000-000000000000",
-                    "meeting_date": meeting_date
-                }).execute().data[0]
-                
-                artifact_id = art["id"]
-            except Exception as rest_error:
-                # Automatic fallback to psycopg if PostgREST fails
-                logging.warning(f"PostgREST failed, falling back to psycopg: {rest_error}")
-                WRITE_MODE = "psycopg"
-            
-            if WRITE_MODE == "rest":
-                # Insert chunks in batches via PostgREST
-                rows = [{
-                    "org_id": org_id,
-                    "project_id": project_id,
-                    "artifact_id": artifact_id,
-                    "chunk_index": chunk[1],  # Use actual chunk index from tuple
-                    "content": chunk[0],      # Use chunk content from tuple
-                    "embedding": e
-                } for chunk, e in zip(chunks, embs)]
-                
-                if rows:
-                    for i in range(0, len(rows), 200):
-                        supabase.table("artifact_chunks").insert(rows[i:i+200]).execute()
-                
-                # Update artifact with chunk count
-                supabase.table("artifacts").update({"chunk_count": len(rows)}).eq("id", artifact_id).execute()
-                
-                # Create summary
-                supabase.table("summaries").insert({
-                    "org_id": org_id,
-                    "project_id": project_id,
-                    "artifact_id": artifact_id,
-                    "level": "artifact",
-                    "summary": text[:2000]
-                }).execute()
-            
-        if WRITE_MODE == "psycopg":
-            # psycopg writes (bypass PostgREST)
-            from .db import get_conn, insert_artifact, update_artifact_chunk_count, insert_chunks, insert_summary
-            
-            with get_conn() as conn:
-                artifact_id = insert_artifact(
-                    conn, org_id, project_id, key, file.content_type, file.filename, source, meeting_date
-                )
-                
-                # Prepare chunk rows for psycopg  
-                rows = [{
-                    "chunk_index": chunk[1],  # Use actual chunk index from tuple
-                    "content": chunk[0],      # Use chunk content from tuple
-                    "embedding": e
-                } for chunk, e in zip(chunks, embs)]
-                
-                if rows:
-                    insert_chunks(conn, org_id, project_id, artifact_id, rows)
-                update_artifact_chunk_count(conn, artifact_id, len(rows))
-                
-                # Create summary (use redacted text)
-                insert_summary(conn, org_id, project_id, artifact_id, redacted_text[:2000])
-                
-                # Store PII audit if PII was detected
-                if had_pii:
-                    import json
-                    with conn.cursor() as cur:
-                        cur.execute(
-                            "INSERT INTO pii_audit (project_id, doc_id, summary) VALUES (%s, %s, %s)",
-                            (project_id, artifact_id, json.dumps(pii_summary))
-                        )
-        
-        # 4) Document classification and dashboard updates
-        try:
-            # Extract structured project updates using GPT classification
-            project_code = f"WD-{project_id[:8]}"
-            updates = classify_text(text, project_code)
-            
-            # Apply updates to project dashboard (high confidence -> direct publish, low confidence -> review queue)
-            apply_updates(org_id, project_id, artifact_id, project_code, updates)
-            
-            # Log classification audit
-            supabase.table("ingestion_audit").insert({
-                "org_id": org_id,
-                "project_id": project_id, 
-                "artifact_id": artifact_id,
-                "doc_type": updates.get("doc_type", "other"),
-                "status": "classified"
-            }).execute()
-            
-        except Exception as e:
-            logging.error(f"Classification failed for {file.filename}: {e}")
-        
-        # SOW-driven bootstrap functionality (legacy)
-        try:
-            if file.filename.lower().startswith("sow") or "statement of work" in (text[:300].lower()):
-                # call your bootstrap endpoint directly (without HTTP)
-                CANDIDATES = ["HCM","Recruiting","Talent","Compensation","Benefits","Time & Absence",
-                              "Payroll","Finance","Projects","Procurement","Expenses",
-                              "Security","Integrations","Reporting/Prism","Change Management",
-                              "Training","Cutover","Data Conversion","Testing"]
-                found = [{"name": c} for c in CANDIDATES if c.split("&")[0].split("/")[0].strip().lower() in text.lower()]
-                if not found:
-                    found = [{"name": n} for n in ["HCM","Payroll","Finance","Integrations","Security","Reporting","Cutover"]]
-                # persist with fallback
-                _ws_upsert_psycopg(org_id, project_id, found[:30])
-        except Exception:
-            pass
+            spooled.remove()
         
-        return {"ok": True, "artifact_id": artifact_id, "chunks": len(rows)}
+        return {"ok": True, **result}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -693,11 +522,11 @@ async def ingest_sync(
 def diag_db():
     """Test database connectivity"""
     try:
-        from .db import get_conn
+        from .db import get_conn, pool_stats
         with get_conn() as conn, conn.cursor() as cur:
             cur.execute("select 1")
             ok = cur.fetchone()[0] == 1
-        return {"ok": ok}
+        return {"ok": ok, "pool": pool_stats()}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
@@ -726,133 +555,13 @@ def diag_storage():
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
-async def process_document_background(tmp_path: str, artifact_id: str, org_id: str, 
-                                    project_id: str, filename: str, content_type: str):
-    """Background task to process uploaded document"""
-    try:
-        # Extract text
-        text, error = extract_text_from_file(tmp_path, content_type)
-        if error:
-            print(f"Text extraction error for {filename}: {error}")
-            return
-        
-        # Generate chunks
-        chunks = chunk_text(text)
-        
-        # Generate embeddings and store chunks
-        supabase = get_supabase_client()
-        chunk_count = 0
-        
-        for chunk_text, chunk_index in chunks:
-            try:
-                embedding = embed_texts([chunk_text])[0]
-                
-                supabase.table("artifact_chunks").insert({
-                    "org_id": org_id,
-                    "project_id": project_id,
-                    "artifact_id": artifact_id,
-                    "content": chunk_text,
-                    "chunk_index": chunk_index,
-                    "embedding": embedding
-                }).execute()
-                
-                chunk_count += 1
-            except Exception as e:
-                print(f"Error processing chunk {chunk_index}: {e}")
-        
-        # Generate summary
-        summary_data = await generate_summary_with_extractions(text, filename)
-        
-        supabase.table("summaries").insert({
-            "org_id": org_id,
-            "project_id": project_id,
-            "artifact_id": artifact_id,
-            "summary": summary_data["summary"],
-            "risks": summary_data["risks"],
-            "decisions": summary_data["decisions"],
-            "actions": summary_data["actions"],
-            "provenance": summary_data["provenance"]
-        }).execute()
-        
-        # Extract and store actions
-        for action_data in summary_data["actions"]:
-            supabase.table("actions").insert({
-                "org_id": org_id,
-                "project_id": project_id,
-                "artifact_id": artifact_id,
-                "title": action_data["action"],
-                "description": action_data.get("description", ""),
-                "owner": action_data.get("owner"),
-                "verb": action_data.get("verb"),
-                "due_date": action_data.get("due_date"),
-                "extracted_from": filename
-            }).execute()
-        
-        # Extract memories
-        memories = await extract_memories_from_text(text, filename)
-        
-        # Store memory entries and chunks
-        for mem_type, mem_list in memories.dict().items():
-            for mem_data in mem_list:
-                # Create memory entry
-                mem_result = supabase.table("mem_entries").insert({
-                    "org_id": org_id,
-                    "project_id": project_id,
-                    "type": mem_type,
-                    "content": mem_data,
-                    "artifact_id": artifact_id
-                }).execute()
-                
-                mem_entry_id = mem_result.data[0]["id"]
-                
-                # Create searchable chunk for this memory
-                mem_text = str(mem_data)
-                mem_embedding = embed_texts([mem_text])[0]
-                
-                supabase.table("mem_chunks").insert({
-                    "org_id": org_id,
-                    "project_id": project_id,
-                    "mem_entry_id": mem_entry_id,
-                    "content": mem_text,
-                    "embedding": mem_embedding
-                }).execute()
-        
-        # 5) Document classification and dashboard updates (background processing)
-        try:
-            # Extract structured project updates using GPT classification
-            project_code = f"WD-{project_id[:8]}"
-            updates = classify_text(text, project_code)
-            
-            # Apply updates to project dashboard
-            apply_updates(org_id, project_id, artifact_id, project_code, updates)
-            
-            # Log classification audit
-            supabase.table("ingestion_audit").insert({
-                "org_id": org_id,
-                "project_id": project_id,
-                "artifact_id": artifact_id,
-                "doc_type": updates.get("doc_type", "other"),
-                "status": "classified"
-            }).execute()
-            
-            print(f"Document classified: {updates.get('doc_type')} with {len(updates.get('actions', []))} actions, {len(updates.get('risks', []))} risks")
-            
-        except Exception as e:
-            print(f"Classification failed for {filename}: {e}")
-        
-        # Update artifact with chunk count
-        supabase.table("artifacts").update({
-            "chunk_count": chunk_count
-        }).eq("id", artifact_id).execute()
-        
-    except Exception as e:
-        print(f"Background processing error for {filename}: {e}")
-    finally:
-        # Clean up temp file
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
+@app.get("/ingest/jobs/{job_id}")
+def ingest_job_status(job_id: str):
+    """Ingestion job state: status, last completed stage, attempts, per-stage timings"""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.get("/artifacts")
 def list_artifacts(org_id: str = Query(...), project_id: str = Query(...), limit: int = 50):
@@ -904,43 +613,47 @@ def list_artifacts(org_id: str = Query(...), project_id: str = Query(...), limit
         out.append(r)
     return {"artifacts": out}
 
+def _citations(chunks):
+    """Create citations from retrieved chunks"""
+    citations = []
+    for i, chunk in enumerate(chunks):
+        citations.append({
+            "id": f"Artifact-{i+1}",
+            "type": "artifact", 
+            "title": chunk.get('title', 'Unknown Document'),
+            "artifact_id": chunk.get('artifact_id')
+        })
+    return citations
+
 @app.post("/ask", response_model=AskResponse)
 async def ask_question(request: Request, ask_request: AskRequest):
     """Ask questions with RAG over project artifacts and memories"""
     
     # Rate limiting
     client_ip = request.client.host
-    if not check_rate_limit(client_ip, "ask", limit=20):
+    if not await check_rate_limit(client_ip, "ask", limit=20):
         raise HTTPException(status_code=429, detail="Rate limit exceeded")
     
     try:
-        # Use the new answer_with_citations function with fallback
-        answer, chunks = answer_with_citations(
+        # Async RAG path: model and DB calls don't block the event loop
+        answer, chunks = await aanswer_with_citations(
             ask_request.org_id, 
             ask_request.project_id, 
             ask_request.question, 
             k=ask_request.k
         )
         
-        # Create citations from chunks
-        citations = []
-        for i, chunk in enumerate(chunks):
-            citations.append({
-                "id": f"Artifact-{i+1}",
-                "type": "artifact", 
-                "title": chunk.get('title', 'Unknown Document'),
-                "artifact_id": chunk.get('artifact_id')
-            })
-        
-        # Audit logging with safer error handling
+        citations = _citations(chunks)
+        
+        # Audit logging with safer error handling (sync client, so off the event loop)
         try:
             supabase = get_supabase_client()
-            supabase.table("audit_log").insert({
+            await asyncio.to_thread(supabase.table("audit_log").insert({
                 "org_id": ask_request.org_id,
                 "project_id": ask_request.project_id,
                 "action": "ask",
                 "details": {"q": ask_request.question, "hits": len(chunks)}
-            }).execute()
+            }).execute)
         except Exception:
             logging.exception("audit_log insert failed")
         
@@ -958,6 +671,55 @@ async def ask_question(request: Request, ask_request: AskRequest):
             context_sufficient=False
         )
 
+@app.post("/ask/stream")
+async def ask_question_stream(request: Request, ask_request: AskRequest):
+    """Server-sent events variant of /ask: citations first, then answer tokens as they arrive"""
+    
+    client_ip = request.client.host
+    if not await check_rate_limit(client_ip, "ask", limit=20):
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+    
+    def sse(event: str, data) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    async def events():
+        gen = astream_answer_with_citations(
+            ask_request.org_id, ask_request.project_id, ask_request.question, k=ask_request.k,
+            is_disconnected=request.is_disconnected
+        )
+        hits = 0
+        try:
+            async for kind, payload in gen:
+                if await request.is_disconnected():
+                    # Stop pulling tokens; closing gen closes the upstream completion
+                    break
+                if kind == "citations":
+                    hits = len(payload)
+                    yield sse("citations", {"citations": _citations(payload), "context_sufficient": hits > 0})
+                elif kind == "token":
+                    yield sse("token", {"text": payload})
+                else:
+                    yield sse("done", payload)
+        except Exception:
+            logging.exception("/ask/stream crashed")
+            yield sse("error", {"message": "Server error while answering. Check logs."})
+        finally:
+            await gen.aclose()
+        
+        try:
+            supabase = get_supabase_client()
+            await asyncio.to_thread(supabase.table("audit_log").insert({
+                "org_id": ask_request.org_id,
+                "project_id": ask_request.project_id,
+                "action": "ask",
+                "details": {"q": ask_request.question, "hits": hits, "stream": True}
+            }).execute)
+        except Exception:
+            logging.exception("audit_log insert failed")
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/diag/index-stats")
 def index_stats(org_id: str = Query(...), project_id: str = Query(...)):
     """Get index statistics for debugging"""
@@ -979,6 +741,53 @@ def index_stats(org_id: str = Query(...), project_id: str = Query(...)):
         except Exception as e:
             return {"error": str(e), "artifacts": -1, "chunks": -1, "via": "error"}
 
+@app.get("/diag/embed-cache")
+def diag_embed_cache():
+    """Embedding cache hit/miss counters for this worker"""
+    from .embed_cache import get_embedding_cache, EMBED_CACHE_ENABLED
+    return {"enabled": EMBED_CACHE_ENABLED, **get_embedding_cache().stats()}
+
+@app.get("/diag/extraction-cache")
+def diag_extraction_cache():
+    """Extraction window cache hit/miss counters for this worker"""
+    from .extraction import get_extraction_cache, EXTRACT_CACHE_ENABLED, EXTRACT_CONCURRENCY
+    return {"enabled": EXTRACT_CACHE_ENABLED, "concurrency": EXTRACT_CONCURRENCY, **get_extraction_cache().stats()}
+
+@app.get("/diag/ask-cache")
+def diag_ask_cache(org_id: Optional[str] = Query(None), project_id: Optional[str] = Query(None)):
+    """/ask answer and question-embedding cache stats, optionally for one project"""
+    from .ask_cache import cache_stats
+    return cache_stats(org_id, project_id)
+
+@app.get("/diag/scheduler")
+def diag_scheduler():
+    """Background jobs on this worker: leader/listener state, next run, last run and errors"""
+    from .sched_core import get_scheduler
+    return get_scheduler().status()
+
+@app.get("/diag/authz-cache")
+def diag_authz_cache():
+    """Membership/role/visibility lookup cache: hit rates (per request and TTL), size, invalidations"""
+    from .authz_cache import get_authz_cache
+    return get_authz_cache().stats()
+
+@app.get("/diag/auth-cache")
+def diag_auth_cache():
+    """Verified JWT claims cache: hits, misses, rejected tokens, size"""
+    from .tenant import jwt_cache_stats
+    return jwt_cache_stats()
+
+@app.get("/diag/supabase")
+def diag_supabase():
+    """Supabase client registry: service client reuse, user clients, HTTP connection reuse"""
+    from .supabase_client import supabase_stats
+    return supabase_stats()
+
+@app.get("/diag/rate-limit")
+def diag_rate_limit():
+    """Rate limiter backend, bucket count and telemetry queue stats"""
+    return limiter_stats()
+
 @app.get("/diag/openai")
 def diag_openai():
     """Test OpenAI connectivity"""
@@ -1337,7 +1146,7 @@ async def email_webhook(request: Request):
     
     # Rate limiting
     client_ip = request.client.host
-    if not check_rate_limit(client_ip, "email_webhook", limit=50):
+    if not await check_rate_limit(client_ip, "email_webhook", limit=50):
         raise HTTPException(status_code=429, detail="Rate limit exceeded")
     
     try:
@@ -1543,18 +1352,6 @@ def dashboard_integrations(
 
     return {"integrations": items}
 
-def _ws_upsert_psycopg(org_id, project_id, items):
-    with get_conn() as conn, conn.cursor() as cur:
-        # Soft-inactivate existing
-        cur.execute("update workstreams set is_active=false where org_id=%s and project_id=%s",
-                    (org_id, project_id))
-        # Insert fresh actives (keep up to 30)
-        for i,it in enumerate(items[:30]):
-            cur.execute("""
-              insert into workstreams (org_id, project_id, name, description, sort_order, is_active)
-              values (%s,%s,%s,%s,%s,true)
-            """, (org_id, project_id, it.get("name","")[:120], it.get("description","") or "", it.get("sort_order", i)))
-
 @app.get("/workstreams")
 def list_workstreams(
     project_id: str = Query(...), 
@@ -1802,9 +1599,12 @@ async def email_inbound_dev(request: Request):
                         # Extract structured information
                         classified = classify_content(text)
                         
+                        # One combined extraction for the summary and the memories
+                        extraction = await extract_document(text, att['name'])
+                        
                         # Generate summary with extractions
                         try:
-                            summary_data = await generate_summary_with_extractions(text)
+                            summary_data = summary_view(extraction, att['name'])
                             
                             # Insert summary
                             cursor.execute(
@@ -1821,7 +1621,7 @@ async def email_inbound_dev(request: Request):
                         
                         # Extract memories
                         try:
-                            memories_result = await extract_memories_from_text(text)
+                            memories_result = memory_view(extraction)
                             # Handle both list and single memory results
                             memories = memories_result if isinstance(memories_result, list) else [memories_result]
                             if memories and memories[0]:  # Check if we have actual memories
@@ -2062,16 +1862,17 @@ async def list_onboarding_templates():
 # Startup event to launch the digest scheduler
 @app.on_event("startup")
 async def _start_sched():
-    from .scheduler import reindex_worker, integrations_tick, reminders_tick, revoke_expired_nightly, process_comms_queue, schedule_breach_soon_nudges_nightly, schedule_owner_digest_morning, auto_archive_closed_crs_nightly
-    asyncio.create_task(digest_scheduler(app))
-    asyncio.create_task(reindex_worker(app))
-    asyncio.create_task(integrations_tick(app))
-    asyncio.create_task(reminders_tick(app))
-    asyncio.create_task(revoke_expired_nightly())
-    asyncio.create_task(process_comms_queue())
-    asyncio.create_task(schedule_breach_soon_nudges_nightly())
-    asyncio.create_task(schedule_owner_digest_morning())
-    asyncio.create_task(auto_archive_closed_crs_nightly())
+    from .scheduler import start_scheduler
+    # Event-driven: queue jobs wake on NOTIFY, timed jobs run from one heap, singletons on the leader only
+    start_scheduler(app)
+    # Ingestion workers (set INGEST_WORKERS=0 when running `python -m server.ingest_queue` separately)
+    start_ingest_workers(INGEST_WORKERS)
+    # Uploads spooled on this host are deleted here once their jobs finish, wherever they ran
+    start_spool_sweeper()
+
+@app.on_event("shutdown")
+async def _flush_telemetry():
+    await get_telemetry().flush()
 
 if __name__ == "__main__":
     uvicorn.run(
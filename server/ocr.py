@@ -0,0 +1,206 @@
+# /server/ocr.py
+"""
+Page-parallel OCR for scanned PDFs.
+
+Pages are rendered by a single pdftoppm process (ImageMagick as a fallback);
+each page image is handed to a process pool running tesseract as soon as
+the renderer reports it written, so rendering and OCR overlap. Results are
+returned keyed by page number (1-based) and callers join them in page order.
+
+Settings:
+  OCR_WORKERS           tesseract processes (default: CPU count, max 4)
+  OCR_DPI               render resolution (default 300)
+  OCR_PAGE_TIMEOUT_SEC  render + OCR budget per page (default 90); a document
+                        gets one deadline of this budget per OCR_WORKERS pages
+
+If a worker dies (BrokenProcessPool) the pool is rebuilt and the pages it
+took down are retried once.
+"""
+import os
+import time
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_PAGE_TIMEOUT_SEC = int(os.getenv("OCR_PAGE_TIMEOUT_SEC", "90"))
+TESSERACT_CONFIG = "--psm 3 --oem 3"
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ProcessPoolExecutor:
+    """Process pool shared by all OCR jobs in this process (spawned lazily)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: workers must not inherit the server's threads, sockets or DB pool
+                _executor = ProcessPoolExecutor(max_workers=OCR_WORKERS,
+                                                mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+def _replace_executor(broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+    """Swap out a pool whose worker died (another job may already have done it)"""
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+    return get_executor()
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def ocr_image_file(image_path: str, remove: bool = False) -> str:
+    """Worker: OCR one page image (optionally deleting it afterwards to keep the spool small)"""
+    import pytesseract
+    from PIL import Image
+    try:
+        with Image.open(image_path) as img:
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            return pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
+    finally:
+        if remove:
+            try:
+                os.remove(image_path)
+            except OSError:
+                pass
+
+def page_runs(pages: Iterable[int]) -> List[Tuple[int, int]]:
+    """Collapse page numbers into contiguous (first, last) ranges for the renderer"""
+    runs: List[Tuple[int, int]] = []
+    for p in sorted(set(pages)):
+        if runs and p == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], p)
+        else:
+            runs.append((p, p))
+    return runs
+
+def _render_pdftoppm(file_path: str, first: int, last: Optional[int], out_dir: str, dpi: int) -> Iterator[Tuple[int, str]]:
+    """Yield (page, png_path) as pdftoppm finishes each page (-progress reports them on stderr).
+
+    last=None renders to the end of the document."""
+    cmd = ["pdftoppm", "-r", str(dpi), "-png", "-progress", "-f", str(first)]
+    if last is not None:
+        cmd += ["-l", str(last)]
+    cmd += [file_path, os.path.join(out_dir, f"p{first}")]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    # Kill the renderer if it stalls on a single page for longer than the per-page budget
+    progress = [time.monotonic()]
+    def watchdog():
+        while proc.poll() is None:
+            if time.monotonic() - progress[0] > OCR_PAGE_TIMEOUT_SEC:
+                print(f"pdftoppm stalled on {file_path}, killing it")
+                proc.kill()
+                return
+            time.sleep(1)
+    threading.Thread(target=watchdog, daemon=True).start()
+    try:
+        for line in proc.stderr:
+            progress[0] = time.monotonic()
+            # "<page> <last page> <file>"
+            parts = line.strip().split(" ", 2)
+            if len(parts) == 3 and parts[0].isdigit() and os.path.exists(parts[2]):
+                yield int(parts[0]), parts[2]
+        if proc.wait() != 0:
+            print(f"pdftoppm exited with {proc.returncode} for {file_path}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+def _render_imagemagick(tool: str, file_path: str, pages: Iterable[int], out_dir: str, dpi: int) -> Iterator[Tuple[int, str]]:
+    """ImageMagick renders one page per call (it has no progress stream)"""
+    for page in pages:
+        out = os.path.join(out_dir, f"page_{page}.png")
+        cmd = [tool, "-density", str(dpi), "-quality", "100", f"{file_path}[{page - 1}]", out]
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=OCR_PAGE_TIMEOUT_SEC)
+        except subprocess.TimeoutExpired:
+            print(f"{tool} timed out rendering page {page} of {file_path}")
+            continue
+        if result.returncode != 0 or not os.path.exists(out):
+            print(f"{tool} conversion failed for page {page}: {result.stderr}")
+            continue
+        yield page, out
+
+def render_pages(tool: str, file_path: str, pages: Optional[List[int]], out_dir: str, dpi: int) -> Iterator[Tuple[int, str]]:
+    """Render the given pages (None: every page) and yield them as they are written"""
+    if tool == "pdftoppm":
+        if pages is None:
+            yield from _render_pdftoppm(file_path, 1, None, out_dir, dpi)
+        for first, last in page_runs(pages or []):
+            yield from _render_pdftoppm(file_path, first, last, out_dir, dpi)
+    elif pages is None:
+        # Page count unknown: one ImageMagick call for the whole document
+        cmd = [tool, "-density", str(dpi), "-quality", "100", file_path, os.path.join(out_dir, "page_%d.png")]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{tool} conversion failed: {result.stderr}")
+        names = [n for n in os.listdir(out_dir) if n.startswith("page_") and n.endswith(".png")]
+        for n in sorted(names, key=lambda n: int(n[5:-4])):
+            yield int(n[5:-4]) + 1, os.path.join(out_dir, n)
+    else:
+        yield from _render_imagemagick(tool, file_path, pages, out_dir, dpi)
+
+def _collect(futures: Dict[int, Future], deadline: float) -> Tuple[Dict[int, str], List[int]]:
+    """Wait for the futures until the deadline; returns ({page: text}, pages lost to a broken pool)"""
+    _, pending = wait(futures.values(), timeout=max(0.0, deadline - time.monotonic()))
+    results: Dict[int, str] = {}
+    lost: List[int] = []
+    for page, future in sorted(futures.items()):
+        if future in pending:
+            future.cancel()
+            print(f"OCR timed out for page {page}")
+        elif future.cancelled() or isinstance(future.exception(), BrokenProcessPool):
+            lost.append(page)
+        elif future.exception() is not None:
+            print(f"OCR failed for page {page}: {future.exception()}")
+        else:
+            results[page] = future.result()
+    return results, lost
+
+def ocr_pdf_pages(file_path: str, pages: Optional[List[int]], tool: str, dpi: Optional[int] = None) -> Dict[int, str]:
+    """
+    OCR the given 1-based pages of a PDF (None: all pages) in parallel.
+    Returns {page: text}; pages that fail to render or OCR are left out.
+    """
+    if pages is not None and not pages:
+        return {}
+    started = time.monotonic()
+    executor = get_executor()
+    futures: Dict[int, Future] = {}
+    images: Dict[int, str] = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Submit each page as soon as it is on disk; tesseract runs while later pages render
+        for page, image_path in render_pages(tool, file_path, pages, temp_dir, dpi or OCR_DPI):
+            images[page] = image_path
+            try:
+                futures[page] = executor.submit(ocr_image_file, image_path, True)
+            except BrokenProcessPool:
+                executor = _replace_executor(executor)
+                futures[page] = executor.submit(ocr_image_file, image_path, True)
+        # One deadline for the document: the per-page budget for each round of OCR_WORKERS pages
+        rounds = max(1, -(-len(futures) // OCR_WORKERS))
+        deadline = started + OCR_PAGE_TIMEOUT_SEC * rounds
+        results, lost = _collect(futures, deadline)
+        if lost:
+            # A worker died and took these pages with it; their images are still on disk
+            print(f"OCR pool broke on {file_path}, retrying {len(lost)} page(s)")
+            executor = _replace_executor(executor)
+            retry = {page: executor.submit(ocr_image_file, images[page], True) for page in lost}
+            retried, lost = _collect(retry, deadline)
+            results.update(retried)
+            for page in lost:
+                print(f"OCR failed for page {page}: worker pool broke again")
+    return results
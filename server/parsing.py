@@ -1,12 +1,14 @@
 import os
+import re
 import magic
-import tempfile
-import subprocess
 import shutil
+from bisect import bisect_right
+from functools import lru_cache
 from pypdf import PdfReader
 from docx import Document
 # import mailparser  # Commented out due to dependency issues
-from typing import Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
+from .ocr import ocr_pdf_pages
 
 # OCR dependencies
 try:
@@ -17,50 +19,198 @@ except ImportError:
     OCR_AVAILABLE = False
     print("Warning: OCR libraries not available. Image processing will be disabled.")
 
-def extract_text_from_file(file_path: str, content_type: str) -> Tuple[str, Optional[str]]:
+# Pages with fewer text-layer characters than this are treated as scanned and OCR'd
+OCR_MIN_PAGE_CHARS = int(os.getenv("OCR_MIN_PAGE_CHARS", "100"))
+
+def extract_text_from_file(file_path: str, content_type: str, detected_type: Optional[str] = None) -> Tuple[str, Optional[str]]:
     """
     Extract text from various file formats
     Returns (extracted_text, error_message)
+    detected_type: MIME type already sniffed by the caller (e.g. uploads.SpooledUpload.mime)
+    """
+    text, _, error = extract_text_and_pages(file_path, content_type, detected_type)
+    return text, error
+
+def extract_text_and_pages(file_path: str, content_type: str,
+                           detected_type: Optional[str] = None) -> Tuple[str, Optional[List[Dict[str, Any]]], Optional[str]]:
+    """
+    extract_text_from_file, plus the page offsets of PDFs (extract_pdf()["pages"], else None)
+    Returns (extracted_text, pages, error_message)
     """
     try:
         # Verify content type with python-magic
-        detected_type = magic.from_file(file_path, mime=True)
+        detected_type = detected_type or detect_mime_type(file_path)
         
         if content_type == "application/pdf" or detected_type == "application/pdf":
-            # Use OCR-enhanced PDF extraction if available
-            if OCR_AVAILABLE:
-                return extract_pdf_text_with_ocr(file_path), None
-            else:
-                return extract_pdf_text(file_path), None
+            # One parse; OCR (if available) only for the pages that need it
+            pdf = extract_pdf(file_path)
+            return pdf["text"], pdf["pages"], None
         elif content_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document", 
                              "application/msword"] or "word" in detected_type:
-            return extract_docx_text(file_path), None
+            return extract_docx_text(file_path), None, None
         elif content_type == "message/rfc822" or detected_type == "message/rfc822":
-            return extract_eml_text(file_path), None
+            return extract_eml_text(file_path), None, None
         elif content_type == "text/plain" or detected_type.startswith("text/"):
-            return extract_txt_text(file_path), None
+            return extract_txt_text(file_path), None, None
         elif content_type == "text/vtt":
-            return extract_vtt_text(file_path), None
+            return extract_vtt_text(file_path), None, None
         elif is_image_type(content_type) or is_image_type(detected_type):
             if OCR_AVAILABLE:
-                return extract_image_text_ocr(file_path), None
+                return extract_image_text_ocr(file_path), None, None
             else:
-                return "", "OCR not available for image processing"
+                return "", None, "OCR not available for image processing"
         else:
-            return "", f"Unsupported file type: {content_type} (detected: {detected_type})"
+            return "", None, f"Unsupported file type: {content_type} (detected: {detected_type})"
     except Exception as e:
-        return "", f"Error extracting text: {str(e)}"
+        return "", None, f"Error extracting text: {str(e)}"
+
+@lru_cache(maxsize=256)
+def _mime_for(file_path: str, size: int, mtime_ns: int) -> str:
+    return magic.from_file(file_path, mime=True)
+
+def detect_mime_type(file_path: str) -> str:
+    """python-magic MIME type, sniffed once per file version (validation and parsing share it)"""
+    st = os.stat(file_path)
+    return _mime_for(file_path, st.st_size, st.st_mtime_ns)
+
+# Inline image operator (BI ... ID ... EI) in a content stream
+_INLINE_IMAGE = re.compile(rb'(?:^|\s)BI\s')
+
+def _page_resources(page):
+    """The page's /Resources, inherited from the nearest /Pages ancestor if the page has none"""
+    node = page
+    while node is not None:
+        resources = node.get("/Resources")
+        if resources is not None:
+            return resources.get_object()
+        parent = node.get("/Parent")
+        node = parent.get_object() if parent is not None else None
+    return None
+
+def _page_has_images(page) -> bool:
+    """
+    False only if the page provably draws no images: no image (or form) XObjects in its
+    resources, inherited ones included, and no inline images in its content stream.
+    Nothing is decoded; anything that can't be checked counts as an image, so OCR decides.
+    """
+    try:
+        resources = _page_resources(page)
+        xobjects = resources.get("/XObject") if resources is not None else None
+        if xobjects is not None:
+            for ref in xobjects.get_object().values():
+                if ref.get_object().get("/Subtype") in ("/Image", "/Form"):
+                    return True
+        contents = page.get_contents()
+        return contents is not None and _INLINE_IMAGE.search(contents.get_data()) is not None
+    except Exception:
+        return True
+
+def extract_pdf(file_path: str, use_ocr: Optional[bool] = None, ocr_pages: Optional[List[int]] = None,
+                dpi: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Single-parse PDF extraction.
+
+    The file is opened with PdfReader once; each page's text layer and its
+    "needs OCR" decision (little text, unless the page provably has no
+    images) come from that parse. Only those pages (or `ocr_pages`, 1-based) are rendered and OCR'd.
+
+    Returns {"text", "pages": [{"page", "start", "end", "ocr"}], "ocr_pages"},
+    where start/end are the page's character offsets in text.
+    """
+    use_ocr = OCR_AVAILABLE if use_ocr is None else (use_ocr and OCR_AVAILABLE)
+    page_texts: Optional[List[str]] = None
+    needs_ocr: List[int] = []
+    try:
+        with open(file_path, 'rb') as file:
+            reader = PdfReader(file)
+            page_texts = []
+            for i, page in enumerate(reader.pages, start=1):
+                # Handle None return values from page.extract_text()
+                page_text = page.extract_text() or ""
+                page_texts.append(page_text)
+                if len(page_text.strip()) < OCR_MIN_PAGE_CHARS and _page_has_images(page):
+                    needs_ocr.append(i)
+    except Exception as e:
+        print(f"Regular PDF extraction failed for {file_path}: {e}")
+        if not use_ocr:
+            raise
+
+    ocr_texts: Dict[int, str] = {}
+    if use_ocr:
+        # Unparseable text layer: let the renderer find the pages and OCR all of them
+        pages = ocr_pages if ocr_pages is not None else (needs_ocr if page_texts is not None else None)
+        if pages is None or pages:
+            tool = detect_pdf_conversion_tool()
+            if not tool:
+                print("No PDF-to-image conversion tool available (pdftoppm, convert, or magick)")
+            else:
+                print(f"OCR'ing {'all' if pages is None else len(pages)} page(s) of {file_path}")
+                try:
+                    ocr_texts = ocr_pdf_pages(file_path, pages, tool, dpi)
+                except Exception as e:
+                    print(f"PDF OCR processing failed for {file_path}: {e}")
+
+    page_count = len(page_texts) if page_texts is not None else max(ocr_texts, default=0)
+    parts: List[str] = []
+    pages_out: List[Dict[str, Any]] = []
+    pos = 0
+    for i in range(1, page_count + 1):
+        ocr_text = ocr_texts.get(i, "").strip()
+        layer_text = page_texts[i - 1].strip() if page_texts is not None else ""
+        # Keep the text layer if OCR came back empty
+        page_text = ocr_text or layer_text
+        if parts:
+            pos += 1  # "\n" separator
+        pages_out.append({"page": i, "start": pos, "end": pos + len(page_text), "ocr": bool(ocr_text)})
+        parts.append(page_text)
+        pos += len(page_text)
+    return {"text": "\n".join(parts), "pages": pages_out, "ocr_pages": sorted(ocr_texts)}
+
+def page_at(pages: List[Dict[str, Any]], offset: int) -> Optional[int]:
+    """Page number containing a character offset of extract_pdf()["text"]"""
+    starts = [p["start"] for p in pages]
+    i = bisect_right(starts, offset) - 1
+    return pages[i]["page"] if i >= 0 else None
+
+def chunk_pages(text: str, pages: List[Dict[str, Any]], chunks: List[Tuple[str, int]],
+                words: int = 12) -> List[Optional[int]]:
+    """
+    Page number each chunk starts on, for chunking.iter_chunks(text) output.
+
+    Chunks hold cleaned text (whitespace collapsed, non-ASCII dropped), so the pages
+    are cleaned the same way and each chunk is located by its first few words,
+    searching forward from the previous chunk's start.
+    """
+    from .chunking import clean_text
+    cleaned: List[Dict[str, Any]] = []
+    parts: List[str] = []
+    pos = 0
+    for p in pages:
+        page_text = clean_text(text[p["start"]:p["end"]])
+        if not page_text:
+            continue
+        if parts:
+            pos += 1
+        cleaned.append({"page": p["page"], "start": pos})
+        parts.append(page_text)
+        pos += len(page_text)
+    flat = " ".join(parts)
+
+    out: List[Optional[int]] = []
+    cursor = 0
+    page = cleaned[0]["page"] if cleaned else None
+    for content, _ in chunks:
+        head = content.split()[:words]
+        m = re.compile(" +".join(map(re.escape, head))).search(flat, cursor) if head else None
+        if m:
+            cursor = m.start() + 1
+            page = page_at(cleaned, m.start())
+        out.append(page)
+    return out
 
 def extract_pdf_text(file_path: str) -> str:
     """Extract text from PDF file"""
-    text = ""
-    with open(file_path, 'rb') as file:
-        reader = PdfReader(file)
-        for page in reader.pages:
-            # Handle None return values from page.extract_text()
-            page_text = page.extract_text() or ""
-            text += page_text + "\n"
-    return text.strip()
+    return extract_pdf(file_path, use_ocr=False)["text"]
 
 def extract_docx_text(file_path: str) -> str:
     """Extract text from DOCX file"""
@@ -135,61 +285,9 @@ def extract_image_text_ocr(file_path: str) -> str:
         print(f"OCR failed for {file_path}: {e}")
         return ""
 
-def is_pdf_image_based(file_path: str) -> bool:
-    """Detect if PDF contains mostly images and little text"""
-    try:
-        with open(file_path, 'rb') as file:
-            reader = PdfReader(file)
-            total_text_chars = 0
-            total_pages = len(reader.pages)
-            
-            # Check first few pages to determine if PDF is text-based
-            pages_to_check = min(3, total_pages)
-            for i in range(pages_to_check):
-                page_text = reader.pages[i].extract_text() or ""  # Handle None values
-                total_text_chars += len(page_text.strip())
-            
-            # If very little text per page, likely image-based
-            avg_chars_per_page = total_text_chars / pages_to_check if pages_to_check > 0 else 0
-            return avg_chars_per_page < 100  # Threshold for image-based PDFs
-    except Exception:
-        return False
-
 def extract_pdf_text_with_ocr(file_path: str) -> str:
-    """Extract text from PDF, using OCR if it's image-based"""
-    if not OCR_AVAILABLE:
-        return extract_pdf_text(file_path)  # Fall back to regular extraction
-    
-    regular_text = ""
-    should_use_ocr = False
-    
-    try:
-        # First try regular text extraction
-        regular_text = extract_pdf_text(file_path)
-        
-        # If we got substantial text, return it
-        if len(regular_text.strip()) > 200:
-            return regular_text
-        
-        # If text is short OR PDF appears image-based, use OCR
-        should_use_ocr = len(regular_text.strip()) < 200 or is_pdf_image_based(file_path)
-        
-    except Exception as e:
-        print(f"Regular PDF extraction failed for {file_path}: {e}")
-        # If regular extraction fails, definitely try OCR
-        should_use_ocr = True
-    
-    if should_use_ocr:
-        try:
-            print(f"PDF has minimal text ({len(regular_text.strip())} chars), attempting OCR: {file_path}")
-            ocr_text = extract_pdf_images_ocr(file_path)
-            # Return OCR text if successful, otherwise fall back to regular text
-            return ocr_text if ocr_text.strip() else regular_text
-        except Exception as e:
-            print(f"PDF OCR processing failed for {file_path}: {e}")
-            return regular_text  # Return whatever we got from regular extraction
-    
-    return regular_text
+    """Extract text from PDF, using OCR for the pages that are image-based"""
+    return extract_pdf(file_path)["text"]
 
 def detect_pdf_conversion_tool():
     """Detect which PDF-to-image tool is available and return command"""
@@ -207,94 +305,18 @@ def detect_pdf_conversion_tool():
     
     return None
 
-def extract_pdf_images_ocr(file_path: str) -> str:
-    """Extract text from PDF images using OCR via PDF-to-image conversion"""
+def extract_pdf_images_ocr(file_path: str, pages: Optional[List[int]] = None, dpi: Optional[int] = None) -> str:
+    """
+    Extract text from PDF images using OCR via PDF-to-image conversion.
+
+    OCRs `pages` (1-based), or every page without a usable text layer, in
+    parallel (see ocr.py); other pages keep their text layer.
+    """
     if not OCR_AVAILABLE:
         return ""
-    
-    # Detect available conversion tool
-    tool = detect_pdf_conversion_tool()
-    if not tool:
-        print("No PDF-to-image conversion tool available (pdftoppm, convert, or magick)")
-        return ""
-    
-    try:
-        # Convert PDF pages to images, then OCR each page
-        with tempfile.TemporaryDirectory() as temp_dir:
-            combined_text = ""
-            
-            if tool == "pdftoppm":
-                # Use poppler's pdftoppm (more secure than ImageMagick)
-                cmd = [
-                    "pdftoppm", 
-                    "-r", "300",      # 300 DPI resolution
-                    "-png",           # PNG output
-                    "-f", "1",        # Start page
-                    "-l", "10",       # End page (limit to 10 pages)
-                    file_path,
-                    os.path.join(temp_dir, "page")
-                ]
-                
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-                if result.returncode != 0:
-                    print(f"pdftoppm conversion failed: {result.stderr}")
-                    return ""
-                
-                # OCR each generated PNG (pdftoppm creates page-001.png, page-002.png, etc.)
-                for i in range(1, 11):
-                    image_path = os.path.join(temp_dir, f"page-{i:03d}.png")
-                    if os.path.exists(image_path):
-                        try:
-                            with Image.open(image_path) as img:
-                                page_text = pytesseract.image_to_string(img, config='--psm 3 --oem 3')
-                                combined_text += f"\n--- Page {i} ---\n{page_text}"
-                        except Exception as e:
-                            print(f"OCR failed for page {i}: {e}")
-                            continue
-                            
-            else:  # ImageMagick convert or magick
-                output_pattern = os.path.join(temp_dir, "page_%d.png")
-                
-                # Build command based on detected tool
-                if tool == "magick":
-                    cmd = ["magick"]
-                else:  # convert
-                    cmd = ["convert"]
-                
-                cmd.extend([
-                    "-density", "300",        # High resolution for better OCR
-                    "-quality", "100",
-                    f"{file_path}[0-9]",     # First 10 pages
-                    output_pattern
-                ])
-                
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
-                if result.returncode != 0:
-                    print(f"{tool} conversion failed: {result.stderr}")
-                    return ""
-                
-                # OCR each generated image
-                for i in range(10):  # Check up to 10 pages
-                    image_path = os.path.join(temp_dir, f"page_{i}.png")
-                    if os.path.exists(image_path):
-                        try:
-                            with Image.open(image_path) as img:
-                                page_text = pytesseract.image_to_string(img, config='--psm 3 --oem 3')
-                                combined_text += f"\n--- Page {i+1} ---\n{page_text}"
-                        except Exception as e:
-                            print(f"OCR failed for page {i+1}: {e}")
-                            continue
-            
-            return combined_text.strip()
-            
-    except subprocess.TimeoutExpired:
-        print("PDF OCR processing timed out")
-        return ""
-    except Exception as e:
-        print(f"PDF OCR extraction failed: {e}")
-        return ""
+    return extract_pdf(file_path, use_ocr=True, ocr_pages=pages, dpi=dpi)["text"]
 
-def validate_file_safety(file_path: str, max_size_mb: int = 50) -> Tuple[bool, Optional[str]]:
+def validate_file_safety(file_path: str, max_size_mb: int = 50, detected_type: Optional[str] = None) -> Tuple[bool, Optional[str]]:
     """
     Validate file safety (size, type, etc.)
     Returns (is_safe, error_message)
@@ -306,7 +328,7 @@ def validate_file_safety(file_path: str, max_size_mb: int = 50) -> Tuple[bool, O
             return False, f"File too large: {file_size / (1024*1024):.1f}MB (max: {max_size_mb}MB)"
         
         # Check file type with python-magic
-        file_type = magic.from_file(file_path, mime=True)
+        file_type = detected_type or detect_mime_type(file_path)
         allowed_types = [
             "application/pdf",
             "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
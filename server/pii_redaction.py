@@ -1,5 +1,6 @@
 import re
-from typing import Dict, List, Tuple
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Tuple
 
 PiiSummary = Dict[str, int]
 
@@ -39,51 +40,213 @@ def mask(s: str, keep: int = 4) -> str:
         return "●" * len(s)
     return "●" * max(0, len(s) - keep) + s[-keep:]
 
+def _redact_email(m, policy):
+    domain = m.group(1)
+    if any(domain.lower().endswith(d.lower()) for d in policy.allow_email_domains):
+        return None
+    if policy.mode == "mask":
+        return re.sub(r'^[^@]+', '***', m.group(0))
+    return "[REDACTED:EMAIL]"
+
+def _redact_card(m, policy):
+    if not luhn_valid(m.group(0)):
+        return None
+    if policy.mode == "mask":
+        return mask(re.sub(r'[\s-]', '', m.group(0)))
+    return "[REDACTED:CARD]"
+
+# Detectors run in this order (the order they used to run as separate re.sub passes); each one
+# scans the text with the spans accepted by earlier detectors blanked out (see _blank), so it
+# finds exactly what it found in the text rewritten by the earlier passes.
+# The replacement returns None for matches that aren't PII (allowed email domain, failed Luhn).
+DETECTORS = [
+    ("email", EMAIL, _redact_email),
+    ("ssn", SSN, lambda m, p: mask(m.group(0), 2) if p.mode == "mask" else "[REDACTED:SSN]"),
+    ("phone", PHONE, lambda m, p: mask(re.sub(r'\D', '', m.group(0)), 2) if p.mode == "mask" else "[REDACTED:PHONE]"),
+    ("dob", DOB, lambda m, p: "***-**-**" if p.mode == "mask" else "[REDACTED:DOB]"),
+    ("card", CC, _redact_card),
+    ("routing", ROUTING, lambda m, p: mask(m.group(0), 2) if p.mode == "mask" else "[REDACTED:ROUTING]"),
+    ("passport", PASSPORT, lambda m, p: mask(m.group(0), 2) if p.mode == "mask" else "[REDACTED:PASSPORT]"),
+    ("driver_license", DL, lambda m, p: mask(m.group(0), 2) if p.mode == "mask" else "[REDACTED:DL]"),
+    ("address", ADDRESS, lambda m, p: "[ADDR]" if p.mode == "mask" else "[REDACTED:ADDRESS]"),
+]
+
+# Where each detector's matches can start, given the start d of a digit run (the digit
+# detectors all begin with \b, so only run starts not preceded by a word char qualify):
+#   ssn/dob/card/routing/address: d
+#   phone: d, or d-1 when that is '+'/'(' right after a word char
+#   passport: d-1 when that is a passport letter at a word boundary
+# One scan for digit-run starts replaces seven full-document scans; each candidate is
+# tried with pattern.match(), which gives exactly the matches finditer() would.
+_RUN_START = re.compile(r'(?<!\d)\d')
+_DIGIT_STARTS = ("ssn", "dob", "card", "routing", "address")
+_PASSPORT_LETTERS = frozenset("ABCDEFGHIJKLMNOPRSTUVWYabcdefghijklmnoprstuvwy")
+_LOCAL_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789._%+-")
+
+# Characters no detector pattern can match, so no span crosses one; large inputs are
+# processed in windows cut right after such a character (\b behaves as in the full text).
+_SAFE_CUT = re.compile(r'[,;!?"]')
+_BLANK = ","
+REDACT_WINDOW_CHARS = 1 << 20
+
+def _is_word(text: str, i: int) -> bool:
+    return i >= 0 and (text[i].isalnum() or text[i] == "_")
+
+def _match_at(pattern, text: str, starts: List[int]):
+    """finditer() restricted to the given (sorted) candidate start positions"""
+    end = 0
+    for s in starts:
+        if s < end:
+            continue
+        m = pattern.match(text, s)
+        if m:
+            yield m
+            end = m.end()
+
+def _find_emails(text: str):
+    """EMAIL.finditer(), jumping straight to each '@' (the local part is a run of _LOCAL_CHARS before it)"""
+    pos = 0
+    while True:
+        at = text.find("@", pos)
+        if at < 0:
+            return
+        r = at
+        while r > pos and text[r - 1] in _LOCAL_CHARS:
+            r -= 1
+        m = EMAIL.search(text, r)
+        if not m:
+            return
+        yield m
+        pos = m.end()
+
+def _candidates_at(text: str, d: int):
+    """(list, start) candidates contributed by a digit run starting at d"""
+    if d > 0 and text[d - 1] in "+(" and _is_word(text, d - 2):
+        yield "phone", d - 1
+    if not _is_word(text, d - 1):
+        yield "digit", d
+        yield "phone", d
+    elif text[d - 1] in _PASSPORT_LETTERS and not _is_word(text, d - 2):
+        yield "passport", d - 1
+
+def _candidates(text: str) -> Dict[str, List[int]]:
+    cands: Dict[str, List[int]] = {"digit": [], "phone": [], "passport": []}
+    for m in _RUN_START.finditer(text):
+        for key, start in _candidates_at(text, m.start()):
+            cands[key].append(start)
+    return cands
+
+def _blank(text: str, spans: List[Tuple[int, int, str, str]], cands: Dict[str, List[int]]) -> str:
+    """text with the accepted spans blanked out, and cands extended with the starts this exposes.
+
+    Later detectors then see what the old passes saw once earlier ones had substituted their tag:
+    a span they can't match into, bounded by non-word characters. Candidates only depend on the
+    two characters before a run start, so only runs starting at a span's end (or one past it) change.
+    """
+    out = []
+    pos = 0
+    for start, end, _, _ in spans:
+        out.append(text[pos:start])
+        out.append(_BLANK * (end - start))
+        pos = end
+    out.append(text[pos:])
+    text = "".join(out)
+    for _, end, _, _ in spans:
+        for d in (end, end + 1):
+            if d < len(text) and _RUN_START.match(text, d):
+                for key, start in _candidates_at(text, d):
+                    lst = cands[key]
+                    i = bisect_left(lst, start)
+                    if i == len(lst) or lst[i] != start:
+                        lst.insert(i, start)
+    return text
+
+def _matches(kind: str, pattern, text: str, cands: Dict[str, List[int]]):
+    if kind == "email":
+        return _find_emails(text)
+    if kind in _DIGIT_STARTS:
+        return _match_at(pattern, text, cands["digit"])
+    if kind in ("phone", "passport"):
+        return _match_at(pattern, text, cands[kind])
+    return pattern.finditer(text)
+
+def _spans(text: str, policy: PiiPolicy) -> List[Tuple[int, int, str, str]]:
+    """All accepted (start, end, kind, replacement) spans, sorted and non-overlapping"""
+    cands = _candidates(text)
+    scan = text  # text with the spans accepted so far blanked out
+    kept: List[Tuple[int, int, str, str]] = []
+    for kind, pattern, replace in DETECTORS:
+        found = []
+        for m in _matches(kind, pattern, scan, cands):
+            r = replace(m, policy)
+            if r is not None:
+                found.append((m.start(), m.end(), kind, r))
+        if found:
+            kept = sorted(kept + found) if kept else found
+            scan = _blank(scan, found, cands)
+    return kept
+
+def _windows(text: str, size: int):
+    start = 0
+    n = len(text)
+    while start < n:
+        m = _SAFE_CUT.search(text, start + size) if start + size < n else None
+        end = m.end() if m else n
+        yield start, end
+        start = end
+
+def iter_redact(text: str, policy: PiiPolicy, summary: PiiSummary, window: int = REDACT_WINDOW_CHARS,
+                edits: Optional[List[Tuple[int, int, int]]] = None):
+    """
+    Yield the redacted text window by window, counting detections into summary.
+
+    Each detector scans a same-length copy of the window with earlier detectors' spans
+    blanked out (so offsets stay valid), and each window's output is built with a single join.
+    edits, if given, collects (start, end, replacement length) of every span in text.
+    """
+    for w_start, w_end in _windows(text, window):
+        chunk = text[w_start:w_end]
+        out = []
+        pos = 0
+        for start, end, kind, replacement in _spans(chunk, policy):
+            out.append(chunk[pos:start])
+            out.append(replacement)
+            summary[kind] = summary.get(kind, 0) + 1
+            if edits is not None:
+                edits.append((w_start + start, w_start + end, len(replacement)))
+            pos = end
+        out.append(chunk[pos:])
+        yield "".join(out)
+
 def redact(text: str, policy: PiiPolicy) -> Tuple[str, PiiSummary, bool]:
     if not text or policy.mode == "none":
         return text, {}, False
     
-    out = text
     summary: PiiSummary = {}
-    
-    def bump(k: str, n: int = 1):
-        summary[k] = summary.get(k, 0) + n
-    
-    def redact_email(match):
-        domain = match.group(1)
-        allowed = any(domain.lower().endswith(d.lower()) for d in policy.allow_email_domains)
-        if allowed:
-            return match.group(0)
-        bump("email")
-        if policy.mode == "mask":
-            return re.sub(r'^[^@]+', '***', match.group(0))
-        return "[REDACTED:EMAIL]"
-    
-    out = EMAIL.sub(redact_email, out)
-    
-    out = SSN.sub(lambda m: (bump("ssn"), mask(m.group(0), 2) if policy.mode == "mask" else "[REDACTED:SSN]")[1], out)
-    
-    out = PHONE.sub(lambda m: (bump("phone"), mask(re.sub(r'\D', '', m.group(0)), 2) if policy.mode == "mask" else "[REDACTED:PHONE]")[1], out)
-    
-    out = DOB.sub(lambda m: (bump("dob"), "***-**-**" if policy.mode == "mask" else "[REDACTED:DOB]")[1], out)
-    
-    def redact_cc(match):
-        if not luhn_valid(match.group(0)):
-            return match.group(0)
-        bump("card")
-        if policy.mode == "mask":
-            return mask(re.sub(r'[\s-]', '', match.group(0)))
-        return "[REDACTED:CARD]"
-    
-    out = CC.sub(redact_cc, out)
-    
-    out = ROUTING.sub(lambda m: (bump("routing"), mask(m.group(0), 2) if policy.mode == "mask" else "[REDACTED:ROUTING]")[1], out)
-    
-    out = PASSPORT.sub(lambda m: (bump("passport"), mask(m.group(0), 2) if policy.mode == "mask" else "[REDACTED:PASSPORT]")[1], out)
-    
-    out = DL.sub(lambda m: (bump("driver_license"), mask(m.group(0), 2) if policy.mode == "mask" else "[REDACTED:DL]")[1], out)
-    
-    out = ADDRESS.sub(lambda m: (bump("address"), "[ADDR]" if policy.mode == "mask" else "[REDACTED:ADDRESS]")[1], out)
-    
+    out = "".join(iter_redact(text, policy, summary))
     had_pii = len(summary) > 0
     return out, summary, had_pii
+
+def _shift(offset: int, starts: List[int], ends: List[int], before: List[int]) -> int:
+    """offset in the redacted text; offsets inside a span move to its replacement's start"""
+    i = bisect_right(starts, offset) - 1
+    if i >= 0 and offset < ends[i]:
+        return starts[i] + before[i]
+    return offset + before[i + 1]
+
+def redact_pages(text: str, policy: PiiPolicy,
+                 pages: List[Dict[str, Any]]) -> Tuple[str, PiiSummary, bool, List[Dict[str, Any]]]:
+    """redact() for parsing.extract_pdf output; also returns pages with start/end moved into the redacted text"""
+    if not text or policy.mode == "none":
+        return text, {}, False, pages
+    summary: PiiSummary = {}
+    edits: List[Tuple[int, int, int]] = []
+    out = "".join(iter_redact(text, policy, summary, edits=edits))
+    starts = [s for s, _, _ in edits]
+    ends = [e for _, e, _ in edits]
+    before = [0]  # before[i]: length change from edits[:i]
+    for s, e, n in edits:
+        before.append(before[-1] + n - (e - s))
+    moved = [dict(p, start=_shift(p["start"], starts, ends, before), end=_shift(p["end"], starts, ends, before))
+             for p in pages]
+    return out, summary, len(summary) > 0, moved
@@ -1,19 +1,40 @@
 # /server/rag.py
-import os, logging
-from openai import OpenAI, APIConnectionError, RateLimitError
+import os, logging, asyncio
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, RateLimitError
 from .supabase_client import get_supabase_client
-from .db import get_conn
+from .db import get_conn, aget_conn
+from .embed_cache import cached_embed, acached_embed
+from . import ask_cache
+from .retrieval import hybrid_search, ahybrid_search
+from .context_packer import pack_context
 
 sb = get_supabase_client()
 
 # Short timeouts so the request never hangs the UI
 OPENAI_TIMEOUT = int(os.getenv("OPENAI_TIMEOUT_SEC", "15"))
 oai = OpenAI(timeout=OPENAI_TIMEOUT)
+# Shared async client (one HTTP connection pool per process) for the async path
+aoai = AsyncOpenAI(timeout=OPENAI_TIMEOUT)
 
 EMBED_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-large")
 CHAT_MODEL  = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+RAG_HYBRID = os.getenv("RAG_HYBRID", "1") == "1"
+# How often a streaming answer checks for a gone client while waiting on the model
+STREAM_DISCONNECT_POLL_SEC = float(os.getenv("STREAM_DISCONNECT_POLL_SEC", "0.5"))
 
-def embed_texts(texts):
+SYSTEM_PROMPT = ("You are Kap, a seasoned Workday program director. "
+                 "Answer ONLY from the provided context. Cite sources as [Artifact: Title]. "
+                 "If insufficient, say so and suggest next steps.")
+
+NO_DOCS_MSG = ("I don't see any indexed documents for this project yet. "
+               "Upload a file (SOW, minutes, or transcript) and ask again.")
+EMBED_DOWN_MSG = ("I couldn't reach the embeddings service right now. Try again in a bit, "
+                  "or upload another document.")
+NO_CONTEXT_MSG = ("I didn't find relevant context yet. Upload a doc or give me a more specific question "
+                  "(e.g., 'What are the payroll retro rules from last standup?').")
+MODEL_DOWN_MSG = "I hit a problem calling the model just now. The rest of the system is fine—try again in a minute."
+
+def _embed_uncached(texts):
     try:
         resp = oai.embeddings.create(model=EMBED_MODEL, input=texts)
         return [d.embedding for d in resp.data]
@@ -21,76 +42,259 @@ def embed_texts(texts):
         logging.exception("embed_texts failed")
         raise
 
+async def _aembed_uncached(texts):
+    try:
+        resp = await aoai.embeddings.create(model=EMBED_MODEL, input=texts)
+        return [d.embedding for d in resp.data]
+    except Exception:
+        logging.exception("aembed_texts failed")
+        raise
+
+def embed_texts(texts):
+    # Content-addressed cache in front of the API; only misses are sent
+    return cached_embed(EMBED_MODEL, texts, _embed_uncached)
+
+async def aembed_texts(texts):
+    """Async embed_texts; same cache, shared AsyncOpenAI client"""
+    return await acached_embed(EMBED_MODEL, texts, _aembed_uncached)
+
 def _rpc_search(org_id, project_id, q_emb, k):
     return sb.rpc("search_chunks", {
         "k": k, "p_org": org_id, "p_project": project_id, "q": q_emb
     }).execute().data
 
+FALLBACK_SQL = """
+    select c.content, a.title, a.id
+    from artifact_chunks c
+    join artifacts a on a.id = c.artifact_id
+    where c.org_id = %s and c.project_id = %s
+    order by c.embedding <#> %s
+    limit %s
+"""
+
+def _fallback_rows(rows):
+    return [{"content": r[0], "title": r[1], "artifact_id": str(r[2])} for r in rows]
+
 def _psycopg_fallback(org_id, project_id, q_emb, k):
     with get_conn() as conn, conn.cursor() as cur:
         # Format embedding as pgvector literal
         emb_literal = f"[{','.join(map(str, q_emb))}]"
-        cur.execute(
-            """
-            select c.content, a.title, a.id
-            from artifact_chunks c
-            join artifacts a on a.id = c.artifact_id
-            where c.org_id = %s and c.project_id = %s
-            order by c.embedding <#> %s
-            limit %s
-            """,
-            (org_id, project_id, emb_literal, k),
-        )
-        rows = cur.fetchall()
-        return [{"content": r[0], "title": r[1], "artifact_id": str(r[2])} for r in rows]
+        cur.execute(FALLBACK_SQL, (org_id, project_id, emb_literal, k))
+        return _fallback_rows(cur.fetchall())
 
-def answer_with_citations(org_id: str, project_id: str, question: str, k: int = 8):
-    # If no chunks in this project, return immediately (no OpenAI call)
+async def _apsycopg_fallback(org_id, project_id, q_emb, k):
+    async with aget_conn() as conn, conn.cursor() as cur:
+        emb_literal = f"[{','.join(map(str, q_emb))}]"
+        await cur.execute(FALLBACK_SQL, (org_id, project_id, emb_literal, k))
+        return _fallback_rows(await cur.fetchall())
+
+def _index_version(org_id, project_id):
+    """Cheap fingerprint of a project's chunk index: newest chunk (one index probe, no count)
+    plus this process's invalidation generation (see ask_cache)."""
+    gen = ask_cache.generation(org_id, project_id)
+    r = sb.table("artifact_chunks").select("id,created_at")\
+        .eq("org_id", org_id).eq("project_id", project_id)\
+        .order("created_at", desc=True).limit(1).execute()
+    if not r.data:
+        return f"{gen}:0"
+    return f"{gen}:{r.data[0]['created_at']}:{r.data[0]['id']}"
+
+def _retrieve(org_id, project_id, question, q_emb, k):
+    if RAG_HYBRID:
+        try:
+            return hybrid_search(org_id, project_id, question, q_emb, k)
+        except Exception as e:
+            logging.warning(f"hybrid retrieval failed, falling back to vector search: {e}")
     try:
-        chk = sb.table("artifact_chunks").select("id").eq("org_id", org_id).eq("project_id", project_id).limit(1).execute().data
-        if not chk:
-            return ("I don't see any indexed documents for this project yet. "
-                    "Upload a file (SOW, minutes, or transcript) and ask again.", [])
+        return _rpc_search(org_id, project_id, q_emb, k) or []
     except Exception:
-        # If Supabase hiccups, continue; worst case we try and fail gracefully below
-        pass
+        try:
+            return _psycopg_fallback(org_id, project_id, q_emb, k)
+        except Exception:
+            logging.exception("Both RPC and psycopg fallback failed")
+            return []
 
-    # Embed the question
+async def _aretrieve(org_id, project_id, question, q_emb, k):
+    if RAG_HYBRID:
+        try:
+            return await ahybrid_search(org_id, project_id, question, q_emb, k)
+        except Exception as e:
+            logging.warning(f"hybrid retrieval failed, falling back to vector search: {e}")
     try:
-        q_emb = embed_texts([question])[0]
+        # supabase-py is sync; keep its HTTP call off the event loop
+        return await asyncio.to_thread(_rpc_search, org_id, project_id, q_emb, k) or []
     except Exception:
-        return ("I couldn't reach the embeddings service right now. Try again in a bit, "
-                "or upload another document.", [])
+        try:
+            return await _apsycopg_fallback(org_id, project_id, q_emb, k)
+        except Exception:
+            logging.exception("Both RPC and async psycopg fallback failed")
+            return []
+
+def _build_messages(question, res):
+    # Neighbouring chunks merged, overlap/duplicates dropped, best passages first within the token budget
+    context = pack_context(res)
+    u = f"Question: {question}\n\nContext:\n{context}"
+    return [{"role":"system","content":SYSTEM_PROMPT},{"role":"user","content":u}]
 
-    # Retrieve via RPC then fallback
-    res = []
+def answer_with_citations(org_id: str, project_id: str, question: str, k: int = 8):
+    # Probe the index once: doubles as the "no chunks" check and the answer-cache version
+    index_version = None
     try:
-        res = _rpc_search(org_id, project_id, q_emb, k) or []
+        index_version = _index_version(org_id, project_id)
+        if index_version == "0":
+            return (NO_DOCS_MSG, [])
     except Exception:
+        # If Supabase hiccups, continue uncached; worst case we try and fail gracefully below
+        pass
+
+    cached = ask_cache.get_answer(org_id, project_id, question, k, index_version)
+    if cached is not None:
+        return cached
+
+    # Embed the question
+    q_emb = ask_cache.get_question_embedding(EMBED_MODEL, question, org_id, project_id)
+    if q_emb is None:
         try:
-            res = _psycopg_fallback(org_id, project_id, q_emb, k)
+            q_emb = embed_texts([question])[0]
+            ask_cache.put_question_embedding(EMBED_MODEL, question, q_emb)
         except Exception:
-            logging.exception("Both RPC and psycopg fallback failed")
-            res = []
+            return (EMBED_DOWN_MSG, [])
+
+    # Retrieve: hybrid (vector + full-text) first, then vector-only RPC, then psycopg
+    res = _retrieve(org_id, project_id, question, q_emb, k)
 
     # If no context, don't waste an LLM call—reply helpfully
     if not res:
-        return ("I didn't find relevant context yet. Upload a doc or give me a more specific question "
-                "(e.g., 'What are the payroll retro rules from last standup?').", [])
+        return (NO_CONTEXT_MSG, [])
 
     # Build context and ask Kap
-    context = "\n\n".join([f"[Artifact: {r['title']}] \n{r['content']}" for r in res])
-    sys = ("You are Kap, a seasoned Workday program director. "
-           "Answer ONLY from the provided context. Cite sources as [Artifact: Title]. "
-           "If insufficient, say so and suggest next steps.")
-    u = f"Question: {question}\n\nContext:\n{context[:20000]}"
     try:
         comp = oai.chat.completions.create(
             model=CHAT_MODEL,
-            messages=[{"role":"system","content":sys},{"role":"user","content":u}],
+            messages=_build_messages(question, res),
             temperature=0.2
         )
-        return comp.choices[0].message.content, res
+        answer = comp.choices[0].message.content
+        ask_cache.put_answer(org_id, project_id, question, k, index_version, answer, res)
+        return answer, res
     except (APIConnectionError, RateLimitError, Exception):
         logging.exception("chat completion failed")
-        return ("I hit a problem calling the model just now. The rest of the system is fine—try again in a minute.", res)
\ No newline at end of file
+        return (MODEL_DOWN_MSG, res)
+
+async def _aprepare(org_id, project_id, question, k):
+    """Front half of the async path (probe, caches, embed, retrieve).
+
+    Returns (answer, res, index_version, cached); answer is None when the model still has to be
+    called, cached is True only for an answer that came from the answer cache."""
+    index_version = None
+    try:
+        # supabase-py is sync; keep its HTTP call off the event loop
+        index_version = await asyncio.to_thread(_index_version, org_id, project_id)
+        if index_version == "0":
+            return NO_DOCS_MSG, [], index_version, False
+    except Exception:
+        pass
+
+    cached = ask_cache.get_answer(org_id, project_id, question, k, index_version)
+    if cached is not None:
+        return cached[0], cached[1], index_version, True
+
+    q_emb = ask_cache.get_question_embedding(EMBED_MODEL, question, org_id, project_id)
+    if q_emb is None:
+        try:
+            q_emb = (await aembed_texts([question]))[0]
+            ask_cache.put_question_embedding(EMBED_MODEL, question, q_emb)
+        except Exception:
+            return EMBED_DOWN_MSG, [], index_version, False
+
+    res = await _aretrieve(org_id, project_id, question, q_emb, k)
+    if not res:
+        return NO_CONTEXT_MSG, [], index_version, False
+    return None, res, index_version, False
+
+async def aanswer_with_citations(org_id: str, project_id: str, question: str, k: int = 8):
+    """Async answer_with_citations: never blocks the event loop on model or DB latency"""
+    answer, res, index_version, _ = await _aprepare(org_id, project_id, question, k)
+    if answer is not None:
+        return answer, res
+
+    try:
+        comp = await aoai.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=_build_messages(question, res),
+            temperature=0.2
+        )
+        answer = comp.choices[0].message.content
+        ask_cache.put_answer(org_id, project_id, question, k, index_version, answer, res)
+        return answer, res
+    except (APIConnectionError, RateLimitError, Exception):
+        logging.exception("chat completion failed")
+        return (MODEL_DOWN_MSG, res)
+
+class _Disconnected(Exception):
+    pass
+
+async def _unless_disconnected(aw, is_disconnected, poll: float = STREAM_DISCONNECT_POLL_SEC):
+    """Await aw, checking is_disconnected() every poll seconds meanwhile; cancels aw and raises
+    _Disconnected once the client is gone"""
+    if is_disconnected is None:
+        return await aw
+    task = asyncio.ensure_future(aw)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll)
+        if done:
+            return task.result()
+        if await is_disconnected():
+            task.cancel()
+            raise _Disconnected()
+
+async def astream_answer_with_citations(org_id: str, project_id: str, question: str, k: int = 8,
+                                        is_disconnected=None):
+    """Streaming variant: yields ("citations", chunks) as soon as retrieval is done,
+    then ("token", text) deltas, then ("done", {"cached": bool}).
+
+    is_disconnected (e.g. request.is_disconnected) is checked before the model call and while
+    waiting on it; a gone client ends the stream. Closing the generator also closes the
+    upstream completion stream."""
+    answer, res, index_version, cached = await _aprepare(org_id, project_id, question, k)
+    yield "citations", res
+    if answer is not None:
+        yield "token", answer
+        yield "done", {"cached": cached}
+        return
+    if is_disconnected is not None and await is_disconnected():
+        return
+
+    stream = None
+    parts = []
+    try:
+        stream = await _unless_disconnected(aoai.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=_build_messages(question, res),
+            temperature=0.2,
+            stream=True
+        ), is_disconnected)
+        events = stream.__aiter__()
+        while True:
+            try:
+                event = await _unless_disconnected(events.__anext__(), is_disconnected)
+            except StopAsyncIteration:
+                break
+            delta = event.choices[0].delta.content if event.choices else None
+            if delta:
+                parts.append(delta)
+                yield "token", delta
+    except _Disconnected:
+        return
+    except (APIConnectionError, RateLimitError, Exception):
+        logging.exception("streaming chat completion failed")
+        if not parts:
+            yield "token", MODEL_DOWN_MSG
+        yield "done", {"cached": False, "error": True}
+        return
+    finally:
+        if stream is not None:
+            await stream.close()
+
+    ask_cache.put_answer(org_id, project_id, question, k, index_version, "".join(parts), res)
+    yield "done", {"cached": False}
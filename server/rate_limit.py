@@ -1,74 +1,349 @@
+# /server/rate_limit.py
+"""
+Request rate limiting.
+
+Token buckets (capacity = max requests, refilled evenly over the window) live
+in a pluggable backend:
+  - "memory": per-process, idle buckets evicted once they've refilled
+  - "postgres": a shared rate_limit_buckets row per key, updated atomically in
+    one statement, so all uvicorn workers enforce the same limit
+
+Requests to /api/ routes, and to any route in an opt-in RATE_LIMIT_GROUPS
+group, are limited per user and route group (else the path itself) and per
+tenant (org) across all its users. Rate-limit and 5xx
+telemetry is queued and written to telemetry_events in batches off the
+request path.
+"""
+import os
+import json
+import math
 import time
-from collections import defaultdict, deque
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
-from .supabase_client import get_supabase_client
+
+# Default per-user, per-route limit
+WINDOW_SEC = int(float(os.getenv("RATE_LIMIT_WINDOW_SEC", "60")))
+MAX_REQ = int(float(os.getenv("RATE_LIMIT_MAX", "120")))
+# Per-tenant limit across all users and routes (0 disables)
+TENANT_WINDOW_SEC = int(float(os.getenv("RATE_LIMIT_TENANT_WINDOW_SEC", "60")))
+TENANT_MAX_REQ = int(float(os.getenv("RATE_LIMIT_TENANT_MAX", "1200")))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | postgres
+RATE_LIMIT_MEMORY_KEYS = int(os.getenv("RATE_LIMIT_MEMORY_KEYS", "100000"))
+RATE_LIMIT_SWEEP_SEC = int(os.getenv("RATE_LIMIT_SWEEP_SEC", "300"))
+# Postgres backend: how long a request waits for a pooled connection, and how long it then
+# stays on the memory fallback before trying the database again
+RATE_LIMIT_DB_TIMEOUT_SEC = float(os.getenv("RATE_LIMIT_DB_TIMEOUT_SEC", "0.25"))
+RATE_LIMIT_DB_COOLDOWN_SEC = float(os.getenv("RATE_LIMIT_DB_COOLDOWN_SEC", "30"))
+TELEMETRY_FLUSH_SEC = float(os.getenv("TELEMETRY_FLUSH_SEC", "2"))
+TELEMETRY_BATCH = int(os.getenv("TELEMETRY_BATCH", "200"))
+TELEMETRY_QUEUE_MAX = int(os.getenv("TELEMETRY_QUEUE_MAX", "5000"))
+
+# Route groups (opt-in) share one bucket per user. A path matches a group's exact "paths" first,
+# else the group with the longest matching prefix; without groups only /api/ routes are limited,
+# per path. Prefer exact paths where a prefix would also catch polling routes (/ingest/jobs/{id}):
+# RATE_LIMIT_GROUPS='{"ingest": {"paths": ["/ingest", "/ingest-sync"], "max": 30, "window": 60},
+#                     "ask": {"prefixes": ["/ask", "/api/ask"], "max": 60}}'
+DEFAULT_GROUPS: Dict[str, Dict[str, Any]] = {}
+
+log = logging.getLogger("rate_limit")
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float  # seconds until a token is available (0 when allowed)
+
+def _decision(allowed: bool, tokens: float, capacity: int, rate: float, cost: float) -> Decision:
+    retry = 0.0 if allowed else max(0.0, (cost - tokens) / rate)
+    return Decision(allowed, capacity, max(0, int(tokens)), retry)
+
+class MemoryBackend:
+    """Per-process token buckets; buckets idle long enough to be full again are evicted"""
+    def __init__(self, max_keys: int = RATE_LIMIT_MEMORY_KEYS):
+        self.max_keys = max_keys
+        # key -> [tokens, updated_at, capacity, rate]; least recently touched first
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.stats = {"evicted": 0, "dropped": 0}
+
+    async def hit(self, key: str, capacity: int, window: float, cost: float = 1) -> Decision:
+        return self.hit_sync(key, capacity, window, cost)
+
+    def hit_sync(self, key: str, capacity: int, window: float, cost: float = 1) -> Decision:
+        rate = capacity / window
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [float(capacity), now, capacity, rate]
+            else:
+                self._buckets.move_to_end(key)
+                b[0] = min(capacity, b[0] + (now - b[1]) * rate)
+                b[1], b[2], b[3] = now, capacity, rate
+            allowed = b[0] >= cost
+            if allowed:
+                b[0] -= cost
+            tokens = b[0]
+            if now - self._last_sweep > RATE_LIMIT_SWEEP_SEC or len(self._buckets) > self.max_keys:
+                self._sweep_locked(now)
+        return _decision(allowed, tokens, capacity, rate, cost)
+
+    def _sweep_locked(self, now: float):
+        self._last_sweep = now
+        # Oldest first: a bucket that has refilled to capacity holds no state worth keeping
+        while self._buckets:
+            key, (tokens, updated, capacity, rate) = next(iter(self._buckets.items()))
+            if tokens + (now - updated) * rate < capacity:
+                break
+            del self._buckets[key]
+            self.stats["evicted"] += 1
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            self.stats["dropped"] += 1
+
+    def size(self) -> int:
+        return len(self._buckets)
+
+class PostgresBackend:
+    """
+    Shared token buckets in rate_limit_buckets; falls back to memory if the database is unavailable.
+    A request waits at most RATE_LIMIT_DB_TIMEOUT_SEC for a connection, and after a failure every
+    request uses the fallback for RATE_LIMIT_DB_COOLDOWN_SEC instead of waiting on the pool again.
+    """
+    def __init__(self, fallback: Optional[MemoryBackend] = None, timeout: float = RATE_LIMIT_DB_TIMEOUT_SEC,
+                 cooldown: float = RATE_LIMIT_DB_COOLDOWN_SEC):
+        self.fallback = fallback or MemoryBackend()
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self._last_sweep = time.monotonic()
+        self._last_error_log = 0.0
+        self._down_until = 0.0
+        self.stats = {"errors": 0, "fallbacks": 0, "evicted": 0, "trips": 0}
+
+    async def hit(self, key: str, capacity: int, window: float, cost: float = 1) -> Decision:
+        from .db import aget_conn
+        if time.monotonic() < self._down_until:
+            self.stats["fallbacks"] += 1
+            return await self.fallback.hit(key, capacity, window, cost)
+        rate = capacity / window
+        try:
+            async with aget_conn(timeout=self.timeout) as conn:
+                # Refill and take in one statement; the row lock serializes concurrent workers
+                cur = await conn.execute("""
+                    INSERT INTO rate_limit_buckets AS b (key, tokens, capacity, rate, allowed, updated_at)
+                    VALUES (%(key)s, %(cap)s - %(cost)s, %(cap)s, %(rate)s, true, now())
+                    ON CONFLICT (key) DO UPDATE SET
+                        tokens = LEAST(%(cap)s, b.tokens + extract(epoch FROM now() - b.updated_at) * %(rate)s)
+                                 - CASE WHEN LEAST(%(cap)s, b.tokens + extract(epoch FROM now() - b.updated_at) * %(rate)s) >= %(cost)s
+                                        THEN %(cost)s ELSE 0 END,
+                        allowed = LEAST(%(cap)s, b.tokens + extract(epoch FROM now() - b.updated_at) * %(rate)s) >= %(cost)s,
+                        capacity = %(cap)s, rate = %(rate)s, updated_at = now()
+                    RETURNING allowed, tokens
+                """, {"key": key, "cap": capacity, "rate": rate, "cost": cost})
+                allowed, tokens = await cur.fetchone()
+                if time.monotonic() - self._last_sweep > RATE_LIMIT_SWEEP_SEC:
+                    self._last_sweep = time.monotonic()
+                    cur = await conn.execute("""
+                        DELETE FROM rate_limit_buckets
+                        WHERE tokens + extract(epoch FROM now() - updated_at) * rate >= capacity
+                    """)
+                    self.stats["evicted"] += cur.rowcount or 0
+            return _decision(bool(allowed), float(tokens), capacity, rate, cost)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.stats["fallbacks"] += 1
+            self.stats["trips"] += 1
+            self._down_until = time.monotonic() + self.cooldown
+            if time.monotonic() - self._last_error_log > 60:
+                self._last_error_log = time.monotonic()
+                log.warning(f"rate limit backend unavailable, limiting per process for {self.cooldown:g}s: {e}")
+            return await self.fallback.hit(key, capacity, window, cost)
+
+    def size(self) -> int:
+        return self.fallback.size()
+
+class TelemetryWriter:
+    """Queues telemetry_events rows and inserts them in batches from a background task"""
+    def __init__(self, batch: int = TELEMETRY_BATCH, flush_sec: float = TELEMETRY_FLUSH_SEC,
+                 max_queued: int = TELEMETRY_QUEUE_MAX):
+        self.batch = batch
+        self.flush_sec = flush_sec
+        self.max_queued = max_queued
+        self._queue: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "batches": 0, "errors": 0}
+
+    def emit(self, event: Dict[str, Any]):
+        """Queue an event (never blocks; drops it if the queue is full)"""
+        if len(self._queue) >= self.max_queued:
+            self.stats["dropped"] += 1
+            return
+        self._queue.append(event)
+        self.stats["queued"] += 1
+        try:
+            self._ensure_task()
+            if len(self._queue) >= self.batch:
+                self._wake.set()
+        except RuntimeError:
+            pass  # no running loop; picked up by the next flush
+
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._queue:
+            rows, self._queue = self._queue[:self.batch], self._queue[self.batch:]
+            try:
+                await asyncio.to_thread(self._insert, rows)
+                self.stats["written"] += len(rows)
+                self.stats["batches"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.stats["dropped"] += len(rows)
+                log.warning(f"telemetry batch of {len(rows)} dropped: {e}")
+
+    @staticmethod
+    def _insert(rows: List[Dict[str, Any]]):
+        from .supabase_client import get_supabase_client
+        get_supabase_client().table("telemetry_events").insert(rows).execute()
+
+def _load_groups() -> Tuple[Dict[str, Tuple[str, int, int]], List[Tuple[str, str, int, int]]]:
+    """({exact path: (group, max, window)}, [(prefix, group, max, window)] longest prefix first)"""
+    groups = DEFAULT_GROUPS
+    raw = os.getenv("RATE_LIMIT_GROUPS")
+    if raw:
+        try:
+            groups = json.loads(raw)
+        except ValueError as e:
+            log.error(f"RATE_LIMIT_GROUPS is not valid JSON, using defaults: {e}")
+    exact = {path: (name, int(g["max"]), int(g.get("window", WINDOW_SEC)))
+             for name, g in groups.items() for path in g.get("paths", [])}
+    prefixes = [(prefix, name, int(g["max"]), int(g.get("window", WINDOW_SEC)))
+                for name, g in groups.items() for prefix in g.get("prefixes", [])]
+    return exact, sorted(prefixes, key=lambda x: len(x[0]), reverse=True)
+
+ROUTE_PATHS, ROUTE_GROUPS = _load_groups()
+
+def route_group(path: str) -> Optional[Tuple[str, int, int]]:
+    """(group, max, window) for an exact path, else the longest matching prefix, or None"""
+    if path in ROUTE_PATHS:
+        return ROUTE_PATHS[path]
+    for prefix, name, max_req, window in ROUTE_GROUPS:
+        if path == prefix or path.startswith(prefix.rstrip("/") + "/") or path.startswith(prefix + "-"):
+            return name, max_req, window
+    return None
+
+_limiter = None
+_telemetry = TelemetryWriter()
+
+def get_limiter():
+    """Process-wide backend chosen by RATE_LIMIT_BACKEND"""
+    global _limiter
+    if _limiter is None:
+        _limiter = PostgresBackend() if RATE_LIMIT_BACKEND == "postgres" else MemoryBackend()
+    return _limiter
+
+def get_telemetry() -> TelemetryWriter:
+    return _telemetry
+
+def limiter_stats() -> Dict[str, Any]:
+    limiter = get_limiter()
+    return {"backend": RATE_LIMIT_BACKEND, "keys": limiter.size(), **limiter.stats,
+            "telemetry": dict(_telemetry.stats, pending=len(_telemetry._queue))}
+
+async def check_rate_limit(client_ip: str, endpoint: str, limit: int = 10, window: int = 3600) -> bool:
+    """Per-IP limit for an endpoint: at most `limit` requests per `window` seconds"""
+    decision = await get_limiter().hit(f"ip:{client_ip}:{endpoint}", limit, window)
+    return decision.allowed
 
 def get_user_context(request):
     """Get user context from request headers - mirrors tenant dev header logic"""
+    from .tenant import DEV_AUTH, verify_token
     headers = request.headers
-    if headers.get("x-dev-user") and headers.get("x-dev-org") and (headers.get("x-dev-role")):
-        return {"user_id": headers["x-dev-user"], "org_id": headers["x-dev-org"], "role": headers["x-dev-role"]}
-    # For prod, tenant_ctx handles auth; at middleware stage we may not decode JWT—return minimal
-    auth = headers.get("authorization","")
-    return {"user_id": "jwt", "org_id": None, "role": None} if auth else {"user_id":"anon","org_id":None,"role":None}
+    if DEV_AUTH and headers.get("x-dev-user") and headers.get("x-dev-org"):
+        return {"user_id": headers["x-dev-user"], "org_id": headers["x-dev-org"], "role": headers.get("x-dev-role")}
+    auth = headers.get("authorization", "")
+    if not auth.lower().startswith("bearer "):
+        return {"user_id": "anon", "org_id": None, "role": None}
+    # Verified (not just decoded) so a forged token can't spend another tenant's budget;
+    # shares tenant_ctx's claims cache, so the request's second check is a lookup
+    try:
+        claims = verify_token(auth.split(" ", 1)[1])
+        return {"user_id": claims.get("sub") or "jwt", "org_id": claims.get("org_id"), "role": claims.get("role")}
+    except Exception:
+        return {"user_id": "jwt", "org_id": None, "role": None}
 
-# Simple per-user+route sliding window (in-memory, dev-friendly)
-WINDOW_SEC = int(float(__import__("os").getenv("RATE_LIMIT_WINDOW_SEC", "60")))
-MAX_REQ = int(float(__import__("os").getenv("RATE_LIMIT_MAX", "120")))
+def _uuid_or_none(value: Optional[str]) -> Optional[str]:
+    try:
+        return str(uuid.UUID(str(value))) if value else None
+    except ValueError:
+        return None
 
-_buckets: dict[tuple[str,str], deque] = defaultdict(deque)
+def _event(user: Dict[str, Any], kind: str, path: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """telemetry_events row; ids that aren't UUIDs (anon, dev users) go in meta so the batch insert can't fail on them"""
+    user_id, org_id = _uuid_or_none(user.get("user_id")), _uuid_or_none(user.get("org_id"))
+    if not user_id:
+        meta = {**meta, "user": user.get("user_id")}
+    return {"org_id": org_id, "project_id": None, "user_id": user_id, "kind": kind, "path": path, "meta": meta}
+
+def _too_many(decision: Decision, scope: str, window: int) -> Response:
+    return Response("Too Many Requests", status_code=429,
+                    headers={
+                        "Retry-After": str(max(1, math.ceil(decision.retry_after))),
+                        "X-RateLimit-Limit": str(decision.limit),
+                        "X-RateLimit-Remaining": "0",
+                        "X-RateLimit-Window": str(window),
+                        "X-RateLimit-Scope": scope,
+                    })
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         path = request.url.path
-        if not path.startswith("/api/"):  # only API
+        group = route_group(path)
+        if not group and not path.startswith("/api/"):  # only API and grouped routes
             return await call_next(request)
 
-        now = time.time()
         user = get_user_context(request)  # reads Bearer or X-Dev-* if dev
-        key = (user.get("user_id","anon"), path)
+        name, max_req, window = group or (path, MAX_REQ, WINDOW_SEC)
+        limiter = get_limiter()
 
-        q = _buckets[key]
-        while q and now - q[0] > WINDOW_SEC:
-            q.popleft()
-        if len(q) >= MAX_REQ:
-            # Telemetry (service key; non-blocking)
-            try:
-                sb = get_supabase_client()
-                sb.table("telemetry_events").insert({
-                    "org_id": user.get("org_id"),
-                    "project_id": None,
-                    "user_id": user.get("user_id"),
-                    "kind": "rate_limited",
-                    "path": path,
-                    "meta": {"window": WINDOW_SEC, "max": MAX_REQ}
-                }).execute()
-            except Exception:
-                pass
-            return Response("Too Many Requests", status_code=429,
-                            headers={
-                                "Retry-After": str(WINDOW_SEC),
-                                "X-RateLimit-Limit": str(MAX_REQ),
-                                "X-RateLimit-Window": str(WINDOW_SEC)
-                            })
-        q.append(now)
+        checks = [("user", f"u:{user.get('user_id', 'anon')}:{name}", max_req, window)]
+        if user.get("org_id") and TENANT_MAX_REQ > 0:
+            checks.append(("tenant", f"t:{user['org_id']}", TENANT_MAX_REQ, TENANT_WINDOW_SEC))
+        decisions = []
+        for scope, key, limit, win in checks:
+            decision = await limiter.hit(key, limit, win)
+            if not decision.allowed:
+                _telemetry.emit(_event(user, "rate_limited", path,
+                                       {"scope": scope, "group": name, "window": win, "max": limit}))
+                return _too_many(decision, scope, win)
+            decisions.append(decision)
 
         try:
             resp = await call_next(request)
         except Exception as e:
-            # Telemetry for 5xx
-            try:
-                sb = get_supabase_client()
-                sb.table("telemetry_events").insert({
-                    "org_id": user.get("org_id"),
-                    "project_id": None,
-                    "user_id": user.get("user_id"),
-                    "kind": "server_error",
-                    "path": path,
-                    "meta": {"error": str(e)}
-                }).execute()
-            except Exception:
-                pass
+            _telemetry.emit(_event(user, "server_error", path, {"error": str(e)}))
             raise
-        return resp
\ No newline at end of file
+        resp.headers["X-RateLimit-Limit"] = str(decisions[0].limit)
+        resp.headers["X-RateLimit-Remaining"] = str(decisions[0].remaining)
+        return resp
@@ -0,0 +1,174 @@
+# /server/reindex_executor.py
+"""
+In-process reindex execution.
+
+Claims up to REINDEX_BATCH_SIZE due reindex_queue jobs at a time with
+FOR UPDATE SKIP LOCKED (so several workers can share the queue) and runs
+them through ingest_pipeline.ingest_file on at most REINDEX_CONCURRENCY
+concurrent slots. The stored file is spooled to disk once; nothing goes
+back over HTTP to /ingest-sync. Jobs ingest incrementally: the artifact
+(or, for a restore, the latest artifact with the same title) is updated in
+place and only chunks whose content hash changed are embedded.
+"""
+import os
+import json
+import asyncio
+import logging
+import datetime as dt
+from uuid import uuid4
+from typing import Any, Dict, List, Optional, Tuple
+
+REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", "4"))
+REINDEX_CONCURRENCY = int(os.getenv("REINDEX_CONCURRENCY", "2"))
+REINDEX_MAX_ATTEMPTS = int(float(os.getenv("REINDEX_MAX_ATTEMPTS", "4")))
+# A running job not updated for this long belonged to a worker that died: the lost run counts as a
+# failed attempt, so the job is retried with backoff (or failed) like any other failure
+REINDEX_LEASE_SEC = int(os.getenv("REINDEX_LEASE_SEC", "1800"))
+RESTORE_BUCKET = "artifacts"
+
+log = logging.getLogger("reindex_executor")
+
+def claim_reindex_jobs(n: int = REINDEX_BATCH_SIZE) -> List[Dict[str, Any]]:
+    """Mark up to n due jobs running and return them (rows locked by other workers are skipped)"""
+    from .db import get_conn
+    with get_conn() as conn, conn.cursor() as cur:
+        # Expired leases go through _mark_failed's rules: back to pending with backoff, or failed
+        # (with an audit event) once out of attempts, so a job that kills its worker can't loop forever
+        cur.execute("""
+            WITH expired AS (
+                UPDATE reindex_queue
+                SET attempts = attempts + 1,
+                    status = CASE WHEN attempts + 1 >= %(max)s THEN 'failed' ELSE 'pending' END,
+                    last_error = 'Lease expired (worker died)',
+                    scheduled_at = now() + make_interval(secs => LEAST(30, power(2, attempts + 1))),
+                    updated_at = now()
+                WHERE id IN (
+                    SELECT id FROM reindex_queue
+                    WHERE status = 'running' AND updated_at < now() - make_interval(secs => %(lease)s)
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, org_id, project_id, status, last_error, stored_key
+            )
+            INSERT INTO audit_events (org_id, project_id, actor_id, kind, details, created_at)
+            SELECT org_id, project_id, NULL, 'reindex.failed',
+                   jsonb_build_object('job_id', id::text, 'error', last_error, 'stored_key', stored_key), now()
+            FROM expired WHERE status = 'failed'
+        """, {"max": REINDEX_MAX_ATTEMPTS, "lease": REINDEX_LEASE_SEC})
+        cur.execute("""
+            UPDATE reindex_queue q SET status = 'running', updated_at = now()
+            WHERE q.id IN (
+                SELECT id FROM reindex_queue
+                WHERE status = 'pending' AND scheduled_at <= now()
+                ORDER BY scheduled_at ASC
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING q.*
+        """, (n,))
+        cols = [d[0] for d in cur.description]
+        return [dict(zip(cols, r)) for r in cur.fetchall()]
+
+def _resolve_source(job: Dict[str, Any]) -> Tuple[str, str, str, Optional[str]]:
+    """(bucket, key, filename, artifact to update) for a job"""
+    from .db import get_conn
+    if job.get("stored_key"):
+        return RESTORE_BUCKET, job["stored_key"], os.path.basename(job["stored_key"]), None
+    if job.get("artifact_id"):
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT path, title FROM artifacts
+                WHERE org_id = %s AND project_id = %s AND id = %s
+                LIMIT 1
+            """, (job["org_id"], job["project_id"], job["artifact_id"]))
+            row = cur.fetchone()
+        if row:
+            path, title = row
+            return os.environ.get("BUCKET", "project-artifacts"), path, title or os.path.basename(path), str(job["artifact_id"])
+    raise RuntimeError("nothing to reindex (no stored_key nor resolvable artifact)")
+
+def _download(bucket: str, key: str, filename: str):
+    from .deps import get_service_supabase
+    from .uploads import spool_iter
+    data = get_service_supabase().storage.from_(bucket).download(key)
+    return spool_iter([data], suffix=os.path.splitext(filename)[1])
+
+def _mark_done(job: Dict[str, Any], artifact_id: Optional[str]):
+    from .db import get_conn
+    now = dt.datetime.now(dt.timezone.utc)
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE reindex_queue
+            SET status = 'done', updated_at = %s, artifact_id = %s
+            WHERE id = %s
+        """, (now, artifact_id or job.get("artifact_id"), job["id"]))
+        details = {"job_id": str(job["id"]), "artifact_id": str(artifact_id or job.get("artifact_id")),
+                   "stored_key": job.get("stored_key")}
+        cur.execute("""
+            INSERT INTO audit_events (org_id, project_id, actor_id, kind, details, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (job["org_id"], job["project_id"], None, "reindex.completed", json.dumps(details), now))
+
+def _mark_failed(job: Dict[str, Any], error: str, permanent: bool = False):
+    """Back off and retry, or fail (with an audit event) after REINDEX_MAX_ATTEMPTS"""
+    from .db import get_conn
+    now = dt.datetime.now(dt.timezone.utc)
+    attempts = REINDEX_MAX_ATTEMPTS if permanent else (job.get("attempts") or 0) + 1
+    delay_s = min(30, 2 ** attempts)  # 2,4,8,16,30 seconds
+    status = "pending" if attempts < REINDEX_MAX_ATTEMPTS else "failed"
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            UPDATE reindex_queue
+            SET status = %s, attempts = %s, last_error = %s,
+                scheduled_at = %s, updated_at = %s
+            WHERE id = %s
+        """, (status, attempts, error, now + dt.timedelta(seconds=delay_s), now, job["id"]))
+        if status == "failed":
+            details = {"job_id": str(job["id"]), "error": error, "stored_key": job.get("stored_key")}
+            cur.execute("""
+                INSERT INTO audit_events (org_id, project_id, actor_id, kind, details, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (job["org_id"], job["project_id"], None, "reindex.failed", json.dumps(details), now))
+
+async def run_reindex_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    from .ingest_pipeline import ingest_file
+    from .uploads import upload_spooled
+    from .deps import get_service_supabase
+
+    org_id, project_id = str(job["org_id"]), str(job["project_id"])
+    bucket, key, filename, artifact_id = await asyncio.to_thread(_resolve_source, job)
+    spooled = await asyncio.to_thread(_download, bucket, key, filename)
+    try:
+        mime = spooled.mime
+        target = os.environ.get("BUCKET", "project-artifacts")
+        if bucket != target:
+            # Restores live in their own bucket; ingested artifacts point into BUCKET
+            safe_filename = filename.replace(" ", "_").replace("/", "_")
+            key = f"{project_id}/{uuid4().hex}_{safe_filename}"
+            await asyncio.to_thread(upload_spooled, get_service_supabase().storage.from_(target), key, spooled, mime)
+        return await ingest_file(org_id, project_id, spooled.path, filename, mime, key,
+                                 source="restore", detected_type=mime, incremental=True, artifact_id=artifact_id)
+    finally:
+        spooled.remove()
+
+async def _run_one(job: Dict[str, Any], slots: asyncio.Semaphore):
+    from .ingest_pipeline import IngestError
+    async with slots:
+        try:
+            result = await run_reindex_job(job)
+            await asyncio.to_thread(_mark_done, job, result["artifact_id"])
+            log.info(f"reindex job {job['id']}: artifact {result['artifact_id']}, "
+                     f"{result['chunks']} chunks ({result['embedded']} embedded, {result['deleted']} deleted)")
+        except Exception as e:
+            log.warning(f"reindex job {job['id']} failed: {e}")
+            try:
+                await asyncio.to_thread(_mark_failed, job, str(e), isinstance(e, IngestError))
+            except Exception as e2:
+                log.error(f"reindex job {job['id']}: could not record failure: {e2}")
+
+async def run_reindex_batch(n: int = REINDEX_BATCH_SIZE, concurrency: int = REINDEX_CONCURRENCY) -> int:
+    """Claim up to n jobs and run them with bounded concurrency; returns how many were claimed"""
+    jobs = await asyncio.to_thread(claim_reindex_jobs, n)
+    if jobs:
+        slots = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(_run_one(job, slots) for job in jobs))
+    return len(jobs)
@@ -0,0 +1,81 @@
+# /server/retrieval.py
+"""
+Hybrid retrieval over artifact_chunks.
+
+Combines pgvector ANN ordering (HNSW on embedding::halfvec) with Postgres
+full-text search (GIN on to_tsvector(content)) and merges the two candidate
+lists with reciprocal-rank fusion. Used by /ask (rag).
+Indexes and the hybrid_search_chunks RPC come from
+drizzle/migrations/2026-10-17_hybrid_retrieval.sql.
+"""
+import os
+from typing import Any, Dict, List, Optional
+from .db import get_conn, aget_conn
+
+RRF_K = int(os.getenv("RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+
+# Same query as the hybrid_search_chunks() RPC, for the direct psycopg path
+HYBRID_SQL = """
+  WITH vec AS (
+    SELECT ac.id, row_number() OVER (ORDER BY ac.embedding::halfvec(3072) <=> %(q)s::halfvec(3072)) AS rnk
+    FROM artifact_chunks ac
+    WHERE %(q)s::vector IS NOT NULL AND ac.org_id = %(org)s AND ac.project_id = %(project)s
+    ORDER BY ac.embedding::halfvec(3072) <=> %(q)s::halfvec(3072)
+    LIMIT %(candidates)s
+  ),
+  fts AS (
+    SELECT ac.id, row_number() OVER (ORDER BY ts_rank_cd(to_tsvector('english', ac.content), tq) DESC) AS rnk
+    FROM artifact_chunks ac, websearch_to_tsquery('english', %(q_text)s) tq
+    WHERE ac.org_id = %(org)s AND ac.project_id = %(project)s
+      AND to_tsvector('english', ac.content) @@ tq
+    ORDER BY ts_rank_cd(to_tsvector('english', ac.content), tq) DESC
+    LIMIT %(candidates)s
+  ),
+  fused AS (
+    SELECT coalesce(vec.id, fts.id) AS id,
+           coalesce(1.0 / (%(rrf_k)s + vec.rnk), 0) + coalesce(1.0 / (%(rrf_k)s + fts.rnk), 0) AS score,
+           vec.rnk AS vector_rank,
+           fts.rnk AS text_rank
+    FROM vec FULL OUTER JOIN fts ON fts.id = vec.id
+  )
+  SELECT ac.id, ac.content, a.title, ac.artifact_id, ac.chunk_index,
+         f.score::double precision, f.vector_rank, f.text_rank
+  FROM fused f
+  JOIN artifact_chunks ac ON ac.id = f.id
+  JOIN artifacts a ON a.id = ac.artifact_id
+  ORDER BY f.score DESC
+  LIMIT %(k)s
+"""
+
+def _params(org_id, project_id, q_emb, q_text, k, candidates):
+    return {
+        "org": org_id, "project": project_id,
+        "q": f"[{','.join(map(str, q_emb))}]" if q_emb is not None else None,
+        "q_text": q_text or "", "k": k, "candidates": candidates or HYBRID_CANDIDATES, "rrf_k": RRF_K,
+    }
+
+def _rows(rows) -> List[Dict[str, Any]]:
+    return [{"id": str(r[0]), "content": r[1], "title": r[2], "artifact_id": str(r[3]),
+             "chunk_index": r[4], "score": r[5], "vector_rank": r[6], "text_rank": r[7]} for r in rows]
+
+def hybrid_search(org_id: str, project_id: str, q_text: str, q_emb: Optional[List[float]] = None,
+                  k: int = 8, candidates: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Top-k chunks by RRF over vector and full-text rankings (text-only when q_emb is None)"""
+    with get_conn() as conn, conn.cursor() as cur:
+        # Pooled connections are autocommit: set_config(..., true) only lasts for its transaction
+        cur.execute("BEGIN READ ONLY")
+        cur.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(HNSW_EF_SEARCH),))
+        cur.execute(HYBRID_SQL, _params(org_id, project_id, q_emb, q_text, k, candidates))
+        rows = cur.fetchall()
+        cur.execute("COMMIT")
+        return _rows(rows)
+
+async def ahybrid_search(org_id: str, project_id: str, q_text: str, q_emb: Optional[List[float]] = None,
+                         k: int = 8, candidates: Optional[int] = None) -> List[Dict[str, Any]]:
+    async with aget_conn() as conn:
+        async with conn.transaction(), conn.cursor() as cur:
+            await cur.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(HNSW_EF_SEARCH),))
+            await cur.execute(HYBRID_SQL, _params(org_id, project_id, q_emb, q_text, k, candidates))
+            return _rows(await cur.fetchall())
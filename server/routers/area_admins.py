@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from ..tenant import TenantCtx
 from ..guards import member_ctx, require_role
 from ..supabase_client import get_user_supabase
+from ..authz_cache import invalidate as invalidate_authz
 
 router = APIRouter(prefix="/api/areas", tags=["areas"])
 
@@ -30,6 +31,7 @@ def add_admin(body: AdminBody, project_id: str = Query(...), ctx: TenantCtx = De
             "org_id": ctx.org_id, "project_id": project_id,
             "area": body.area, "user_id": body.user_id
         }, on_conflict="org_id,project_id,area,user_id").execute()
+        invalidate_authz(ctx.org_id, project_id, body.user_id)
         return {"ok": True}
     except Exception:
         return {"ok": False}
@@ -41,6 +43,7 @@ def remove_admin(area: str = Query(...), user_id: str = Query(...),
     try:
         sb.table("area_admins").delete().eq("org_id", ctx.org_id).eq("project_id", project_id)\
           .eq("area", area).eq("user_id", user_id).execute()
+        invalidate_authz(ctx.org_id, project_id, user_id)
         return {"ok": True}
     except Exception:
         return {"ok": False}
\ No newline at end of file
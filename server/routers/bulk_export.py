@@ -2,16 +2,16 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List
-import zipfile
-import io
 import requests
 import json
 import time
 import logging
 import re
+from itertools import chain
 from ..tenant import TenantCtx
 from ..guards import require_role
 from ..supabase_client import get_user_supabase, get_supabase_client
+from ..zip_stream import ZipStream, prefetch
 
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 PM_PLUS = require_role({"owner","admin","pm","lead"})
@@ -69,59 +69,67 @@ def bulk_export_documents(
         if not artifacts:
             raise HTTPException(status_code=404, detail="No matching documents found")
         
-        # Build ZIP in memory
-        buffer = io.BytesIO()
-        manifest = []
-        
-        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            for artifact in artifacts:
-                if not artifact.get("path"):
-                    continue
-                    
-                signed_url = get_signed_url(artifact["path"])
-                if not signed_url:
-                    continue
-                    
-                try:
-                    # Download file content
-                    response = requests.get(signed_url, timeout=60)
-                    if response.status_code == 200:
-                        # Use title as filename, fallback to path basename
-                        raw_filename = artifact.get("title") or artifact["path"].split("/")[-1]
-                        filename = sanitize_filename(raw_filename)
-                        
-                        # Ensure filename has proper extension
-                        if not any(filename.endswith(ext) for ext in ['.pdf', '.docx', '.txt', '.eml', '.vtt']):
-                            # Try to get extension from path
-                            original_ext = ""
-                            if "." in artifact["path"]:
-                                original_ext = "." + artifact["path"].split(".")[-1]
-                            filename = filename + original_ext
-                        
-                        # Add to ZIP
-                        zip_file.writestr(filename, response.content)
-                        
-                        # Add to manifest
-                        manifest.append({
-                            "id": artifact["id"],
-                            "title": artifact.get("title"),
-                            "filename": filename,
-                            "source": artifact.get("source"),
-                            "created_at": artifact.get("created_at"),
-                            "path": artifact["path"]
-                        })
-                        
-                except Exception as e:
-                    logging.warning(f"Failed to download artifact {artifact['id']}: {e}")
-                    continue
+        def fetch(artifact):
+            """(filename, content) for one artifact; raises when it can't be downloaded"""
+            signed_url = get_signed_url(artifact["path"])
+            if not signed_url:
+                raise RuntimeError("no signed URL")
+            
+            # Download file content
+            response = requests.get(signed_url, timeout=60)
+            response.raise_for_status()
             
-            if not manifest:
-                raise HTTPException(status_code=500, detail="Failed to export any documents")
+            # Use title as filename, fallback to path basename
+            raw_filename = artifact.get("title") or artifact["path"].split("/")[-1]
+            filename = sanitize_filename(raw_filename)
+            
+            # Ensure filename has proper extension
+            if not any(filename.endswith(ext) for ext in ['.pdf', '.docx', '.txt', '.eml', '.vtt']):
+                # Try to get extension from path
+                original_ext = ""
+                if "." in artifact["path"]:
+                    original_ext = "." + artifact["path"].split(".")[-1]
+                filename = filename + original_ext
+            return filename, response.content
+        
+        # Downloads run ZIP_PREFETCH at a time; wait for the first one that succeeds
+        # so a selection that can't be exported still gets an error status
+        downloads = prefetch([a for a in artifacts if a.get("path")], fetch)
+        first = []
+        for artifact, result, err in downloads:
+            if err is None:
+                first.append((artifact, result, err))
+                break
+            logging.warning(f"Failed to download artifact {artifact['id']}: {err}")
+        if not first:
+            raise HTTPException(status_code=500, detail="Failed to export any documents")
+        
+        def chunks():
+            # Each file goes into the response as soon as its download completes
+            z = ZipStream()
+            manifest = []
+            for artifact, result, err in chain(first, downloads):
+                if err is not None:
+                    logging.warning(f"Failed to download artifact {artifact['id']}: {err}")
+                    continue
+                filename, content = result
+                
+                # Add to ZIP
+                yield from z.write(filename, content)
+                
+                # Add to manifest
+                manifest.append({
+                    "id": artifact["id"],
+                    "title": artifact.get("title"),
+                    "filename": filename,
+                    "source": artifact.get("source"),
+                    "created_at": artifact.get("created_at"),
+                    "path": artifact["path"]
+                })
             
             # Add manifest file
-            zip_file.writestr("manifest.json", json.dumps(manifest, indent=2))
-        
-        buffer.seek(0)
+            yield from z.write("manifest.json", json.dumps(manifest, indent=2))
+            yield from z.close()
         
         # Generate filename with timestamp
         timestamp = time.strftime("%Y%m%d-%H%M%S")
@@ -129,12 +137,8 @@ def bulk_export_documents(
         filename = f"{safe_export_name}_{timestamp}.zip"
         
         # Return ZIP as streaming response
-        def iter_bytes():
-            buffer.seek(0)
-            yield buffer.read()
-        
         return StreamingResponse(
-            iter_bytes(),
+            chunks(),
             media_type="application/zip",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -3,10 +3,13 @@ from fastapi.responses import StreamingResponse, FileResponse
 import io, zipfile, json, os, tempfile
 from datetime import datetime, timezone
 from typing import Iterator
+from itertools import islice
 from ..tenant import TenantCtx
 from ..guards import member_ctx, require_role
 from ..supabase_client import get_user_supabase, get_supabase_client
 from ..brand.export_header import export_header_html
+from ..zip_stream import ZipStream, prefetch
+from ..csv_stream import keyset_rows, postgrest_pages
 
 router = APIRouter(prefix="/export", tags=["export"])
 
@@ -58,29 +61,20 @@ def dataroom(project_id: str = Query(...), ctx: TenantCtx = Depends(member_ctx))
 {table("Sign-Off Docs", docs, ["id","name","status","signed_by","signed_at","created_at"])}
 </body></html>"""
         
-        # Create ZIP
-        buf = io.BytesIO()
-        zf = zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED)
-        
-        # Add manifest and metadata
-        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
-        zf.writestr("manifest.html", html_manifest)
-        zf.writestr("share_links.json", json.dumps(links, indent=2, default=str))
-        zf.writestr("signoff_docs.json", json.dumps(docs, indent=2, default=str))
-        
-        # Pack artifacts (best effort, throttle to keep dev fast)
-        for a in arts[:500]:
-            try:
-                b = sbs.storage.from_(a["storage_bucket"]).download(a["storage_path"])
-                zf.writestr(f"artifacts/{a.get('name') or a['id']}", b)
-            except Exception as e:
-                zf.writestr(f"artifacts/_missing_{a['id']}.txt", f"Missing: {e}")
-        
-        zf.close()
-        buf.seek(0)
+        # Stream the ZIP: metadata first, then artifacts as their downloads complete
+        def chunks():
+            z = ZipStream()
+            yield from z.write("manifest.json", json.dumps(manifest, indent=2))
+            yield from z.write("manifest.html", html_manifest)
+            yield from z.write("share_links.json", json.dumps(links, indent=2, default=str))
+            yield from z.write("signoff_docs.json", json.dumps(docs, indent=2, default=str))
+            
+            # Pack artifacts (best effort, throttle to keep dev fast)
+            yield from _artifact_entries(z, sbs, arts[:500])
+            yield from z.close()
         
         return StreamingResponse(
-            iter([buf.getvalue()]), 
+            chunks(), 
             media_type="application/zip",
             headers={"Content-Disposition": 'attachment; filename="dataroom.zip"'}
         )
@@ -101,40 +95,42 @@ def dataroom(project_id: str = Query(...), ctx: TenantCtx = Depends(member_ctx))
 
 PM_PLUS = require_role({"owner","admin","pm","lead"})
 
+def _download(sbs, a) -> bytes:
+    return sbs.storage.from_(a["storage_bucket"]).download(a["storage_path"])
+
+def _artifact_entries(z: ZipStream, sbs, arts) -> Iterator[bytes]:
+    """Artifact files (or a _missing_ note) downloaded ZIP_PREFETCH at a time, written as each completes"""
+    for a, b, err in prefetch(arts, lambda a: _download(sbs, a)):
+        if err is None:
+            yield from z.write(f"artifacts/{a.get('name') or a['id']}", b)
+        else:
+            yield from z.write(f"artifacts/_missing_{a['id']}.txt", f"Missing: {err}")
+
 def _stream_zip_generator(ctx: TenantCtx, project_id: str, memory_mode: bool = False) -> Iterator[bytes]:
     """
-    Memory-efficient ZIP streaming generator for large dataroom exports.
+    Streaming ZIP generator for large dataroom exports.
     
-    memory_mode=True: Uses disk-backed streaming with SpooledTemporaryFile (memory-efficient)
-    memory_mode=False: Uses BytesIO in-memory approach (faster for smaller exports)
+    Entries are written straight to the response (ZipStream) while artifacts
+    are downloaded ZIP_PREFETCH at a time, so memory stays bounded in both modes.
+    memory_mode=True: Pages through every artifact
+    memory_mode=False: Stops after the first 5000 artifacts
     """
-    sb = get_user_supabase(ctx)
-    sbs = get_supabase_client()
-    
-    # Get project and branding data
-    proj = sb.table("projects").select("code").eq("id", project_id).single().execute().data or {}
-    code = proj.get("code") or project_id
-    org = sb.table("org_branding").select("*").eq("org_id", ctx.org_id).single().execute().data or {}
-    
-    # Collect metadata first (lightweight queries)
-    links = sb.table("share_links").select("artifact_id,token,expires_at,revoked_at,created_at")\
-            .eq("org_id", ctx.org_id).eq("project_id", project_id).limit(5000).execute().data or []
-    docs = sb.table("signoff_docs").select("id,name,status,signed_by,signed_name,signed_at,created_at")\
-            .eq("org_id", ctx.org_id).eq("project_id", project_id).limit(2000).execute().data or []
-    
-    # Create appropriate file-like object based on memory mode
-    if memory_mode:
-        # Memory-efficient: Use disk-backed temporary file for large exports
-        from tempfile import SpooledTemporaryFile
-        zip_file_obj = SpooledTemporaryFile(max_size=50*1024*1024)  # 50MB threshold
-    else:
-        # Standard mode: Use in-memory BytesIO for faster small exports
-        zip_file_obj = io.BytesIO()
-    
-    last_yield_pos = 0
+    z = ZipStream()
     
     try:
-        zip_file = zipfile.ZipFile(zip_file_obj, "w", zipfile.ZIP_DEFLATED, compresslevel=1)
+        sb = get_user_supabase(ctx)
+        sbs = get_supabase_client()
+        
+        # Get project and branding data
+        proj = sb.table("projects").select("code").eq("id", project_id).single().execute().data or {}
+        code = proj.get("code") or project_id
+        org = sb.table("org_branding").select("*").eq("org_id", ctx.org_id).single().execute().data or {}
+        
+        # Collect metadata first (lightweight queries)
+        links = sb.table("share_links").select("artifact_id,token,expires_at,revoked_at,created_at")\
+                .eq("org_id", ctx.org_id).eq("project_id", project_id).limit(5000).execute().data or []
+        docs = sb.table("signoff_docs").select("id,name,status,signed_by,signed_name,signed_at,created_at")\
+                .eq("org_id", ctx.org_id).eq("project_id", project_id).limit(2000).execute().data or []
         
         # Add manifest and metadata files first
         manifest = {
@@ -146,10 +142,6 @@ def _stream_zip_generator(ctx: TenantCtx, project_id: str, memory_mode: bool = F
             "streaming": True
         }
         
-        zip_file.writestr("manifest.json", json.dumps(manifest, indent=2))
-        zip_file.writestr("share_links.json", json.dumps(links, indent=2, default=str))
-        zip_file.writestr("signoff_docs.json", json.dumps(docs, indent=2, default=str))
-        
         # Build HTML manifest
         hdr = export_header_html(org, code)
         def table(title, rows, cols):
@@ -170,87 +162,28 @@ def _stream_zip_generator(ctx: TenantCtx, project_id: str, memory_mode: bool = F
 {table("Sign-Off Docs", docs, ["id","name","status","signed_by","signed_at","created_at"])}
 </body></html>"""
         
-        zip_file.writestr("manifest.html", html_manifest)
-        
-        def yield_new_bytes():
-            """Yield new bytes since last yield without closing the ZIP"""
-            nonlocal last_yield_pos
-            if memory_mode:
-                # For streaming mode, yield incrementally  
-                zip_file_obj.flush()
-                current_pos = zip_file_obj.tell()
-                zip_file_obj.seek(last_yield_pos)
-                new_bytes = zip_file_obj.read(current_pos - last_yield_pos)
-                last_yield_pos = current_pos
-                if new_bytes:
-                    yield new_bytes
-        
-        # Process artifacts in batches for memory mode, all at once for standard
-        if memory_mode:
-            batch_size = 25  # Smaller batches for streaming
-            offset = 0
-            
-            while True:
-                arts_batch = sb.table("artifacts").select("id,name,storage_bucket,storage_path,created_at")\
-                    .eq("org_id", ctx.org_id).eq("project_id", project_id)\
-                    .order("created_at")\
-                    .range(offset, offset + batch_size - 1).execute().data or []
-                
-                if not arts_batch:
-                    break
-                    
-                for a in arts_batch:
-                    try:
-                        b = sbs.storage.from_(a["storage_bucket"]).download(a["storage_path"])
-                        zip_file.writestr(f"artifacts/{a.get('name') or a['id']}", b)
-                    except Exception as e:
-                        zip_file.writestr(f"artifacts/_missing_{a['id']}.txt", f"Missing: {e}")
-                
-                offset += batch_size
-                
-                # Stream incremental bytes every few batches
-                if offset % 50 == 0:
-                    yield from yield_new_bytes()
-        else:
-            # Standard mode: Load all artifacts at once
-            arts = sb.table("artifacts").select("id,name,storage_bucket,storage_path,created_at")\
-                    .eq("org_id", ctx.org_id).eq("project_id", project_id)\
-                    .order("created_at")\
-                    .limit(5000).execute().data or []
-                    
-            for a in arts:
-                try:
-                    b = sbs.storage.from_(a["storage_bucket"]).download(a["storage_path"])
-                    zip_file.writestr(f"artifacts/{a.get('name') or a['id']}", b)
-                except Exception as e:
-                    zip_file.writestr(f"artifacts/_missing_{a['id']}.txt", f"Missing: {e}")
-        
-        # Close ZIP and yield final bytes
-        zip_file.close()
-        
-        if memory_mode:
-            # Yield any remaining bytes
-            yield from yield_new_bytes()
-        else:
-            # Standard mode: yield all bytes at once
-            zip_file_obj.seek(0)
-            while True:
-                chunk = zip_file_obj.read(8192)
-                if not chunk:
-                    break
-                yield chunk
-        
-        zip_file_obj.close()
+        # Artifacts are listed a page at a time (keyset on created_at, id) as the downloads drain
+        arts = keyset_rows(postgrest_pages(
+            lambda: sb.table("artifacts").select("id,name,storage_bucket,storage_path,created_at")
+                      .eq("org_id", ctx.org_id).eq("project_id", project_id)
+        ))
+        if not memory_mode:
+            arts = islice(arts, 5000)
+        
+        yield from z.write("manifest.json", json.dumps(manifest, indent=2))
+        yield from z.write("share_links.json", json.dumps(links, indent=2, default=str))
+        yield from z.write("signoff_docs.json", json.dumps(docs, indent=2, default=str))
+        yield from z.write("manifest.html", html_manifest)
+        yield from _artifact_entries(z, sbs, arts)
+        yield from z.close()
             
     except Exception as e:
-        # Clean up and log error - do not yield additional content after streaming started
-        zip_file_obj.close()
-        # Log the error instead of yielding corrupt content
+        # Log error - do not yield additional content after streaming started
         import logging
         logging.error(f"Streaming dataroom export failed for project {project_id}: {e}")
         # If this is the first content, we can yield an error ZIP
         # If streaming already started, the client will get a partial download
-        if last_yield_pos == 0:
+        if z.bytes_out == 0:
             error_buf = io.BytesIO()
             error_zip = zipfile.ZipFile(error_buf, "w", zipfile.ZIP_DEFLATED)
             error_zip.writestr("error.txt", f"Export failed before streaming began: {e}")
@@ -261,21 +194,15 @@ def _stream_zip_generator(ctx: TenantCtx, project_id: str, memory_mode: bool = F
 @router.get("/zip-stream")
 def stream_dataroom_zip(
     project_id: str = Query(...), 
-    memory_mode: bool = Query(False, description="Enable memory-efficient disk-backed streaming for large exports"),
+    memory_mode: bool = Query(False, description="Export every artifact instead of the first 5000"),
     ctx: TenantCtx = Depends(PM_PLUS)
 ):
     """
-    Streaming Data Room ZIP export with memory mode toggle.
-    
-    Memory mode (memory_mode=true):
-    - Uses disk-backed SpooledTemporaryFile for memory efficiency
-    - Streams incrementally during processing
-    - Recommended for large exports (>1000 files)
+    Streaming Data Room ZIP export.
     
-    Standard mode (memory_mode=false): 
-    - Uses in-memory BytesIO for faster processing
-    - Single response after full processing
-    - Recommended for smaller exports (<1000 files)
+    Both modes stream entries as artifacts download (bounded prefetch, constant memory).
+    Memory mode (memory_mode=true): exports every artifact
+    Standard mode (memory_mode=false): exports the first 5000 artifacts
     """
     try:
         proj = get_user_supabase(ctx).table("projects").select("code").eq("id", project_id).single().execute().data or {}
@@ -7,6 +7,7 @@ import hashlib, secrets, os
 from ..tenant import TenantCtx
 from ..guards import require_role
 from ..supabase_client import get_user_supabase, get_supabase_client as get_service_supabase
+from ..authz_cache import invalidate as invalidate_authz
 
 router = APIRouter(prefix="/invite", tags=["invite-seeding"])
 ADMIN_ONLY = require_role({"owner","admin"})
@@ -220,6 +221,7 @@ def accept_invite(body: AcceptInviteBody):
             "role": invite_data["role"],
             "can_sign": invite_data["can_sign"]
         }, on_conflict="org_id,project_id,user_id").execute()
+        invalidate_authz(invite_data["org_id"], invite_data["project_id"], user_id)
         
         # Delete the invite
         sbs.table("project_invites").delete().eq("id", invite_data["id"]).execute()
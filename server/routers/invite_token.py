@@ -5,6 +5,7 @@ import secrets, os
 from ..tenant import TenantCtx
 from ..guards import require_role
 from ..supabase_client import get_user_supabase, get_supabase_client as get_service_supabase
+from ..authz_cache import invalidate as invalidate_authz
 
 router = APIRouter(prefix="/invite", tags=["invite"])
 ADMIN = require_role({"owner","admin"})
@@ -51,4 +52,5 @@ def accept_token(token: str):
     "can_sign_all": r["can_sign_all"], "sign_areas": r["sign_areas"]
   }, on_conflict="org_id,project_id,user_id").execute()
   sbs.table("pending_invites").update({"used_at": datetime.now(timezone.utc).isoformat()}).eq("id", r["id"]).execute()
+  invalidate_authz(r["org_id"], r["project_id"], r["email"])
   return {"ok": True}
\ No newline at end of file
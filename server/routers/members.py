@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from ..tenant import TenantCtx
 from ..guards import member_ctx, require_role
 from ..supabase_client import get_supabase_client
+from ..authz_cache import invalidate as invalidate_authz
 
 router = APIRouter(prefix="/members", tags=["members"])
 ADMIN_OR_OWNER = require_role({"owner", "admin"})
@@ -63,6 +64,7 @@ def upsert_member(body: UpsertBody, project_id: str = Query(...), ctx: TenantCtx
             "role": body.role, 
             "can_sign": body.can_sign
         }, on_conflict="org_id,project_id,user_id").execute()
+        invalidate_authz(ctx.org_id, project_id, body.user_id)
         return {"ok": True}
     except Exception as e:
         # Development fallback using direct database
@@ -77,6 +79,7 @@ def upsert_member(body: UpsertBody, project_id: str = Query(...), ctx: TenantCtx
                     DO UPDATE SET role = EXCLUDED.role, can_sign = EXCLUDED.can_sign
                 """, (ctx.org_id, project_id, body.user_id, body.role, body.can_sign))
                 conn.commit()
+            invalidate_authz(ctx.org_id, project_id, body.user_id)
             return {"ok": True}
         except Exception as db_e:
             raise HTTPException(500, f"Failed to upsert member: {str(db_e)}")
@@ -93,6 +96,7 @@ def remove_member(user_id: str, project_id: str = Query(...), ctx: TenantCtx = D
         sb = get_supabase_client()
         sb.table("project_members").delete().eq("org_id", ctx.org_id)\
             .eq("project_id", project_id).eq("user_id", user_id).execute()
+        invalidate_authz(ctx.org_id, project_id, user_id)
         return {"ok": True}
     except Exception as e:
         # Development fallback using direct database
@@ -105,6 +109,7 @@ def remove_member(user_id: str, project_id: str = Query(...), ctx: TenantCtx = D
                     WHERE org_id = %s AND project_id = %s AND user_id = %s
                 """, (ctx.org_id, project_id, user_id))
                 conn.commit()
+            invalidate_authz(ctx.org_id, project_id, user_id)
             return {"ok": True}
         except Exception as db_e:
             raise HTTPException(500, f"Failed to remove member: {str(db_e)}")
\ No newline at end of file
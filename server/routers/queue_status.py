@@ -48,6 +48,15 @@ def get_queue_status(ctx: TenantCtx = Depends(ADMIN_ONLY)):
         except Exception:
             queue_lengths["reindex_running"] = 0
             
+        # Ingestion jobs (ingest_queue)
+        for status in ("pending", "running", "failed"):
+            try:
+                result = sbs.table("ingest_jobs").select("*", count="exact", head=True)\
+                           .eq("org_id", ctx.org_id).eq("status", status).execute()
+                queue_lengths[f"ingest_{status}"] = result.count or 0
+            except Exception:
+                queue_lengths[f"ingest_{status}"] = 0
+            
         # Calculate scheduler health
         scheduler_status = "unknown"
         if scheduler_heartbeat["last_seen"]:
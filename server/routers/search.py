@@ -26,6 +26,20 @@ def search(q: str = Query(..., min_length=2, max_length=80),
     except Exception:
         pass
 
+    # Document content: full-text match on chunks (the GIN index on to_tsvector('english', content)),
+    # through the user's client like every other source so RLS applies
+    try:
+        chunks = sb.table("artifact_chunks").select("id,content,artifact_id,created_at,artifacts(title)")\
+            .eq("org_id", ctx.org_id).eq("project_id", project_id)\
+            .order("created_at", desc=True).limit(limit)\
+            .text_search("content", q, {"type": "web_search", "config": "english"}).execute().data or []
+        for c in chunks:
+            title = (c.get("artifacts") or {}).get("title") or "Document"
+            results.append({"type":"chunk", "id":c["id"], "title":title, "snippet":(c.get("content") or "")[:200],
+                            "ts":c["created_at"], "artifact_id":c["artifact_id"]})
+    except Exception:
+        pass
+
     # Actions / Risks / Decisions (generic table names assumed)
     from ..visibility_guard import get_visibility_context, apply_area_visibility_filter
     
@@ -65,8 +79,13 @@ def search(q: str = Query(..., min_length=2, max_length=80),
     except Exception:
         pass
 
-    # simple rank: newest first, trim
-    results = sorted(results, key=lambda x: x["ts"], reverse=True)[:limit]
+    # Sources have no common relevance score: keep them grouped in the order queried above,
+    # each newest first, and trim
+    order = {}
+    for r in results:
+        order.setdefault(r["type"], len(order))
+    results = sorted(results, key=lambda x: x["ts"] or "", reverse=True)
+    results = sorted(results, key=lambda x: order[x["type"]])[:limit]
     return {"items": results}
 
 # Alias endpoint without /api prefix for routing resilience
@@ -4,6 +4,7 @@ from typing import List, Optional
 from ..tenant import TenantCtx
 from ..guards import member_ctx, require_role
 from ..supabase_client import get_supabase_client
+from ..authz_cache import invalidate as invalidate_authz
 
 router = APIRouter(prefix="/team-access", tags=["team-access"])
 ADMIN_OR_OWNER = require_role({"owner", "admin"})
@@ -95,6 +96,7 @@ def upsert_access_control(body: UpsertAccessBody, project_id: str = Query(...),
             "notify_reminders": body.notify_reminders,
             "updated_at": "now()"
         }, on_conflict="org_id,project_id,user_id").execute()
+        invalidate_authz(ctx.org_id, project_id, body.user_id)
         return {"ok": True}
     except Exception as e:
         # Development fallback using direct database
@@ -125,6 +127,7 @@ def upsert_access_control(body: UpsertAccessBody, project_id: str = Query(...),
                       body.notify_actions, body.notify_risks, body.notify_decisions, 
                       body.notify_reminders))
                 conn.commit()
+            invalidate_authz(ctx.org_id, project_id, body.user_id)
             return {"ok": True}
         except Exception as db_e:
             # Graceful fallback for development - return success without actual storage
@@ -1,5 +1,3 @@
-import csv
-from io import StringIO
 import json
 from datetime import datetime, timedelta
 from typing import Optional
@@ -10,6 +8,7 @@ from fastapi.responses import StreamingResponse, HTMLResponse
 from ..tenant import TenantCtx
 from ..guards import member_ctx
 from ..db import get_conn
+from ..csv_stream import iter_csv, sql_stream
 
 router = APIRouter()
 
@@ -28,8 +27,27 @@ def build_trend_filter(project_id: str, area_filter: Optional[str] = None, owner
     
     return " AND ".join(where_clauses), params
 
+CSV_HEADERS = [
+    "Week", "Area", "Owner", "Entries", "Avg Mood", "Avg Stress",
+    "Avg Workload", "Support Requests", "Feedback Summary"
+]
+
+def _trend_csv_row(row):
+    week, area, owner, count, mood, stress, workload, support, feedback = row
+    return [
+        week.strftime("%Y-%m-%d") if week else "",
+        area or "",
+        owner or "",
+        count or 0,
+        f"{mood:.1f}" if mood else "",
+        f"{stress:.1f}" if stress else "",
+        f"{workload:.1f}" if workload else "",
+        support or 0,
+        feedback or ""
+    ]
+
 @router.get("/trend_by.csv")
-async def trend_by_csv(
+def trend_by_csv(
     project_id: str = Query(...),
     area_filter: Optional[str] = Query(None),
     owner_filter: Optional[str] = Query(None),
@@ -41,9 +59,6 @@ async def trend_by_csv(
         raise HTTPException(status_code=403, detail="Insufficient permissions")
     
     try:
-        conn = get_conn()
-        cursor = conn.cursor()
-        
         # Build filter conditions
         where_clause, params = build_trend_filter(project_id, area_filter, owner_filter)
         
@@ -66,36 +81,8 @@ async def trend_by_csv(
             ORDER BY week DESC, w.stage_area, w.stage_owner
         """
         
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        
-        # Generate CSV
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Headers
-        writer.writerow([
-            "Week", "Area", "Owner", "Entries", "Avg Mood", "Avg Stress", 
-            "Avg Workload", "Support Requests", "Feedback Summary"
-        ])
-        
-        # Data rows
-        for row in rows:
-            week, area, owner, count, mood, stress, workload, support, feedback = row
-            writer.writerow([
-                week.strftime("%Y-%m-%d") if week else "",
-                area or "",
-                owner or "",
-                count or 0,
-                f"{mood:.1f}" if mood else "",
-                f"{stress:.1f}" if stress else "",
-                f"{workload:.1f}" if workload else "",
-                support or 0,
-                feedback or ""
-            ])
-        
-        cursor.close()
-        conn.close()
+        # Grouped rows have no (created_at, id) keyset: stream them through a server-side cursor
+        rows = sql_stream(query, params)
         
         # Generate filename with filters
         filename_parts = ["wellness_trend"]
@@ -105,9 +92,8 @@ async def trend_by_csv(
             filename_parts.append(f"owner_{owner_filter}")
         filename = f"{'_'.join(filename_parts)}.csv"
         
-        output.seek(0)
         return StreamingResponse(
-            iter([output.getvalue()]),
+            iter_csv((_trend_csv_row(r) for r in rows), CSV_HEADERS),
             media_type="text/csv",
             headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
@@ -1221,7 +1221,12 @@ export async function registerRoutes(app: Express): Promise<Server> {
       
       console.log(`[API Forward] ${req.method} ${req.path}${queryString} -> ${path}${queryString}`);
       
+      // Abort the upstream request if the browser goes away (cancels streamed completions)
+      const upstream = new AbortController();
+      res.on('close', () => { if (!res.writableEnded) upstream.abort(); });
+      
       const response = await fetch(url, {
+        signal: upstream.signal,
         method: req.method,
         headers: {
           // Only forward specific headers for security
@@ -1238,7 +1243,25 @@ export async function registerRoutes(app: Express): Promise<Server> {
         body: ['GET', 'HEAD'].includes(req.method) ? undefined : JSON.stringify(req.body)
       });
       
-      if (response.headers.get('content-type')?.includes('application/json')) {
+      if (response.headers.get('content-type')?.includes('text/event-stream') && response.body) {
+        // Server-sent events (e.g. /ask/stream): pass chunks through as they arrive
+        res.status(response.status);
+        res.setHeader('Content-Type', 'text/event-stream');
+        res.setHeader('Cache-Control', 'no-cache');
+        res.setHeader('X-Accel-Buffering', 'no');
+        res.flushHeaders();
+        const reader = response.body.getReader();
+        try {
+          for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            res.write(Buffer.from(value));
+          }
+        } catch (streamErr: any) {
+          if (streamErr?.name !== 'AbortError') console.error(`[API Forward] Stream error for ${req.path}:`, streamErr.message);
+        }
+        res.end();
+      } else if (response.headers.get('content-type')?.includes('application/json')) {
         const data = await response.json();
         console.log(`[API Forward] Response ${response.status} for ${req.method} ${req.path}`);
         res.status(response.status).json(data);
@@ -1248,6 +1271,7 @@ export async function registerRoutes(app: Express): Promise<Server> {
         res.status(response.status).send(text);
       }
     } catch (error: any) {
+      if (error?.name === 'AbortError') return; // client disconnected
       console.error(`[API Forward] Error for ${req.method} ${req.path}:`, error.message);
       res.status(500).json({ error: "API forward error", details: error.message });
     }
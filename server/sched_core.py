@@ -0,0 +1,234 @@
+# /server/sched_core.py
+"""
+Event-driven background job scheduler.
+
+Jobs are one-pass coroutines kept in a min-heap by next due time; the loop
+sleeps until the earliest one is due instead of each job polling on its own.
+
+- Timed jobs run every `interval` seconds. A job may return a number of
+  seconds to run sooner (e.g. 0 after a full batch, or until the next queued
+  row's not_before).
+- Queue jobs also LISTEN on a channel (a NOTIFY trigger fires on insert, see
+  drizzle/migrations/2026-10-17_scheduler_notify.sql) and run as soon as a
+  notification arrives. While listening they only poll every
+  SCHED_LISTEN_POLL_SEC as a safety net; if the listener is down they fall
+  back to their own interval.
+- Singleton jobs run only on the leader: the worker holding the session
+  advisory lock SCHED_LEADER_LOCK_KEY. Followers retry every
+  SCHED_LEADER_RETRY_SEC, so a new leader takes over when the old one exits.
+
+Each worker keeps two dedicated connections (listener, leader lock) outside
+the pool.
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+SCHED_LISTEN_POLL_SEC = float(os.getenv("SCHED_LISTEN_POLL_SEC", "300"))
+SCHED_LEADER_RETRY_SEC = float(os.getenv("SCHED_LEADER_RETRY_SEC", "30"))
+SCHED_RECONNECT_MAX_SEC = float(os.getenv("SCHED_RECONNECT_MAX_SEC", "60"))
+SCHED_LEADER_ELECTION = os.getenv("SCHED_LEADER_ELECTION", "1") == "1"
+SCHED_LEADER_LOCK_KEY = 0x73636864
+
+log = logging.getLogger("scheduler")
+
+class Job:
+    def __init__(self, name: str, fn: Callable[[], Awaitable[Optional[float]]], interval: float,
+                 channel: Optional[str] = None, singleton: bool = True):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.channel = channel
+        self.singleton = singleton
+        self.due = 0.0
+        self.running = False
+        self.rerun = False  # notified while running
+        self.runs = 0
+        self.errors = 0
+        self.notified = 0
+        self.last_run: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: Dict[str, Job] = {}
+        self._heap: List[tuple] = []
+        self._seq = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        # In-flight job runs; the loop only keeps weak references to tasks
+        self._runs: Set[asyncio.Task] = set()
+        self.listening = False
+        self.is_leader = not SCHED_LEADER_ELECTION
+
+    def add(self, name: str, fn: Callable[[], Awaitable[Optional[float]]], interval: float,
+            channel: Optional[str] = None, singleton: bool = True):
+        self.jobs[name] = Job(name, fn, interval, channel, singleton)
+
+    def _schedule(self, job: Job, delay: float):
+        job.due = time.monotonic() + max(0.0, delay)
+        self._seq += 1
+        heapq.heappush(self._heap, (job.due, self._seq, job.name))  # stale entries are skipped on pop
+        if self._wake:
+            self._wake.set()
+
+    def _poll_interval(self, job: Job) -> float:
+        if job.channel and self.listening:
+            return max(job.interval, SCHED_LISTEN_POLL_SEC)
+        return job.interval
+
+    def notify(self, channel: str):
+        """Run the jobs listening on channel now (or right after their current run)"""
+        for job in self.jobs.values():
+            if job.channel == channel:
+                job.notified += 1
+                if job.running:
+                    job.rerun = True
+                else:
+                    self._schedule(job, 0)
+
+    def start(self):
+        self._wake = asyncio.Event()
+        for job in self.jobs.values():
+            self._schedule(job, 0)
+        self._tasks.append(asyncio.create_task(self._loop()))
+        channels = sorted({j.channel for j in self.jobs.values() if j.channel})
+        if channels:
+            self._tasks.append(asyncio.create_task(self._listen(channels)))
+        if SCHED_LEADER_ELECTION:
+            self._tasks.append(asyncio.create_task(self._elect()))
+
+    async def _loop(self):
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                due, _, name = heapq.heappop(self._heap)
+                job = self.jobs[name]
+                if due != job.due or job.running:
+                    continue
+                if job.singleton and not self.is_leader:
+                    self._schedule(job, self._poll_interval(job))
+                    continue
+                job.running = True
+                task = asyncio.create_task(self._run(job))
+                self._runs.add(task)
+                task.add_done_callback(self._runs.discard)
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, job: Job):
+        started = time.monotonic()
+        delay = None
+        try:
+            delay = await job.fn()
+            job.last_error = None
+        except Exception as e:
+            job.errors += 1
+            job.last_error = str(e)
+            log.error(f"scheduler job {job.name} failed: {e}")
+        job.runs += 1
+        job.last_run = time.time()
+        job.last_duration = time.monotonic() - started
+        job.running = False
+        if job.rerun:
+            job.rerun = False
+            delay = 0
+        interval = self._poll_interval(job)
+        self._schedule(job, interval if delay is None else min(delay, interval))
+
+    async def _connect(self):
+        import psycopg
+        from .db import _dsn
+        return await psycopg.AsyncConnection.connect(_dsn(), autocommit=True)
+
+    async def _listen(self, channels: List[str]):
+        backoff = 1.0
+        while True:
+            conn = None
+            try:
+                conn = await self._connect()
+                for ch in channels:
+                    await conn.execute(f'LISTEN "{ch}"')
+                self.listening = True
+                backoff = 1.0
+                # Anything queued while we weren't listening
+                for ch in channels:
+                    self.notify(ch)
+                log.info(f"scheduler listening on {', '.join(channels)}")
+                async for n in conn.notifies():
+                    self.notify(n.channel)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning(f"scheduler listener disconnected, polling until it reconnects: {e}")
+            finally:
+                self.listening = False
+                if conn is not None:
+                    try:
+                        await conn.close()
+                    except Exception:
+                        pass
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, SCHED_RECONNECT_MAX_SEC)
+
+    async def _elect(self):
+        conn = None
+        while True:
+            try:
+                if conn is None or conn.closed:
+                    conn = await self._connect()
+                    self.is_leader = False
+                if self.is_leader:
+                    await conn.execute("SELECT 1")  # the lock lives as long as this session
+                else:
+                    cur = await conn.execute("SELECT pg_try_advisory_lock(%s)", (SCHED_LEADER_LOCK_KEY,))
+                    if (await cur.fetchone())[0]:
+                        self.is_leader = True
+                        log.info("scheduler: this worker is now the leader")
+                        for job in self.jobs.values():
+                            if job.singleton and not job.running:
+                                self._schedule(job, 0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.is_leader:
+                    log.warning(f"scheduler: lost leadership ({e})")
+                self.is_leader = False
+                if conn is not None:
+                    try:
+                        await conn.close()
+                    except Exception:
+                        pass
+                conn = None
+            await asyncio.sleep(SCHED_LEADER_RETRY_SEC)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "leader": self.is_leader,
+            "listening": self.listening,
+            "jobs": {
+                j.name: {
+                    "interval": self._poll_interval(j), "channel": j.channel, "singleton": j.singleton,
+                    "running": j.running, "next_in": round(max(0.0, j.due - now), 1),
+                    "runs": j.runs, "errors": j.errors, "notified": j.notified,
+                    "last_run": j.last_run, "last_duration": j.last_duration, "last_error": j.last_error,
+                } for j in self.jobs.values()
+            },
+        }
+
+_scheduler: Optional[Scheduler] = None
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
@@ -1,9 +1,43 @@
+# /server/supabase_client.py
+"""
+Supabase client registry.
+
+- get_supabase_client(): one service-role client per process (keyed by URL
+  and key), so its PostgREST/storage HTTP connection pools are reused
+  instead of rebuilt on every call.
+- get_user_supabase(ctx): a lightweight per-request client carrying the
+  user's JWT. Its PostgREST and storage sessions are thin httpx.Clients over
+  one shared transport, so they reuse pooled keep-alive connections;
+  SUPABASE_MAX_CONNECTIONS bounds how many requests are in flight at once
+  (the rest wait up to SUPABASE_POOL_TIMEOUT_SEC for a connection).
+
+supabase_stats() reports client creation/reuse and how many HTTP requests
+went out over an already-open connection.
+"""
 import os
 import logging
+import threading
 from supabase import create_client, Client
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Tuple
 from postgrest.exceptions import APIError
 
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_SEC = float(os.getenv("SUPABASE_KEEPALIVE_SEC", "30"))
+SUPABASE_POOL_TIMEOUT_SEC = float(os.getenv("SUPABASE_POOL_TIMEOUT_SEC", "10"))
+SUPABASE_HTTP_TIMEOUT_SEC = float(os.getenv("SUPABASE_HTTP_TIMEOUT_SEC", "120"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "1") == "1"
+
+_lock = threading.Lock()
+_service_clients: Dict[Tuple[str, str], Client] = {}
+_transport = None
+_stats = {"service_created": 0, "service_reused": 0, "user_clients": 0,
+          "http_requests": 0, "connections_opened": 0}
+
+def _count(stat: str, n: int = 1):
+    with _lock:
+        _stats[stat] += n
+
 # Initialize Supabase client
 def get_supabase_client() -> Client:
     url = os.getenv("SUPABASE_URL")
@@ -12,15 +46,99 @@ def get_supabase_client() -> Client:
     if not url or not service_role_key:
         raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
     
-    return create_client(url, service_role_key)
+    key = (url, service_role_key)
+    client = _service_clients.get(key)
+    if client is not None:
+        _count("service_reused")
+        return client
+    with _lock:
+        client = _service_clients.get(key)
+        if client is None:
+            client = _service_clients[key] = create_client(url, service_role_key)
+            _stats["service_created"] += 1
+    return client
 
 def get_supabase_storage_client():
     client = get_supabase_client()
     bucket_name = os.getenv("BUCKET", "project-artifacts")
     return client.storage.from_(bucket_name)
 
+def _shared_transport():
+    """Process-wide httpx transport: the connection pool behind every user client"""
+    global _transport
+    if _transport is None:
+        import httpx
+
+        class CountingTransport(httpx.HTTPTransport):
+            def handle_request(self, request):
+                _count("http_requests")
+                outer = request.extensions.get("trace")
+                def trace(event, info):
+                    if event == "connection.connect_tcp.complete":
+                        _count("connections_opened")
+                    if outer:
+                        outer(event, info)
+                request.extensions["trace"] = trace
+                return super().handle_request(request)
+
+        limits = httpx.Limits(max_connections=SUPABASE_MAX_CONNECTIONS,
+                              max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                              keepalive_expiry=SUPABASE_KEEPALIVE_SEC)
+        with _lock:
+            if _transport is None:
+                try:
+                    _transport = CountingTransport(limits=limits, http2=SUPABASE_HTTP2)
+                except ImportError:  # http2 needs the h2 package
+                    _transport = CountingTransport(limits=limits)
+    return _transport
+
+def _http_client():
+    """A thin httpx.Client over the shared transport (never closed: that would close the pool)"""
+    import httpx
+    timeout = httpx.Timeout(SUPABASE_HTTP_TIMEOUT_SEC, pool=SUPABASE_POOL_TIMEOUT_SEC)
+    return httpx.Client(transport=_shared_transport(), timeout=timeout, follow_redirects=True, trust_env=False)
+
+class UserSupabase:
+    """
+    Per-request Supabase client for one user's JWT: the PostgREST and storage
+    parts of supabase.Client, built lazily over the shared connection pool.
+    """
+    def __init__(self, url: str, anon_key: str, jwt: str):
+        self.supabase_url = url
+        self.headers = {"apiKey": anon_key, "Authorization": f"Bearer {jwt}"}
+        self._postgrest = None
+        self._storage = None
+
+    @property
+    def postgrest(self):
+        if self._postgrest is None:
+            from postgrest import SyncPostgrestClient
+            self._postgrest = SyncPostgrestClient(f"{self.supabase_url}/rest/v1", headers=dict(self.headers),
+                                                  schema="public", http_client=_http_client())
+        return self._postgrest
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            from storage3 import SyncStorageClient
+            self._storage = SyncStorageClient(f"{self.supabase_url}/storage/v1", headers=dict(self.headers),
+                                              http_client=_http_client())
+        return self._storage
+
+    def table(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def from_(self, table_name: str):
+        return self.postgrest.from_(table_name)
+
+    def schema(self, schema: str):
+        return self.postgrest.schema(schema)
+
+    def rpc(self, fn: str, params: Optional[Dict[Any, Any]] = None, count=None, head: bool = False, get: bool = False):
+        return self.postgrest.rpc(fn, params or {}, count, head, get)
+
 def get_user_supabase(ctx) -> Client:
-    """Create a user-scoped Supabase client that respects RLS using the user's JWT"""
+    """User-scoped Supabase client that respects RLS using the user's JWT"""
     from fastapi import HTTPException
     
     url = os.getenv("SUPABASE_URL")
@@ -37,16 +155,24 @@ def get_user_supabase(ctx) -> Client:
         if not service_role_key:
             raise ValueError("SUPABASE_SERVICE_ROLE_KEY required for dev mode operations")
         # Use service role for dev mode - bypasses RLS but dev is already authenticated via X-Dev headers
-        return create_client(url, service_role_key)
+        return get_supabase_client()
     
     # Production: Require JWT for RLS enforcement
     if not ctx.jwt:
         raise HTTPException(401, "User JWT required for user-scoped database operations")
     
-    client = create_client(url, anon_key)
-    client.postgrest.auth(ctx.jwt)  # Apply user JWT so RLS filters correctly
-    return client
+    # JWT in the client's own headers (not postgrest.auth, which would set it on a shared session)
+    _count("user_clients")
+    return UserSupabase(url, anon_key, ctx.jwt)
 
+def supabase_stats() -> Dict[str, Any]:
+    """Client reuse and connection reuse for the shared user-client pool"""
+    with _lock:
+        s = dict(_stats)
+    s["service_clients"] = len(_service_clients)
+    s["connection_reuse"] = round(1 - s["connections_opened"] / s["http_requests"], 3) if s["http_requests"] else None
+    s["max_connections"] = SUPABASE_MAX_CONNECTIONS
+    return s
 
 def safe_execute(query, default_value=None, log_missing_table=True):
     """
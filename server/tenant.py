@@ -1,12 +1,21 @@
 from fastapi import Depends, HTTPException, Header, Query
 from pydantic import BaseModel
-from typing import Optional
-import os, jwt, time, logging
+from typing import Optional, Dict, Any
+from collections import OrderedDict
+import os, jwt, time, logging, hashlib, random, threading
 
 JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
 JWT_ALG = "HS256"
 DEV_AUTH = os.getenv("DEV_AUTH", "0") == "1"
 
+# Verified claims are cached by token digest until the token's exp (at most JWT_CACHE_MAX_TTL_SEC)
+JWT_CACHE_MAX_ITEMS = int(os.getenv("JWT_CACHE_MAX_ITEMS", "10000"))
+JWT_CACHE_MAX_TTL_SEC = float(os.getenv("JWT_CACHE_MAX_TTL_SEC", "300"))
+# Fraction of successful-authentication debug lines that are logged (failures and dev bypass always are)
+AUTH_LOG_SAMPLE = float(os.getenv("AUTH_LOG_SAMPLE", "0.01"))
+
+auth_log = logging.getLogger("auth")
+
 # Production safety: Ensure JWT secret is available in production mode
 if not DEV_AUTH and not JWT_SECRET:
     logging.error("PRODUCTION ERROR: SUPABASE_JWT_SECRET required when DEV_AUTH=0")
@@ -20,22 +29,55 @@ class TenantCtx(BaseModel):
     jwt: Optional[str] = None
     project_id: Optional[str] = None  # Added for project-scoped endpoints
 
+_claims_cache: "OrderedDict[bytes, tuple[float, Dict[str, Any]]]" = OrderedDict()
+_claims_lock = threading.Lock()
+_jwt_stats = {"hits": 0, "misses": 0, "rejected": 0}
+
+def _sampled() -> bool:
+    return AUTH_LOG_SAMPLE >= 1 or (AUTH_LOG_SAMPLE > 0 and random.random() < AUTH_LOG_SAMPLE)
+
+def verify_token(token: str) -> Dict[str, Any]:
+    """Verified claims for an HS256 token; raises jwt.InvalidTokenError (incl. expiry) like jwt.decode"""
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    now = time.time()
+    with _claims_lock:
+        hit = _claims_cache.get(digest)
+        if hit and hit[0] > now:
+            _claims_cache.move_to_end(digest)
+            _jwt_stats["hits"] += 1
+            return hit[1]
+    try:
+        claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG], options={"verify_aud": False})
+    except Exception:
+        with _claims_lock:
+            _jwt_stats["rejected"] += 1
+        raise
+    until = now + JWT_CACHE_MAX_TTL_SEC
+    if claims.get("exp"):
+        until = min(until, float(claims["exp"]))
+    with _claims_lock:
+        _jwt_stats["misses"] += 1
+        if JWT_CACHE_MAX_ITEMS > 0:
+            _claims_cache[digest] = (until, claims)
+            _claims_cache.move_to_end(digest)
+            while len(_claims_cache) > JWT_CACHE_MAX_ITEMS:
+                _claims_cache.popitem(last=False)
+    return claims
+
+def jwt_cache_stats() -> Dict[str, Any]:
+    with _claims_lock:
+        s = dict(_jwt_stats)
+        s["size"] = len(_claims_cache)
+    n = s["hits"] + s["misses"]
+    s["hit_rate"] = round(s["hits"] / n, 3) if n else None
+    return s
+
 def tenant_ctx(authorization: Optional[str] = Header(None),
                x_dev_user: Optional[str] = Header(None, alias="X-Dev-User"),
                x_dev_org: Optional[str] = Header(None, alias="X-Dev-Org"),
                x_dev_role: Optional[str] = Header(None, alias="X-Dev-Role")) -> TenantCtx:
     """Extract authenticated user context from JWT token or dev headers"""
     
-    # Enhanced security logging for all authentication attempts
-    import time
-    start_time = time.time()
-    
-    # Log dev mode usage with enhanced security context
-    if DEV_AUTH and x_dev_user:
-        logging.info(f"🔧 Dev mode active: {x_dev_user}@{x_dev_org} ({x_dev_role})")
-        # Security audit: Log dev mode authentication bypass
-        logging.warning(f"SECURITY: Development authentication bypass used by {x_dev_user}@{x_dev_org}")
-    
     # Dev bypass (ONLY when DEV_AUTH=1) with enhanced validation
     if DEV_AUTH:
         if not (x_dev_user and x_dev_org):
@@ -51,7 +93,8 @@ def tenant_ctx(authorization: Optional[str] = Header(None),
         safe_dev_roles = {"owner", "admin", "pm", "lead", "member", "guest"}
         dev_role = x_dev_role if x_dev_role in safe_dev_roles else "member"
         
-        logging.info("✅ Development authentication successful")
+        # Security audit: dev mode authentication bypass (never sampled)
+        auth_log.warning(f"SECURITY: Development authentication bypass used by {x_dev_user}@{x_dev_org} ({dev_role})")
         return TenantCtx(
             user_id=x_dev_user, 
             org_id=x_dev_org, 
@@ -71,8 +114,7 @@ def tenant_ctx(authorization: Optional[str] = Header(None),
         raise HTTPException(500, "Server authentication configuration error")
     
     try:
-        claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG], options={"verify_aud": False})
-        logging.info(f"✅ Production JWT validation successful for user {claims.get('sub', 'unknown')}")
+        claims = verify_token(token)
     except jwt.ExpiredSignatureError:
         logging.warning(f"SECURITY: Expired JWT token presented")
         raise HTTPException(401, "Token expired")
@@ -95,8 +137,25 @@ def tenant_ctx(authorization: Optional[str] = Header(None),
     if not org_id or not sub:
         raise HTTPException(403, "Missing org/user claims in token")
     
+    if auth_log.isEnabledFor(logging.DEBUG) and _sampled():
+        auth_log.debug("jwt ok", extra={"user_id": sub, "org_id": org_id, "role": role})
     return TenantCtx(user_id=sub, org_id=org_id, role=role, jwt=token)
 
+def project_role(org_id: str, project_id: str, user_id: str) -> Optional[str]:
+    """The user's project_members role (None if not a member); cached, see authz_cache"""
+    from .authz_cache import cached
+    def load():
+        from .db import get_conn
+        with get_conn() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT role FROM project_members 
+                WHERE org_id = %s AND project_id = %s AND user_id = %s
+                LIMIT 1
+            """, (org_id, project_id, user_id))
+            result = cur.fetchone()
+        return result[0] if result else None
+    return cached("project_role", org_id, project_id, user_id, load)
+
 def require_project_member(project_id: str, ctx: TenantCtx = Depends(tenant_ctx)) -> TenantCtx:
     """Verify user is a member of the specified project"""
     
@@ -107,21 +166,12 @@ def require_project_member(project_id: str, ctx: TenantCtx = Depends(tenant_ctx)
         return ctx
         
     try:
-        from .db import get_conn
+        role = project_role(ctx.org_id, project_id, ctx.user_id)
+        if not role:
+            raise HTTPException(403, "Not a member of this project")
         
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("""
-                SELECT role FROM project_members 
-                WHERE org_id = %s AND project_id = %s AND user_id = %s
-                LIMIT 1
-            """, (ctx.org_id, project_id, ctx.user_id))
-            
-            result = cur.fetchone()
-            if not result:
-                raise HTTPException(403, "Not a member of this project")
-            
-            # Update context with actual project role
-            ctx.role = result[0]
+        # Update context with actual project role
+        ctx.role = role
         
         return ctx
         
@@ -138,18 +188,9 @@ def require_project_admin(project_id: str, ctx: TenantCtx = Depends(tenant_ctx))
         return ctx
         
     try:
-        from .db import get_conn
-        
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("""
-                SELECT role FROM project_members 
-                WHERE org_id = %s AND project_id = %s AND user_id = %s
-                LIMIT 1
-            """, (ctx.org_id, project_id, ctx.user_id))
-            
-            result = cur.fetchone()
-            if not result or result[0] not in ["admin", "pm"]:
-                raise HTTPException(403, "Insufficient permissions - admin or pm role required")
+        role = project_role(ctx.org_id, project_id, ctx.user_id)
+        if role not in ["admin", "pm"]:
+            raise HTTPException(403, "Insufficient permissions - admin or pm role required")
         
         return ctx
         
@@ -166,18 +207,9 @@ def require_stage_signer(project_id: str, ctx: TenantCtx = Depends(tenant_ctx))
         return ctx
     
     try:
-        from .db import get_conn
-        
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("""
-                SELECT role FROM project_members 
-                WHERE org_id = %s AND project_id = %s AND user_id = %s
-                LIMIT 1
-            """, (ctx.org_id, project_id, ctx.user_id))
-            
-            result = cur.fetchone()
-            if not result or result[0] not in ["admin", "pm", "customer_signer"]:
-                raise HTTPException(403, "Insufficient permissions - signer role required")
+        role = project_role(ctx.org_id, project_id, ctx.user_id)
+        if role not in ["admin", "pm", "customer_signer"]:
+            raise HTTPException(403, "Insufficient permissions - signer role required")
         
         return ctx
         
@@ -0,0 +1,105 @@
+# /server/uploads.py
+"""
+Spooled uploads.
+
+Uploads (UploadFile bodies, Mailgun attachments, stored-URL downloads) are
+copied to a temp file in fixed-size chunks while the SHA-256 is computed and
+the MIME type is sniffed from the head, so at most one chunk is in memory.
+The same on-disk file is then streamed to storage and handed to parsing.
+"""
+import os
+import hashlib
+import tempfile
+from typing import Iterable, Optional
+
+import magic
+from fastapi import UploadFile
+
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024
+SNIFF_BYTES = 64 * 1024
+
+class UploadTooLarge(Exception):
+    pass
+
+class SpooledUpload:
+    """A spooled upload on disk: path, size, sha256 hex digest and sniffed MIME type"""
+
+    def __init__(self, path: str, size: int, sha256: str, mime: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.mime = mime
+
+    def open(self):
+        return open(self.path, "rb")
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+class _Spooler:
+    def __init__(self, suffix: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hash = hashlib.sha256()
+        self.head = b""
+        self.file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"File too large (max {self.max_bytes} bytes)")
+        if len(self.head) < SNIFF_BYTES:
+            self.head += chunk[:SNIFF_BYTES - len(self.head)]
+        self.hash.update(chunk)
+        self.file.write(chunk)
+
+    def finish(self) -> SpooledUpload:
+        self.file.close()
+        mime = magic.from_buffer(self.head, mime=True) if self.head else "application/x-empty"
+        return SpooledUpload(self.file.name, self.size, self.hash.hexdigest(), mime)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.unlink(self.file.name)
+        except OSError:
+            pass
+
+async def spool_upload(upload: UploadFile, suffix: str = "", max_bytes: int = UPLOAD_MAX_BYTES) -> SpooledUpload:
+    """Spool an UploadFile to disk chunk by chunk"""
+    spooler = _Spooler(suffix, max_bytes)
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            spooler.write(chunk)
+        return spooler.finish()
+    except BaseException:
+        spooler.abort()
+        raise
+
+def spool_iter(chunks: Iterable[bytes], suffix: str = "", max_bytes: int = UPLOAD_MAX_BYTES) -> SpooledUpload:
+    """Sync variant, e.g. for requests' iter_content()"""
+    spooler = _Spooler(suffix, max_bytes)
+    try:
+        for chunk in chunks:
+            if chunk:
+                spooler.write(chunk)
+        return spooler.finish()
+    except BaseException:
+        spooler.abort()
+        raise
+
+def upload_spooled(bucket, key: str, spooled: SpooledUpload, content_type: Optional[str] = None):
+    """Stream a spooled file to a storage bucket (storage3 sends file objects as a streamed multipart body)"""
+    with spooled.open() as f:
+        return bucket.upload(
+            path=key,
+            file=f,
+            file_options={"content-type": content_type or spooled.mime or "application/octet-stream"}
+        )
@@ -11,17 +11,14 @@ from .tenant import TenantCtx
 from .supabase_client import get_supabase_client
 import logging
 
-def get_user_visibility_areas(ctx: TenantCtx, project_id: str) -> tuple[bool, List[str]]:
-    """
-    Get user's visibility permissions for a project.
-    Returns (can_view_all, visibility_areas)
-    """
+def _load_visibility_areas(org_id: str, project_id: str, user_id: str) -> tuple[bool, List[str]]:
+    """(can_view_all, visibility_areas) from project_member_access; raises if neither Supabase nor the DB answers"""
     try:
         sb = get_supabase_client()
         result = sb.table("project_member_access").select("can_view_all, visibility_areas")\
-            .eq("org_id", ctx.org_id)\
+            .eq("org_id", org_id)\
             .eq("project_id", project_id)\
-            .eq("user_id", ctx.user_id)\
+            .eq("user_id", user_id)\
             .limit(1).execute()
         
         if result.data:
@@ -31,36 +28,45 @@ def get_user_visibility_areas(ctx: TenantCtx, project_id: str) -> tuple[bool, Li
             return can_view_all, visibility_areas
         else:
             # FAIL-CLOSED: No access record = no visibility access by default
-            logging.warning(f"No project access record found for user {ctx.user_id} in project {project_id}")
+            logging.warning(f"No project access record found for user {user_id} in project {project_id}")
             return False, []
             
     except Exception as e:
         logging.warning(f"Failed to get user visibility areas: {e}")
-        # Fallback: try direct database query for development
-        try:
-            from .db import get_conn
-            
-            with get_conn() as conn, conn.cursor() as cur:
-                cur.execute("""
-                    SELECT can_view_all, visibility_areas 
-                    FROM project_member_access 
-                    WHERE org_id = %s AND project_id = %s AND user_id = %s
-                    LIMIT 1
-                """, (ctx.org_id, project_id, ctx.user_id))
-                
-                result = cur.fetchone()
-                if result:
-                    return result[0] or False, result[1] or []
-                else:
-                    # FAIL-CLOSED: No access record in fallback DB query
-                    logging.warning(f"No project access record found in DB fallback for user {ctx.user_id} in project {project_id}")
-                    return False, []
-        except Exception as e2:
-            logging.error(f"Visibility check fallback failed: {e2}")
-            # FAIL-CLOSED: On all errors, only admin/owner get access
-            if ctx.role in {"owner", "admin"}:
-                return True, []
-            return False, []  # Default to NO ACCESS for security
+    # Fallback: try direct database query for development
+    from .db import get_conn
+    
+    with get_conn() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT can_view_all, visibility_areas 
+            FROM project_member_access 
+            WHERE org_id = %s AND project_id = %s AND user_id = %s
+            LIMIT 1
+        """, (org_id, project_id, user_id))
+        
+        result = cur.fetchone()
+        if result:
+            return result[0] or False, result[1] or []
+        else:
+            # FAIL-CLOSED: No access record in fallback DB query
+            logging.warning(f"No project access record found in DB fallback for user {user_id} in project {project_id}")
+            return False, []
+
+def get_user_visibility_areas(ctx: TenantCtx, project_id: str) -> tuple[bool, List[str]]:
+    """
+    Get user's visibility permissions for a project.
+    Returns (can_view_all, visibility_areas); cached per request and briefly across requests (authz_cache).
+    """
+    from .authz_cache import cached
+    try:
+        return cached("visibility", ctx.org_id, project_id, ctx.user_id,
+                      lambda: _load_visibility_areas(ctx.org_id, project_id, ctx.user_id))
+    except Exception as e2:
+        logging.error(f"Visibility check fallback failed: {e2}")
+        # FAIL-CLOSED: On all errors, only admin/owner get access
+        if ctx.role in {"owner", "admin"}:
+            return True, []
+        return False, []  # Default to NO ACCESS for security
 
 def filter_by_visibility_areas(items: List[Dict[str, Any]], can_view_all: bool, visibility_areas: List[str], area_field: str = "area") -> List[Dict[str, Any]]:
     """
@@ -1,5 +1,5 @@
 import { sql } from "drizzle-orm";
-import { pgTable, text, varchar, uuid, timestamp, jsonb, integer, boolean, vector as pgVector, numeric, uniqueIndex } from "drizzle-orm/pg-core";
+import { pgTable, text, varchar, uuid, timestamp, jsonb, integer, boolean, vector as pgVector, numeric, doublePrecision, uniqueIndex, index } from "drizzle-orm/pg-core";
 import { vector } from "../src/db/types/vector";
 import { createInsertSchema } from "drizzle-zod";
 import { z } from "zod";
@@ -89,10 +89,35 @@ export const artifactChunks = pgTable("artifact_chunks", {
   artifactId: uuid("artifact_id").notNull().references(() => artifacts.id),
   content: text("content").notNull(),
   chunkIndex: integer("chunk_index").notNull(),
+  page: integer("page"), // PDF page the chunk starts on (null for other formats)
   embedding: vector("embedding", 3072),
   createdAt: timestamp("created_at").defaultNow(),
 });
 
+// Content-addressed embedding cache: key = sha256(model + normalized text)
+export const embeddingCache = pgTable("embedding_cache", {
+  key: text("key").primaryKey(),
+  model: text("model").notNull(),
+  embedding: vector("embedding", 3072).notNull(),
+  hits: integer("hits").notNull().default(0),
+  createdAt: timestamp("created_at", { withTimezone: true }).defaultNow(),
+  lastUsedAt: timestamp("last_used_at", { withTimezone: true }).defaultNow(),
+}, (table) => ({
+  lastUsedIdx: index("embedding_cache_last_used_idx").on(table.lastUsedAt),
+}));
+
+// Per-window document extraction results: key = sha256(model + prompt + project + normalized window text)
+export const extractionCache = pgTable("extraction_cache", {
+  key: text("key").primaryKey(),
+  model: text("model").notNull(),
+  result: jsonb("result").notNull(),
+  hits: integer("hits").notNull().default(0),
+  createdAt: timestamp("created_at", { withTimezone: true }).defaultNow(),
+  lastUsedAt: timestamp("last_used_at", { withTimezone: true }).defaultNow(),
+}, (table) => ({
+  lastUsedIdx: index("extraction_cache_last_used_idx").on(table.lastUsedAt),
+}));
+
 // Summaries (auto-generated from documents)
 export const summaries = pgTable("summaries", {
   id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
@@ -404,6 +429,36 @@ export const reindexQueue = pgTable("reindex_queue", {
   updatedAt: timestamp("updated_at").defaultNow(),
 });
 
+// Durable ingestion jobs (server/ingest_queue.py): claimed with FOR UPDATE SKIP LOCKED
+export const ingestJobs = pgTable("ingest_jobs", {
+  id: uuid("id").primaryKey().default(sql`gen_random_uuid()`),
+  orgId: uuid("org_id").notNull().references(() => orgs.id),
+  projectId: uuid("project_id").notNull().references(() => projects.id),
+  artifactId: uuid("artifact_id").notNull().references(() => artifacts.id),
+  storagePath: text("storage_path").notNull(),
+  filename: text("filename"),
+  contentType: text("content_type"),
+  detectedType: text("detected_type"),
+  sha256: text("sha256"),
+  localPath: text("local_path"), // spooled upload, usable by a worker on local_host
+  localHost: text("local_host"),
+  status: text("status", { enum: ["pending", "running", "done", "failed"] }).notNull().default("pending"),
+  stage: text("stage", { enum: ["parse", "chunk", "embed", "extract", "apply", "classify"] }), // last completed stage
+  stageMs: jsonb("stage_ms"),
+  attempts: integer("attempts").notNull().default(0),
+  maxAttempts: integer("max_attempts").notNull().default(5),
+  lastError: text("last_error"),
+  runAfter: timestamp("run_after", { withTimezone: true }).notNull().defaultNow(),
+  lockedBy: text("locked_by"),
+  lockedAt: timestamp("locked_at", { withTimezone: true }),
+  createdAt: timestamp("created_at", { withTimezone: true }).defaultNow(),
+  updatedAt: timestamp("updated_at", { withTimezone: true }).defaultNow(),
+  finishedAt: timestamp("finished_at", { withTimezone: true }),
+}, (table) => ({
+  claimIdx: index("ingest_jobs_claim_idx").on(table.status, table.runAfter),
+  orgStatusIdx: index("ingest_jobs_org_status_idx").on(table.orgId, table.status),
+}));
+
 // Project member access controls (per member, per project)
 export const projectMemberAccess = pgTable("project_member_access", {
   orgId: uuid("org_id").notNull().references(() => orgs.id),
@@ -500,6 +555,16 @@ export const telemetryEvents = pgTable("telemetry_events", {
   createdAt: timestamp("created_at").notNull().default(sql`now()`),
 });
 
+// Shared token buckets for the Postgres rate limit backend (server/rate_limit.py)
+export const rateLimitBuckets = pgTable("rate_limit_buckets", {
+  key: text("key").primaryKey(), // 'u:<user>:<group>' | 't:<org>' | 'ip:<ip>:<endpoint>'
+  tokens: doublePrecision("tokens").notNull(),
+  capacity: integer("capacity").notNull(),
+  rate: doublePrecision("rate").notNull(), // tokens per second
+  allowed: boolean("allowed").notNull().default(true),
+  updatedAt: timestamp("updated_at", { withTimezone: true }).notNull().defaultNow(),
+});
+
 export const insertProjectStageSchema = createInsertSchema(projectStages).omit({
   id: true,
   createdAt: true,